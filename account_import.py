@@ -0,0 +1,123 @@
+import csv
+import json
+import re
+from itertools import islice
+
+from models import User
+from db import db
+from passwords import hash_passwords
+
+REQUIRED_FIELDS = ['lastName', 'firstName', 'username', 'password']
+
+
+def parse_roles(value):
+    # Возвращает (roles, error): строка через запятую/пробел или список строк.
+    if value is None:
+        return [], None
+    if isinstance(value, str):
+        return [role for role in re.split(r'[;,\s]+', value) if role], None
+    if isinstance(value, list) and all(isinstance(role, str) for role in value):
+        return value, None
+    return None, '{roles} must be a string or a list of strings'
+
+
+def parse_account_row(row):
+    # Возвращает (roles, error) для строки импорта.
+    if not all(row.get(key) for key in REQUIRED_FIELDS):
+        return None, 'Missing data'
+    for key in REQUIRED_FIELDS:
+        if not isinstance(row[key], str):
+            return None, f'{{{key}}} must be a string'
+    return parse_roles(row.get('roles'))
+
+
+def iter_rows(stream, fmt='ndjson'):
+    # Возвращает (номер строки, dict или None, ошибка) для текстового потока NDJSON или CSV.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for line, row in enumerate(reader, start=2):
+            yield line, row, None
+        return
+
+    for line, text in enumerate(stream, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            yield line, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line, None, 'Expected a JSON object'
+            continue
+        yield line, row, None
+
+
+def import_accounts(rows, batch_size=1000):
+    # Проверка существующих логинов, хеширование и INSERT выполняются
+    # пачками по batch_size строк; каждая пачка — одна транзакция.
+    report = {'created': 0, 'errors': []}
+    seen = set()
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        candidates = []
+        for line, row, error in batch:
+            roles = None
+            if error is None:
+                roles, error = parse_account_row(row)
+            if error is None and row['username'] in seen:
+                error = 'Duplicate username in input'
+            if error is not None:
+                report['errors'].append({'line': line, 'username': (row or {}).get('username'), 'error': error})
+                continue
+            seen.add(row['username'])
+            candidates.append((line, row, roles))
+
+        existing = {
+            username for (username,) in db.session.query(User.username).filter(
+                User.username.in_([row['username'] for _, row, _ in candidates])
+            )
+        } if candidates else set()
+
+        new_rows = []
+        for line, row, roles in candidates:
+            if row['username'] in existing:
+                report['errors'].append({'line': line, 'username': row['username'], 'error': 'User already exists'})
+            else:
+                new_rows.append((line, row, roles))
+
+        if not new_rows:
+            continue
+
+        hashes = hash_passwords(row['password'] for _, row, _ in new_rows)
+        values = []
+        for (_, row, roles), pwhash in zip(new_rows, hashes):
+            values.append({
+                'lastName': row['lastName'],
+                'firstName': row['firstName'],
+                'username': row['username'],
+                'password': pwhash,
+                'is_admin': 'admin' in roles,
+                'is_manager': 'manager' in roles,
+                'is_doctor': 'doctor' in roles
+            })
+
+        try:
+            db.session.execute(User.__table__.insert(), values)
+            db.session.commit()
+            report['created'] += len(values)
+        except Exception as e:
+            db.session.rollback()
+            report['errors'].extend(
+                {'line': line, 'username': row['username'], 'error': 'Database error', 'details': str(e)}
+                for line, row, _ in new_rows
+            )
+
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
@@ -1,30 +1,26 @@
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, create_refresh_token, get_jwt_identity
-from models import User, TokenBlackList, Doctor
-from db import db, init_app
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
-jwt = JWTManager(app)
-
-init_app(app)
-with app.app_context():
-    db.create_all()
-
-def check_token_blacklist(jwt_header, jwt_payload):
-    jti = jwt_payload['jti']
-    return TokenBlackList.query.filter_by(jti=jti, revoked=True).first() is not None
-
-
-@app.route('/api/Authentication/SignUp', methods=['POST'])
+from flask import Blueprint, request, jsonify
+import click
+import io
+import json
+from flask_jwt_extended import jwt_required, get_jwt, decode_token
+from models import User, Doctor
+from db import db
+import revocation
+from conditional import row_state, make_etag, not_modified, add_validators
+from pagination import paginate, paginate_ranked, page_args, InvalidCursor
+from doctor_search import search_doctors, MIN_QUERY_LENGTH
+from account_import import iter_rows, import_accounts
+from passwords import PasswordHashBusy
+from identity import current_identity, current_user_row, create_user_tokens, create_feed_token, bump_roles_version, FEED_SCOPE
+
+bp = Blueprint('accounts', __name__, cli_group=None)
+
+@bp.app_errorhandler(PasswordHashBusy)
+def password_hash_busy(error):
+    db.session.rollback()
+    return jsonify({'error': 'Too many password checks in progress, try again later'}), 503, {'Retry-After': '1'}
+
+@bp.route('/api/Authentication/SignUp', methods=['POST'])
 def register():
     data = request.get_json()
 
@@ -50,7 +46,7 @@ def register():
 
     return jsonify({'message': 'User created successfully'}), 201
 
-@app.route('/api/Authentication/SignIn', methods=['POST'])
+@bp.route('/api/Authentication/SignIn', methods=['POST'])
 def login():
     data = request.get_json()
 
@@ -59,25 +55,30 @@ def login():
 
     user = User.query.filter_by(username=data['username']).first()
 
-    if not user or not user.check_password(data['password']):
+    if not user or not user.is_active or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid username or password'}), 401
 
+    if user.password_needs_rehash():
+        try:
+            user.set_password(data['password'])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
 
-    access_token = create_access_token(identity=user.username)
-    return jsonify({'access_token': access_token}), 200
+    access_token, refresh_token = create_user_tokens(user)
+    return jsonify({'access_token': access_token, 'refresh_token': refresh_token}), 200
 
-@app.route('/api/Authentication/SignOut', methods=['PUT'])
+@bp.route('/api/Authentication/SignOut', methods=['PUT'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklisted_token = TokenBlackList(jti=jti)
-
-    db.session.add(blacklisted_token)
-    db.session.commit()
+    try:
+        revocation.store.revoke(get_jwt())
+    except Exception as e:
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'User logged out successfully'}), 200
 
-@app.route('/api/Authentication/Validate', methods=['GET'])
+@bp.route('/api/Authentication/Validate', methods=['GET'])
 @jwt_required()
 def validate_token():
     jwt_data = get_jwt()
@@ -86,25 +87,61 @@ def validate_token():
         'token_data': jwt_data
     }), 200
 
-@app.route('/api/Authentication/Refresh', methods=['POST'])
+@bp.route('/api/Authentication/Refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh_token():
-    current_user = get_jwt_identity()
-    new_access_token = create_access_token(identity=current_user)
-    new_refresh_token = create_refresh_token(identity=current_user)
+    user = current_user_row()
+
+    if not user or not user.is_active:
+        return jsonify({'error': 'User not found'}), 404
+
+    new_access_token, new_refresh_token = create_user_tokens(user)
 
     return jsonify({
         'access_token': new_access_token,
         'refresh_token': new_refresh_token
     }), 200
 
+@bp.route('/api/Authentication/FeedToken', methods=['POST'])
+@jwt_required()
+def issue_feed_token():
+    # Долгоживущий токен для ?jwt= в URL подписки календаря; годен только для .ics.
+    user = current_user_row()
+
+    if not user or not user.is_active:
+        return jsonify({'error': 'User not found'}), 404
+
+    return jsonify({'feed_token': create_feed_token(user)}), 201
 
-@app.route('/api/Accounts/Me', methods=['GET'])
+@bp.route('/api/Authentication/FeedToken', methods=['DELETE'])
 @jwt_required()
-def get_current_account():
-    current_username = get_jwt_identity()
+def revoke_feed_token():
+    data = request.get_json()
+
+    if not data or not isinstance(data.get('feed_token'), str):
+        return jsonify({'error': 'Missing data'}), 400
+
+    try:
+        payload = decode_token(data['feed_token'])
+    except Exception:
+        return jsonify({'error': 'Invalid feed token'}), 400
+
+    if payload.get('scope') != FEED_SCOPE or int(payload['sub']) != current_identity().id:
+        return jsonify({'error': 'Invalid feed token'}), 400
+
+    try:
+        revocation.store.revoke(payload)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
-    user = User.query.filter_by(username=current_username).first()
+    return jsonify({'message': 'Feed token revoked'}), 200
+
+
+@bp.route('/api/Accounts/Me', methods=['GET'])
+@jwt_required()
+def get_current_account():
+    user = current_user_row()
 
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -116,11 +153,10 @@ def get_current_account():
         'username': user.username
     }), 200
 
-@app.route('/api/Accounts/Update', methods=['PUT'])
+@bp.route('/api/Accounts/Update', methods=['PUT'])
 @jwt_required()
 def update_account():
-    current_username = get_jwt_identity()
-    user = User.query.filter_by(username=current_username).first()
+    user = current_user_row()
 
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -146,19 +182,21 @@ def update_account():
 
     return jsonify({'message': 'Account updated successfully'}), 200
 
-@app.route('/api/Accounts', methods=['GET'])
+@bp.route('/api/Accounts', methods=['GET'])
 @jwt_required()
 def get_all_accounts():
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or not current_user.is_admin:
+    if not current_identity().is_admin:
         return jsonify({'error': 'Access denied'}), 403
 
-    from_index = request.args.get('from', default=0, type=int)
-    count = request.args.get('count', default=10, type=int)
+    page_params, error = page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    after, from_index, count = page_params
 
-    users = User.query.offset(from_index).limit(count).all()
+    try:
+        users, next_cursor = paginate(User.query, [User.id], after, from_index, count)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
 
     users_data = [
         {
@@ -170,15 +208,15 @@ def get_all_accounts():
         } for user in users
     ]
 
-    return jsonify(users_data), 200
+    response = jsonify(users_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
-@app.route('/api/Accounts', methods=['POST'])
+@bp.route('/api/Accounts', methods=['POST'])
 @jwt_required()
 def create_account():
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or not current_user.is_admin:
+    if not current_identity().is_admin:
         return jsonify({'error': 'Access denied'}), 403
 
     data = request.get_json()
@@ -192,9 +230,9 @@ def create_account():
     new_user = User(
         lastName=data['lastName'],
         firstName=data['firstName'],
-        username=data['username'],
-        is_admin='admin' in data['roles']
+        username=data['username']
     )
+    new_user.set_roles(data['roles'])
     new_user.set_password(data['password'])
 
     try:
@@ -205,13 +243,24 @@ def create_account():
 
     return jsonify({'message': 'Account created successfully'}), 201
 
-@app.route('/api/Accounts/<int:id>', methods=['PUT'])
+@bp.route('/api/Accounts/Import', methods=['POST'])
 @jwt_required()
-def update_account_by_admin(id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
+def import_accounts_bulk():
+    if not current_identity().is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+
+    fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    batch_size = max(1, request.args.get('batchSize', default=1000, type=int))
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+
+    report = import_accounts(iter_rows(stream, fmt), batch_size=batch_size)
 
-    if not current_user or not current_user.is_admin:
+    return jsonify(report), 200
+
+@bp.route('/api/Accounts/<int:id>', methods=['PUT'])
+@jwt_required()
+def update_account_by_admin(id):
+    if not current_identity().is_admin:
         return jsonify({'error': 'Access denied'}), 403
 
     user = User.query.get(id)
@@ -223,6 +272,9 @@ def update_account_by_admin(id):
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
+    if 'roles' in data and not (isinstance(data['roles'], list) and all(isinstance(role, str) for role in data['roles'])):
+        return jsonify({'error': '{roles} must be a list of strings'}), 400
+
     if 'lastName' in data and data['lastName']:
         user.lastName = data['lastName']
 
@@ -238,8 +290,9 @@ def update_account_by_admin(id):
     if 'password' in data and data['password']:
         user.set_password(data['password'])
 
-    if 'roles' in data and isinstance(data['roles'], list):
-        user.is_admin = 'admin' in data['roles']
+    if 'roles' in data and set(data['roles']) | {'user'} != set(user.roles):
+        user.set_roles(data['roles'])
+        bump_roles_version(user)
 
     try:
         db.session.commit()
@@ -248,13 +301,10 @@ def update_account_by_admin(id):
 
     return jsonify({'message': 'Account updated successfully'}), 200
 
-@app.route('/api/Accounts/<int:id>', methods=['DELETE'])
+@bp.route('/api/Accounts/<int:id>', methods=['DELETE'])
 @jwt_required()
 def soft_delete_account(id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or not current_user.is_admin:
+    if not current_identity().is_admin:
         return jsonify({'error': 'Access denied'}), 403
 
     user = User.query.get(id)
@@ -265,6 +315,7 @@ def soft_delete_account(id):
         return jsonify({'error': 'User is already deleted'}), 400
 
     user.is_active = False
+    bump_roles_version(user)
 
     try:
         db.session.commit()
@@ -273,29 +324,62 @@ def soft_delete_account(id):
 
     return jsonify({'message': 'Account soft deleted successfully'}), 200
 
-@app.route('/api/Doctors', methods=['GET'])
+@bp.cli.command('import-accounts')
+@click.argument('path', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None)
+@click.option('--batch-size', type=click.IntRange(min=1), default=1000, show_default=True)
+def import_accounts_command(path, fmt, batch_size):
+    fmt = fmt or ('csv' if path.name.endswith('.csv') else 'ndjson')
+    report = import_accounts(iter_rows(path, fmt), batch_size=batch_size)
+
+    click.echo(f"Created {report['created']} accounts, {len(report['errors'])} errors")
+    for error in report['errors']:
+        click.echo(json.dumps(error, ensure_ascii=False), err=True)
+
+@bp.route('/api/Doctors', methods=['GET'])
 @jwt_required()
 def get_doctors():
     name_filter = request.args.get('nameFilter', '')
-    from_param = request.args.get('from', default=0, type=int)
-    count_param = request.args.get('count', default=10, type=int)
+    if name_filter and len(name_filter) < MIN_QUERY_LENGTH:
+        return jsonify({'error': f'nameFilter must be at least {MIN_QUERY_LENGTH} characters'}), 400
 
-    doctors_query = Doctor.query.filter(Doctor.fullName.ilike(f'%{name_filter}%'))
+    page_params, error = page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    after, from_param, count_param = page_params
 
-    doctors = doctors_query.offset(from_param).limit(count_param).all()
-
-    doctor_list = [{'id': doctor.id, 'fullName': doctor.fullName} for doctor in doctors]
+    try:
+        if name_filter:
+            doctors, next_cursor = paginate_ranked(
+                lambda offset, limit: search_doctors(name_filter, offset, limit), after, from_param, count_param
+            )
+        else:
+            doctors, next_cursor = paginate(Doctor.query, [Doctor.id], after, from_param, count_param)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    doctor_list = [
+        {'id': doctor.id, 'fullName': doctor.fullName, 'specialization': doctor.specialization}
+        for doctor in doctors
+    ]
 
-    return jsonify({'doctors': doctor_list}), 200
+    return jsonify({'doctors': doctor_list, 'next': next_cursor}), 200
 
-@app.route('/api/Doctors/<int:id>', methods=['GET'])
+@bp.route('/api/Doctors/<int:id>', methods=['GET'])
 @jwt_required()
 def get_doctor_by_id(id):
-    doctor = Doctor.query.get(id)
+    last_modified = row_state(Doctor, id)
 
-    if not doctor:
+    if last_modified is None:
         return jsonify({'error': 'Doctor not found'}), 404
 
+    etag = make_etag(last_modified)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+
+    doctor = db.session.get(Doctor, id)
+
     doctor_data = {
         'id': doctor.id,
         'fullName': doctor.fullName,
@@ -303,7 +387,4 @@ def get_doctor_by_id(id):
         'phone': doctor.phone
     }
 
-    return jsonify({'doctor': doctor_data}), 200
-
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    return add_validators(jsonify({'doctor': doctor_data}), etag, last_modified), 200
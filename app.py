@@ -0,0 +1,76 @@
+import threading
+
+import click
+from dotenv import load_dotenv
+from flask import Flask
+from flask.cli import with_appcontext
+from flask_jwt_extended import JWTManager
+import os
+
+from db import db, init_app
+import revocation
+import identity
+import day_views
+from hospital_directory import directory
+from history_storage import ensure_schema
+from schema import upgrade_schema
+import accounts
+import hospitals
+import timetables
+import documents
+
+load_dotenv()
+
+_docs_app = None
+_docs_lock = threading.Lock()
+
+
+def docs(filename=None):
+    # Swagger собирается при первом обращении к документации, а не при старте.
+    global _docs_app
+    if _docs_app is None:
+        with _docs_lock:
+            if _docs_app is None:
+                from swagger import create_docs_app
+                _docs_app = create_docs_app()
+    return _docs_app
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    # Схема создаётся и обновляется этим шагом при развёртывании, а не при старте воркеров.
+    db.create_all()
+    upgrade_schema()
+    ensure_schema()
+    click.echo('Database schema is up to date')
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['JWT_BLACKLIST_ENABLED'] = True
+    app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
+    if config:
+        app.config.update(config)
+    jwt = JWTManager(app)
+
+    init_app(app)
+    revocation.init_app(app, jwt)
+    identity.init_app(app, jwt)
+    day_views.init_app(app)
+    directory.init_app(app)
+
+    for module in (accounts, hospitals, timetables, documents):
+        app.register_blueprint(module.bp)
+
+    for rule in ('/docs', '/swagger.json', '/swaggerui/<path:filename>'):
+        app.add_url_rule(rule, 'docs', docs)
+    app.cli.add_command(init_db_command)
+    return app
+
+
+if __name__ == '__main__':
+    create_app().run(host='0.0.0.0', port=5000)
@@ -0,0 +1,114 @@
+import bisect
+from datetime import timedelta
+
+from sqlalchemy import tuple_
+
+from models import TimeTables, Appointment, Doctor
+from db import db
+
+SLOT = timedelta(minutes=30)
+# create_timetable_entry не допускает записей длиннее 12 часов, поэтому
+# пересечение с окном ищется диапазоном по from_time, а не перебором to_time.
+MAX_TIMETABLE_LENGTH = timedelta(hours=12)
+
+
+def slot_count(timetable):
+    return int((timetable.to_time - timetable.from_time) / SLOT)
+
+
+def booked_bitmaps(timetables):
+    # Один запрос на все расписания: бит i установлен, если занят i-й 30-минутный слот.
+    bitmaps = {timetable.id: 0 for timetable in timetables}
+    if not bitmaps:
+        return bitmaps
+
+    starts = {timetable.id: timetable.from_time for timetable in timetables}
+    rows = db.session.query(Appointment.timetable_id, Appointment.time).filter(
+        Appointment.timetable_id.in_(list(bitmaps))
+    )
+    for timetable_id, time in rows:
+        offset = time - starts[timetable_id]
+        if offset >= timedelta(0) and offset % SLOT == timedelta(0):
+            bitmaps[timetable_id] |= 1 << int(offset / SLOT)
+
+    return bitmaps
+
+
+def free_slots(timetables):
+    bitmaps = booked_bitmaps(timetables)
+    result = {}
+    for timetable in timetables:
+        slots = slot_count(timetable)
+        free = ~bitmaps[timetable.id] & ((1 << slots) - 1)
+        result[timetable.id] = [
+            timetable.from_time + index * SLOT for index in range(slots) if free >> index & 1
+        ]
+    return result
+
+
+def free_slots_for_ids(timetable_ids):
+    timetables = TimeTables.query.filter(TimeTables.id.in_(timetable_ids)).all()
+    return free_slots(timetables)
+
+
+def matching_specializations(value):
+    # Точное совпадение без учёта регистра. Сравнение в Python: lower() в
+    # SQLite не понимает кириллицу, а ILIKE принял бы % и _ за шаблон.
+    value = value.strip().casefold()
+    return [
+        specialization for (specialization,) in db.session.query(Doctor.specialization).distinct()
+        if specialization and specialization.strip().casefold() == value
+    ]
+
+
+def earliest_free_slots(window_from, window_to, limit=10, specialization=None, hospital_id=None, chunk_size=100):
+    # Расписания читаются порциями в порядке from_time; как только найдено
+    # limit слотов и следующее расписание начинается не раньше последнего
+    # из них, дальше искать незачем.
+    if limit < 1:
+        return []
+    query = TimeTables.query.filter(
+        TimeTables.from_time > window_from - MAX_TIMETABLE_LENGTH,
+        TimeTables.from_time < window_to,
+        TimeTables.to_time > window_from
+    )
+    if hospital_id is not None:
+        query = query.filter(TimeTables.hospitalId == hospital_id)
+    if specialization:
+        query = query.join(Doctor, Doctor.id == TimeTables.doctorId).filter(
+            Doctor.specialization.in_(matching_specializations(specialization))
+        )
+    query = query.order_by(TimeTables.from_time, TimeTables.id)
+
+    found = []
+    last = None
+    while True:
+        chunk_query = query
+        if last is not None:
+            chunk_query = chunk_query.filter(tuple_(TimeTables.from_time, TimeTables.id) > tuple_(*last))
+        chunk = chunk_query.limit(chunk_size).all()
+        if not chunk:
+            break
+        last = (chunk[-1].from_time, chunk[-1].id)
+
+        if len(found) >= limit and chunk[0].from_time >= found[-1][0]:
+            break
+
+        bitmaps = booked_bitmaps(chunk)
+        for timetable in chunk:
+            if len(found) >= limit and timetable.from_time >= found[-1][0]:
+                return [(time, timetable) for time, _, timetable in found]
+            first = max(0, -(-(window_from - timetable.from_time) // SLOT))
+            for index in range(first, slot_count(timetable)):
+                time = timetable.from_time + index * SLOT
+                if time >= window_to or (len(found) >= limit and time >= found[-1][0]):
+                    break
+                if bitmaps[timetable.id] >> index & 1:
+                    continue
+                bisect.insort(found, (time, timetable.id, timetable))
+                del found[limit:]
+
+        if len(chunk) < chunk_size:
+            break
+
+    return [(time, timetable) for time, _, timetable in found]
@@ -0,0 +1,518 @@
+import argparse
+import os
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+
+def bench_app(database_url=None):
+    # Отдельное приложение на временной SQLite, если не передан DATABASE_URL.
+    from db import db
+
+    app = Flask(__name__)
+    if not database_url:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def bench_passwords(args):
+    # Тот же путь, что и у SignIn: passwords.verify_password с ограничением
+    # PASSWORD_HASH_CONCURRENCY; --threads имитирует параллельные запросы воркера.
+    from passwords import hash_password, verify_password, PasswordHashBusy, PASSWORD_HASH_CONCURRENCY
+
+    def login(pwhash):
+        try:
+            return verify_password(pwhash, 'correct horse battery staple')
+        except PasswordHashBusy:
+            return None
+
+    # Хеши считают не больше min(потоков, PASSWORD_HASH_CONCURRENCY, ядер) ядер одновременно.
+    cores = min(args.threads, PASSWORD_HASH_CONCURRENCY, os.cpu_count() or 1)
+    print(f'{args.threads} request threads, PASSWORD_HASH_CONCURRENCY={PASSWORD_HASH_CONCURRENCY}, {cores} hashing cores')
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for method in args.methods:
+            pwhash = hash_password('correct horse battery staple', method=method)
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: login(pwhash), range(args.rounds)))
+            elapsed = time.perf_counter() - started
+            rejected = results.count(None)
+            logins = (args.rounds - rejected) / elapsed
+            print(f'{method:<28} {logins:10.1f} logins/s  {logins / cores:10.1f} logins/s per core  '
+                  f'{rejected / args.rounds:7.1%} rejected (503)')
+
+
+def bench_pagination(args):
+    from models import User
+    from db import db
+    from pagination import paginate, encode_cursor
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        if User.query.count() < args.rows:
+            db.session.execute(User.__table__.insert(), [
+                {'lastName': 'Bench', 'firstName': 'User', 'username': f'bench{i}', 'password': '-',
+                 'is_admin': False, 'is_manager': False, 'is_doctor': False, 'is_active': True, 'roles_version': 0}
+                for i in range(args.rows)
+            ])
+            db.session.commit()
+
+        print(f'{"page":>8} {"offset ms":>10} {"keyset ms":>10}')
+        for page in args.pages:
+            offset = (page - 1) * args.count
+            started = time.perf_counter()
+            paginate(User.query, [User.id], None, offset, args.count)
+            offset_ms = (time.perf_counter() - started) * 1000
+
+            # Курсор, который клиент получил бы вместе с предыдущей страницей.
+            cursor = None
+            if offset:
+                cursor = encode_cursor([db.session.query(User.id).order_by(User.id).offset(offset - 1).limit(1).scalar()])
+            started = time.perf_counter()
+            paginate(User.query, [User.id], cursor, 0, args.count)
+            keyset_ms = (time.perf_counter() - started) * 1000
+
+            print(f'{page:>8} {offset_ms:>10.2f} {keyset_ms:>10.2f}')
+
+
+def bench_doctor_search(args):
+    import random
+    from models import Doctor
+    from db import db
+    from doctor_search import index
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        first_names = ['Иван', 'Пётр', 'Анна', 'Мария', 'Ольга', 'Сергей', 'Дмитрий', 'Елена']
+        last_names = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Соколов', 'Лебедев']
+        specializations = ['Кардиолог', 'Терапевт', 'Хирург', 'Невролог', 'Офтальмолог', 'Педиатр']
+        if Doctor.query.count() < args.rows:
+            db.session.execute(Doctor.__table__.insert(), [
+                {'fullName': f'{random.choice(last_names)}{i} {random.choice(first_names)}',
+                 'specialization': random.choice(specializations)}
+                for i in range(args.rows)
+            ])
+            db.session.commit()
+
+        started = time.perf_counter()
+        index.build()
+        print(f'index build: {(time.perf_counter() - started) * 1000:.0f} ms for {args.rows} doctors')
+
+        for query in args.queries:
+            timings = []
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                index.search(query, 10)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f'{query:<16} p50 {timings[len(timings) // 2]:8.2f} ms  p99 {timings[int(len(timings) * 0.99)]:8.2f} ms')
+
+
+def bench_booking(args):
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import datetime
+    from sqlalchemy import func
+    from models import User, Doctor, Hospital, TimeTables, Appointment
+    from db import db
+    from availability import SLOT
+    from booking import book_slot, BookingError
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {'lastName': 'Bench', 'firstName': 'Patient', 'username': f'booking{i}-{time.time_ns()}', 'password': '-'}
+            for i in range(args.users)
+        ])
+        doctor = Doctor('Bench Doctor')
+        hospital = Hospital('Bench Hospital', '-', '-', '-', False)
+        db.session.add_all([doctor, hospital])
+        db.session.flush()
+        start = datetime(2030, 1, 1, 8, 0)
+        timetables = [
+            TimeTables(hospital.id, doctor.id, start + index * 12 * SLOT, start + (index + 1) * 12 * SLOT, 'Bench')
+            for index in range(args.timetables)
+        ]
+        db.session.add_all(timetables)
+        db.session.commit()
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id.desc()).limit(args.users)]
+        slots = [(timetable.id, timetable.from_time + index * SLOT) for timetable in timetables for index in range(12)]
+
+    def attempt(_):
+        timetable_id, slot_time = random.choice(slots)
+        with app.app_context():
+            try:
+                book_slot(timetable_id, random.choice(user_ids), slot_time)
+                return 'booked'
+            except BookingError:
+                return 'conflict'
+            except Exception:
+                db.session.rollback()
+                return 'error'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        outcomes = list(executor.map(attempt, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        timetable_ids = [timetable_id for timetable_id, _ in slots]
+        booked = db.session.query(func.count(Appointment.id)).filter(Appointment.timetable_id.in_(timetable_ids)).scalar()
+        distinct = db.session.query(Appointment.timetable_id, Appointment.time).filter(
+            Appointment.timetable_id.in_(timetable_ids)
+        ).distinct().count()
+
+    print(f'{args.requests} attempts on {len(slots)} hot slots with {args.workers} workers: '
+          f'{args.requests / elapsed:.0f} req/s')
+    print(f"booked {outcomes.count('booked')}, conflicts {outcomes.count('conflict')}, errors {outcomes.count('error')}")
+    print(f'appointments {booked}, distinct slots {distinct}, double bookings {booked - distinct}')
+
+
+def explain_timetables(args):
+    # Проверяет по плану запроса, что выборки расписаний идут по составным индексам.
+    import sys
+    from datetime import datetime
+    from sqlalchemy import text
+    from models import TimeTables
+    from db import db
+
+    app = bench_app(args.database_url)
+    window = (datetime(2030, 1, 1), datetime(2030, 12, 31))
+    checks = [
+        ('hospital', 'ix_timetables_hospital_from', [TimeTables.hospitalId == 1]),
+        ('doctor', 'ix_timetables_doctor_from', [TimeTables.doctorId == 1]),
+        ('room', 'ix_timetables_hospital_room_from', [TimeTables.hospitalId == 1, TimeTables.room == '101']),
+    ]
+
+    failed = False
+    with app.app_context():
+        db.create_all()
+        dialect = db.engine.dialect.name
+        with db.engine.connect() as connection:
+            if dialect == 'postgresql':
+                connection.execute(text('SET enable_seqscan = off'))
+            for name, index_name, conditions in checks:
+                query = TimeTables.query.filter(
+                    *conditions, TimeTables.from_time >= window[0], TimeTables.to_time <= window[1]
+                ).order_by(TimeTables.from_time, TimeTables.id)
+                sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+                plan = '\n'.join(' '.join(str(value) for value in row) for row in connection.execute(text(prefix + sql)))
+                used = index_name in plan
+                failed = failed or not used
+                print(f"{name:<10} {'OK  ' if used else 'FAIL'} {index_name}")
+                if args.verbose or not used:
+                    print('    ' + plan.replace('\n', '\n    '))
+
+    sys.exit(1 if failed else 0)
+
+
+def check_hospital_expand(args):
+    # Число запросов на страницу больниц с expand=rooms,timetableCount не должно
+    # зависеть от размера страницы (нет N+1 по кабинетам и расписаниям).
+    import sys
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    from models import Doctor, Hospital, Room, TimeTables
+    from db import db
+    from hospital_directory import HospitalDirectory, page, timetable_counts, hospital_to_dict
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        if Hospital.query.count() < args.hospitals:
+            db.session.execute(Hospital.__table__.insert(), [
+                {'name': f'Bench {i}', 'address': '-', 'contactPhone': '-', 'rooms_description': '-', 'is_deleted': False}
+                for i in range(args.hospitals)
+            ])
+            hospital_ids = [hospital_id for (hospital_id,) in db.session.query(Hospital.id)]
+            db.session.execute(Room.__table__.insert(), [
+                {'number': str(number), 'type': 'General', 'hospitalId': hospital_id}
+                for hospital_id in hospital_ids for number in range(3)
+            ])
+            doctor = Doctor('Bench Doctor')
+            db.session.add(doctor)
+            db.session.flush()
+            start = datetime(2030, 1, 1, 8, 0)
+            db.session.execute(TimeTables.__table__.insert(), [
+                {'hospitalId': hospital_id, 'doctorId': doctor.id, 'room': '0',
+                 'from_time': start + timedelta(days=day), 'to_time': start + timedelta(days=day, hours=1)}
+                for hospital_id in hospital_ids for day in range(2)
+            ])
+            db.session.commit()
+
+        directory = HospitalDirectory(check_interval=3600)
+        snapshot = directory.snapshot()
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *event_args: statements.append(event_args[2]))
+
+        counts_by_size = {}
+        for size in args.page_sizes:
+            statements.clear()
+            hospitals, _ = page(directory.snapshot(), None, 0, size)
+            counts = timetable_counts([hospital.id for hospital in hospitals])
+            body = [hospital_to_dict(hospital, {'rooms', 'timetableCount'}, counts) for hospital in hospitals]
+            counts_by_size[size] = len(statements)
+            print(f'page size {size:>5}: {len(body):>5} hospitals, {len(statements)} queries')
+            if args.verbose:
+                for statement in statements:
+                    print('    ' + ' '.join(statement.split()))
+
+    failed = len(set(counts_by_size.values())) != 1 or snapshot.version != directory.snapshot().version
+    print('FAIL' if failed else 'OK', 'query count is', 'not constant' if failed else 'constant')
+    sys.exit(1 if failed else 0)
+
+
+def bench_history_storage(args):
+    # Объём и задержки истории до и после переноса текста в сжатый payload.
+    import random
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    from models import User, Doctor, Hospital, History
+    from db import db
+    from history import history_query, with_data
+    from history_storage import migrate_history_payloads, storage_stats
+
+    phrases = [
+        'Жалобы на головную боль и слабость в течение трёх дней.',
+        'Артериальное давление 130/85, пульс 72 уд/мин, ритмичный.',
+        'Назначено: общий анализ крови, ЭКГ, консультация кардиолога.',
+        'Рекомендован приём ибупрофена 200 мг при болях, не более 3 раз в сутки.',
+        'Лёгкие: дыхание везикулярное, хрипов нет. Живот мягкий, безболезненный.',
+        'Повторный приём через две недели с результатами анализов.',
+    ]
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        if History.query.count() < args.rows:
+            patient = User(lastName='Bench', firstName='Patient', username=f'bench-history-{random.random()}', password='-')
+            doctor = Doctor('Bench Doctor')
+            hospital = Hospital('Bench', '-', '-')
+            db.session.add_all([patient, doctor, hospital])
+            db.session.flush()
+            # Старый формат: текст в data, payload пуст.
+            started = datetime(2020, 1, 1)
+            db.session.execute(History.__table__.insert(), [
+                {'date': started + timedelta(hours=i), 'pacient_id': patient.id, 'hospital_id': hospital.id,
+                 'doctor_id': doctor.id, 'room': '1',
+                 'data': ' '.join(random.choice(phrases) for _ in range(random.randint(2, args.max_phrases)))}
+                for i in range(args.rows)
+            ])
+            db.session.commit()
+        pacient_id = db.session.query(History.pacient_id).limit(1).scalar()
+        ids = [record_id for (record_id,) in db.session.query(History.id).limit(args.rounds)]
+
+        def database_bytes():
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(text('VACUUM FULL history').execution_options(isolation_level='AUTOCOMMIT'))
+                return db.session.execute(text("SELECT pg_total_relation_size('history')")).scalar()
+            db.session.execute(text('VACUUM'))
+            return db.session.execute(text('PRAGMA page_count')).scalar() * db.session.execute(text('PRAGMA page_size')).scalar()
+
+        def report(label):
+            stats = storage_stats()
+            db.session.commit()
+            size = database_bytes()
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                history_query([History.pacient_id == pacient_id]).order_by(History.date.desc()).limit(args.count).all()
+            list_ms = (time.perf_counter() - started) * 1000 / args.rounds
+            started = time.perf_counter()
+            for record_id in ids:
+                record = with_data(History.query.filter_by(id=record_id)).first()
+                record.data
+            detail_ms = (time.perf_counter() - started) * 1000 / max(len(ids), 1)
+            db.session.rollback()
+            print(f'{label:<8} {stats["rows"]:>8} rows  data {stats["legacyBytes"] / 1024:>10.1f} KiB  '
+                  f'payload {stats["payloadBytes"] / 1024:>10.1f} KiB  database {size / 1024:>10.1f} KiB  '
+                  f'list {list_ms:>6.2f} ms  detail {detail_ms:>6.2f} ms')
+
+        report('before')
+        started = time.perf_counter()
+        migrated = migrate_history_payloads(args.batch_size)
+        print(f'migrated {migrated} records in {time.perf_counter() - started:.1f} s')
+        report('after')
+
+
+def bench_history_export(args):
+    # Пиковая память выгрузки истории не должна зависеть от числа записей.
+    import gc
+    import tracemalloc
+    from datetime import datetime, timedelta
+    from models import User, Doctor, Hospital, History
+    from db import db
+    from history_export import export_records, export_chunks
+    from streaming import gzip_chunks
+
+    app = bench_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        existing = History.query.count()
+        if existing < max(args.sizes):
+            patient = User(lastName='Bench', firstName='Patient', username=f'bench-export-{existing}', password='-')
+            doctor = Doctor('Bench Doctor')
+            hospital = Hospital('Bench', '-', '-')
+            db.session.add_all([patient, doctor, hospital])
+            db.session.flush()
+            owner = (patient.id, hospital.id, doctor.id)
+            started = datetime(2020, 1, 1)
+            text = 'Жалобы на головную боль и слабость. Назначено обследование. ' * 10
+            for offset in range(existing, max(args.sizes), 10000):
+                db.session.add_all([
+                    History(started + timedelta(hours=i), *owner, '1', text)
+                    for i in range(offset, min(offset + 10000, max(args.sizes)))
+                ])
+                db.session.commit()
+                db.session.expunge_all()
+        ids = sorted(record_id for (record_id,) in db.session.query(History.id))
+
+        print(f'{"records":>10} {"format":>7} {"gzip":>5} {"output KiB":>11} {"peak KiB":>9} {"seconds":>8}')
+        for size in args.sizes:
+            for fmt in ('ndjson', 'csv'):
+                for compress in (False, True):
+                    chunks = export_chunks(export_records([History.id <= ids[size - 1]]), fmt)
+                    chunks = gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
+                    gc.collect()
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    written = sum(len(chunk) for chunk in chunks)
+                    elapsed = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    db.session.rollback()
+                    print(f'{size:>10} {fmt:>7} {"yes" if compress else "no":>5} {written / 1024:>11.1f} '
+                          f'{peak / 1024:>9.1f} {elapsed:>8.2f}')
+
+
+STARTUP_WORKER = """
+import sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+if sys.argv[2] == 'eager':
+    # Как до фабрики: flask_restx и проверки схемы при старте каждого воркера.
+    import swagger
+    from db import db
+    with app.app_context():
+        db.create_all()
+booted = time.perf_counter()
+client = app.test_client()
+client.post('/api/Authentication/SignIn', json={'username': '-', 'password': '-'})
+first = time.perf_counter()
+client.get('/swagger.json')
+docs = time.perf_counter()
+print(time.time(), booted - started, first - booted, docs - first)
+"""
+
+
+def bench_startup(args):
+    # Время от запуска процесса воркера до ответа на первый запрос.
+    import statistics
+    import subprocess
+    import sys
+    from app import create_app
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    result = create_app({'SQLALCHEMY_DATABASE_URI': database_url}).test_cli_runner().invoke(args=['init-db'])
+    if result.exit_code:
+        raise SystemExit(result.output)
+
+    print(f'{"mode":<6} {"boot ms":>9} {"1st req ms":>11} {"to 1st req ms":>14} {"1st docs ms":>12}')
+    for mode in ('lazy', 'eager'):
+        runs = []
+        for _ in range(args.workers):
+            spawned = time.time()
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_WORKER, database_url, mode],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            ).stdout.split()
+            finished, boot, first, docs = map(float, output[-4:])
+            runs.append((boot, first, finished - spawned - docs, docs))
+        boot, first, total, docs = (statistics.median(column) * 1000 for column in zip(*runs))
+        print(f'{mode:<6} {boot:>9.1f} {first:>11.1f} {total:>14.1f} {docs:>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the Volga-It API')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    passwords = subparsers.add_parser('passwords', help='Password hash cost vs. logins per second')
+    passwords.add_argument('--rounds', type=int, default=20)
+    passwords.add_argument('--threads', type=int, default=1)
+    passwords.add_argument('--methods', nargs='+', default=[
+        'pbkdf2:sha256:100000',
+        'pbkdf2:sha256:600000',
+        'scrypt:16384:8:1',
+        'scrypt:32768:8:1',
+    ])
+    passwords.set_defaults(func=bench_passwords)
+
+    pagination = subparsers.add_parser('pagination', help='OFFSET vs. keyset latency from page 1 to page 10,000')
+    pagination.add_argument('--database-url')
+    pagination.add_argument('--rows', type=int, default=200000)
+    pagination.add_argument('--count', type=int, default=20)
+    pagination.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    pagination.set_defaults(func=bench_pagination)
+
+    doctor_search = subparsers.add_parser('doctor-search', help='In-process n-gram doctor search latency')
+    doctor_search.add_argument('--database-url')
+    doctor_search.add_argument('--rows', type=int, default=100000)
+    doctor_search.add_argument('--rounds', type=int, default=200)
+    doctor_search.add_argument('--queries', nargs='+', default=['Иванов123', 'Кузнецов4', 'петр', 'кардиолог'])
+    doctor_search.set_defaults(func=bench_doctor_search)
+
+    booking = subparsers.add_parser('booking', help='Parallel bookings of hot slots; checks for double bookings')
+    booking.add_argument('--database-url')
+    booking.add_argument('--requests', type=int, default=5000)
+    booking.add_argument('--workers', type=int, default=32)
+    booking.add_argument('--timetables', type=int, default=4)
+    booking.add_argument('--users', type=int, default=200)
+    booking.set_defaults(func=bench_booking)
+
+    explain = subparsers.add_parser('explain-timetables', help='Fail unless timetable range queries use their indexes')
+    explain.add_argument('--database-url')
+    explain.add_argument('--verbose', action='store_true')
+    explain.set_defaults(func=explain_timetables)
+
+    hospital_expand = subparsers.add_parser('hospital-expand', help='Fail unless expanded hospital pages use a constant number of queries')
+    hospital_expand.add_argument('--database-url')
+    hospital_expand.add_argument('--hospitals', type=int, default=500)
+    hospital_expand.add_argument('--page-sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    hospital_expand.add_argument('--verbose', action='store_true')
+    hospital_expand.set_defaults(func=check_hospital_expand)
+
+    history_storage = subparsers.add_parser('history-storage', help='History table size and latency before and after payload compression')
+    history_storage.add_argument('--database-url')
+    history_storage.add_argument('--rows', type=int, default=50000)
+    history_storage.add_argument('--max-phrases', type=int, default=20)
+    history_storage.add_argument('--batch-size', type=int, default=1000)
+    history_storage.add_argument('--rounds', type=int, default=200)
+    history_storage.add_argument('--count', type=int, default=20)
+    history_storage.set_defaults(func=bench_history_storage)
+
+    history_export = subparsers.add_parser('history-export', help='Peak memory of streamed history exports by record count')
+    history_export.add_argument('--database-url')
+    history_export.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    history_export.set_defaults(func=bench_history_export)
+
+    startup = subparsers.add_parser('startup', help='Worker time-to-first-request with lazy docs vs. eager docs and schema checks')
+    startup.add_argument('--database-url')
+    startup.add_argument('--workers', type=int, default=10)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import TimeTables, Appointment
+from db import db
+from availability import SLOT
+
+
+SLOT_CONSTRAINT = 'uq_appointments_timetable_time'
+
+
+def is_slot_conflict(error):
+    # Занятый слот — только нарушение уникальности (timetable_id, time);
+    # остальные ошибки целостности (например, внешние ключи) — не 409.
+    message = str(error.orig)
+    return SLOT_CONSTRAINT in message or 'UNIQUE constraint failed: appointments.timetable_id, appointments.time' in message
+
+
+class BookingError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def book_slot(timetable_id, user_id, time):
+    # Сначала вставка, потом разбор конфликта: уникальный индекс
+    # (timetable_id, time) сам не даёт записать двоих на один слот.
+    # Расписание читается с FOR SHARE, чтобы его нельзя было сдвинуть или
+    # удалить до фиксации записи; параллельные бронирования друг друга не ждут.
+    timetable = TimeTables.query.filter_by(id=timetable_id).with_for_update(read=True).first()
+    if not timetable:
+        db.session.rollback()
+        raise BookingError(404, 'Timetable entry not found')
+
+    offset = time - timetable.from_time
+    if time < timetable.from_time or time >= timetable.to_time:
+        db.session.rollback()
+        raise BookingError(400, 'Appointment time is outside of the timetable entry')
+    if offset % SLOT != timedelta(0):
+        db.session.rollback()
+        raise BookingError(400, 'Appointment time must be on the 30-minute grid of the timetable entry')
+
+    appointment = Appointment(timetable_id=timetable_id, user_id=user_id, time=time)
+    db.session.add(appointment)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_slot_conflict(e):
+            raise BookingError(409, 'This appointment time is already booked')
+        raise
+
+    return appointment
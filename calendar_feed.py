@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+
+from flask import Response, stream_with_context
+from sqlalchemy import func, or_, select
+
+from models import TimeTables, Appointment, CalendarTombstone
+from db import db, SYNC_OVERLAP
+from availability import slot_count
+from pagination import encode_cursor, decode_cursor, InvalidCursor
+from streaming import STREAM_BATCH_SIZE
+from schedule import parse_time
+
+# Полная лента начинается за столько дней до текущего момента.
+FEED_PAST_DAYS = 30
+# Календарные клиенты могут не перезапрашивать ленту столько секунд.
+FEED_MAX_AGE = 60
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+TOMBSTONE_COLUMNS = ['timetable_id', 'hospitalId', 'doctorId', 'room', 'from_time', 'to_time']
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+def record_tombstones(condition):
+    # INSERT ... SELECT перед удалением записей расписания по условию, в той же транзакции.
+    db.session.execute(CalendarTombstone.__table__.insert().from_select(
+        TOMBSTONE_COLUMNS,
+        select(TimeTables.id, TimeTables.hospitalId, TimeTables.doctorId, TimeTables.room,
+               TimeTables.from_time, TimeTables.to_time).where(condition)
+    ))
+
+
+def record_tombstone(timetable):
+    db.session.add(CalendarTombstone(
+        timetable_id=timetable.id, hospitalId=timetable.hospitalId, doctorId=timetable.doctorId,
+        room=timetable.room, from_time=timetable.from_time, to_time=timetable.to_time
+    ))
+
+
+def prune_tombstones(now=None):
+    cutoff = (now or datetime.utcnow()) - TOMBSTONE_RETENTION
+    deleted = CalendarTombstone.query.filter(CalendarTombstone.deleted_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def encode_sync_token(now):
+    return encode_cursor([now - SYNC_OVERLAP])
+
+
+def parse_since(sync_token=None, since=None):
+    # Возвращает момент, после которого нужны изменения, или None для полной ленты.
+    if sync_token:
+        value = decode_cursor(sync_token, [TimeTables.updated_at])[0]
+    elif since:
+        try:
+            value = parse_time(since)
+        except ValueError:
+            raise InvalidCursor(since)
+    else:
+        return None
+
+    if value < datetime.utcnow() - TOMBSTONE_RETENTION:
+        raise SyncTokenExpired()
+    return value
+
+
+class Feed:
+    # Лента врача или кабинета. owner_criteria — условия на TimeTables,
+    # tombstone_criteria — те же условия на CalendarTombstone.
+
+    def __init__(self, name, owner_criteria, tombstone_criteria, since=None, now=None):
+        self.name = name
+        self.since = since
+        self.now = now or datetime.utcnow()
+        self.criteria = list(owner_criteria) + [TimeTables.to_time >= self.now - timedelta(days=FEED_PAST_DAYS)]
+        self.tombstone_criteria = list(tombstone_criteria)
+        if since is not None:
+            self.criteria.append(or_(
+                TimeTables.updated_at > since,
+                TimeTables.id.in_(select(Appointment.timetable_id).where(Appointment.created_at > since))
+            ))
+            # Запись, вернувшаяся к тому же врачу или в тот же кабинет, уже отдаётся как событие.
+            self.tombstone_criteria += [
+                CalendarTombstone.deleted_at > since,
+                CalendarTombstone.timetable_id.notin_(select(TimeTables.id).where(*owner_criteria))
+            ]
+
+    def state(self):
+        # Валидаторы ленты тремя агрегатами, без выборки самих строк.
+        timetables = db.session.query(func.count(TimeTables.id), func.max(TimeTables.updated_at)).filter(
+            *self.criteria
+        ).one()
+        appointments = db.session.query(func.count(Appointment.id), func.max(Appointment.created_at)).join(
+            TimeTables, Appointment.timetable_id == TimeTables.id
+        ).filter(*self.criteria).one()
+        tombstones = (0, None)
+        if self.since is not None:
+            tombstones = db.session.query(func.count(CalendarTombstone.id), func.max(CalendarTombstone.deleted_at)).filter(
+                *self.tombstone_criteria
+            ).one()
+        last_modified = max((value for value in (timetables[1], appointments[1], tombstones[1]) if value), default=None)
+        return (tuple(timetables), tuple(appointments), tuple(tombstones)), last_modified
+
+    def events(self):
+        timetables = TimeTables.query.filter(*self.criteria).order_by(TimeTables.id).yield_per(STREAM_BATCH_SIZE)
+        appointments = iter(db.session.query(Appointment.timetable_id, Appointment.time).join(
+            TimeTables, Appointment.timetable_id == TimeTables.id
+        ).filter(*self.criteria).order_by(Appointment.timetable_id, Appointment.time).yield_per(STREAM_BATCH_SIZE))
+
+        # Оба потока упорядочены по id расписания — слияние за один проход.
+        pending = next(appointments, None)
+        for timetable in timetables:
+            while pending is not None and pending[0] < timetable.id:
+                pending = next(appointments, None)
+            booked = []
+            while pending is not None and pending[0] == timetable.id:
+                booked.append(pending[1])
+                pending = next(appointments, None)
+            yield timetable_event(timetable, booked)
+
+        if self.since is not None:
+            tombstones = CalendarTombstone.query.filter(*self.tombstone_criteria).order_by(
+                CalendarTombstone.id
+            ).yield_per(STREAM_BATCH_SIZE)
+            for tombstone in tombstones:
+                yield cancelled_event(tombstone)
+
+    def response(self):
+        def generate():
+            yield lines([
+                'BEGIN:VCALENDAR',
+                'VERSION:2.0',
+                'PRODID:-//Volga-It//Timetable//RU',
+                'CALSCALE:GREGORIAN',
+                'METHOD:PUBLISH',
+                'X-WR-CALNAME:' + escape_text(self.name),
+            ])
+            for event in self.events():
+                yield event
+            yield lines(['END:VCALENDAR'])
+
+        response = Response(stream_with_context(generate()), mimetype='text/calendar')
+        response.headers['X-Sync-Token'] = encode_sync_token(self.now)
+        return response
+
+
+def format_time(value):
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def escape_text(value):
+    return str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    # RFC 5545: строки длиннее 75 октетов переносятся с пробелом в начале продолжения.
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts)
+
+
+def lines(values):
+    return ''.join(fold(value) + '\r\n' for value in values)
+
+
+def timetable_event(timetable, booked):
+    slots = slot_count(timetable)
+    description = f'Записей: {len(booked)} из {slots}'
+    if booked:
+        description += '\nЗанято: ' + ', '.join(time.strftime('%H:%M') for time in booked)
+    return lines([
+        'BEGIN:VEVENT',
+        f'UID:timetable-{timetable.id}@volga-it',
+        'DTSTAMP:' + format_time(timetable.updated_at),
+        'LAST-MODIFIED:' + format_time(timetable.updated_at),
+        'DTSTART:' + format_time(timetable.from_time),
+        'DTEND:' + format_time(timetable.to_time),
+        'SUMMARY:' + escape_text(f'Приём, кабинет {timetable.room}'),
+        'LOCATION:' + escape_text(f'Больница {timetable.hospitalId}, кабинет {timetable.room}'),
+        'DESCRIPTION:' + escape_text(description),
+        'STATUS:CONFIRMED',
+        'END:VEVENT',
+    ])
+
+
+def cancelled_event(tombstone):
+    return lines([
+        'BEGIN:VEVENT',
+        f'UID:timetable-{tombstone.timetable_id}@volga-it',
+        'DTSTAMP:' + format_time(tombstone.deleted_at),
+        'DTSTART:' + format_time(tombstone.from_time),
+        'DTEND:' + format_time(tombstone.to_time),
+        'STATUS:CANCELLED',
+        'END:VEVENT',
+    ])
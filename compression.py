@@ -0,0 +1,48 @@
+import os
+import zlib
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+# Первый байт значения — формат: несжатый UTF-8 или zlib.
+RAW = b'\x00'
+ZLIB = b'\x01'
+
+# Короткие тексты не сжимаются: выигрыш меньше накладных расходов zlib.
+COMPRESS_MIN_BYTES = int(os.getenv('HISTORY_COMPRESS_MIN_BYTES', 256))
+COMPRESS_LEVEL = int(os.getenv('HISTORY_COMPRESS_LEVEL', 6))
+
+
+def compress_text(text):
+    raw = text.encode('utf-8')
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            return ZLIB + packed
+    return RAW + raw
+
+
+def decompress_text(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    if value[:1] == ZLIB:
+        return zlib.decompress(value[1:]).decode('utf-8')
+    return value[1:].decode('utf-8')
+
+
+def history_text(payload, legacy):
+    # SQL-функция для триггеров SQLite: текст записи истории, где бы он ни лежал.
+    return decompress_text(payload) if payload is not None else legacy
+
+
+class CompressedText(TypeDecorator):
+    # В Python — str, в базе — сжатые байты (BLOB / BYTEA).
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
@@ -0,0 +1,53 @@
+from datetime import timezone
+from hashlib import sha1
+
+from flask import request, make_response
+from sqlalchemy import func
+from werkzeug.http import http_date, quote_etag
+
+from db import db
+
+
+def collection_state(model, *criteria):
+    # Число строк и последнее изменение одним агрегатом: удаление меняет
+    # число, вставка и UPDATE — max(updated_at).
+    return db.session.query(func.count(model.id), func.max(model.updated_at)).filter(*criteria).one()
+
+
+def row_state(model, id):
+    # None — строки нет.
+    return db.session.query(model.updated_at).filter(model.id == id).scalar()
+
+
+def make_etag(*parts):
+    # Строка запроса входит в ETag: разные страницы и окна — разные представления.
+    return sha1(repr((request.full_path,) + parts).encode()).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    # If-Modified-Since проверяется только для одиночных ресурсов (передан
+    # last_modified): у коллекций после удаления строки max(updated_at) может
+    # уменьшиться, так что для них надёжен только ETag.
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since:
+        matched = last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    return add_validators(make_response('', 304), etag, last_modified)
+
+
+def validator_headers(etag, last_modified=None):
+    # Клиент может хранить ответ, но обязан перепроверять его перед использованием.
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def add_validators(response, etag, last_modified=None):
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import TimeTables, Appointment
+from db import db
+from availability import slot_count
+
+KINDS = {'hospital': TimeTables.hospitalId, 'doctor': TimeTables.doctorId}
+
+
+def view_keys(entry):
+    day = entry['from_time'].date()
+    return [('hospital', entry['hospitalId'], day), ('doctor', entry['doctorId'], day)]
+
+
+def entry_snapshot(timetable):
+    return {
+        'id': timetable.id,
+        'hospitalId': timetable.hospitalId,
+        'doctorId': timetable.doctorId,
+        'from_time': timetable.from_time,
+        'to_time': timetable.to_time,
+        'room': timetable.room,
+        'updated_at': timetable.updated_at,
+        'slots': slot_count(timetable),
+        'booked': 0
+    }
+
+
+class DayViewCache:
+    # Готовые представления расписания на день по больнице и по врачу:
+    # записи расписания и число занятых и свободных слотов. Обработчики
+    # записи обновляют их точечно; ttl ограничивает устаревание из-за
+    # изменений, сделанных другими воркерами.
+
+    def __init__(self, ttl=30.0, max_views=10000):
+        self.ttl = ttl
+        self.max_views = max_views
+        self._views = OrderedDict()
+        self._by_timetable = defaultdict(set)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+
+    def get(self, kind, owner_id, day):
+        key = (kind, owner_id, day)
+        now = time.monotonic()
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None and now - view['built_at'] < self.ttl:
+                self._views.move_to_end(key)
+                self.hits += 1
+                age = now - view['built_at']
+                self._served_age_total += age
+                self._served_age_max = max(self._served_age_max, age)
+                return sorted(view['entries'].values(), key=lambda entry: (entry['from_time'], entry['id']))
+
+        entries = self._build(kind, owner_id, day)
+        with self._lock:
+            self.misses += 1
+            self._store(key, {'built_at': time.monotonic(), 'entries': {entry['id']: entry for entry in entries}})
+        return [dict(entry) for entry in entries]
+
+    def invalidate(self, kind, owner_id, day):
+        with self._lock:
+            self._drop((kind, owner_id, day))
+
+    def _build(self, kind, owner_id, day):
+        start = datetime.combine(day, datetime.min.time())
+        timetables = TimeTables.query.filter(
+            KINDS[kind] == owner_id,
+            TimeTables.from_time >= start,
+            TimeTables.from_time < start + timedelta(days=1)
+        ).order_by(TimeTables.from_time, TimeTables.id).all()
+
+        entries = [entry_snapshot(timetable) for timetable in timetables]
+        if entries:
+            booked = dict(db.session.query(Appointment.timetable_id, func.count(Appointment.id)).filter(
+                Appointment.timetable_id.in_([entry['id'] for entry in entries])
+            ).group_by(Appointment.timetable_id).all())
+            for entry in entries:
+                entry['booked'] = booked.get(entry['id'], 0)
+        return entries
+
+    def _store(self, key, view):
+        self._drop(key)
+        self._views[key] = view
+        for timetable_id in view['entries']:
+            self._by_timetable[timetable_id].add(key)
+        while len(self._views) > self.max_views:
+            self._drop(next(iter(self._views)))
+
+    def _drop(self, key):
+        view = self._views.pop(key, None)
+        if view is None:
+            return
+        for timetable_id in view['entries']:
+            keys = self._by_timetable.get(timetable_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_timetable[timetable_id]
+
+    def timetable_saved(self, timetable):
+        # Создание или изменение одной записи: убрать старую версию из всех
+        # представлений и добавить новую в уже построенные.
+        entry = entry_snapshot(timetable)
+        with self._lock:
+            booked = self._remove_entry(timetable.id)
+            entry['booked'] = booked or 0
+            for key in view_keys(entry):
+                view = self._views.get(key)
+                if view is not None:
+                    view['entries'][entry['id']] = dict(entry)
+                    self._by_timetable[entry['id']].add(key)
+
+    def timetable_deleted(self, timetable_id):
+        with self._lock:
+            self._remove_entry(timetable_id)
+
+    def _remove_entry(self, timetable_id):
+        booked = None
+        for key in self._by_timetable.pop(timetable_id, set()):
+            view = self._views.get(key)
+            if view is not None:
+                entry = view['entries'].pop(timetable_id, None)
+                if entry is not None:
+                    booked = entry['booked']
+        return booked
+
+    def appointment_changed(self, timetable_id, delta):
+        with self._lock:
+            for key in self._by_timetable.get(timetable_id, ()):
+                entry = self._views[key]['entries'].get(timetable_id)
+                if entry is not None:
+                    entry['booked'] = max(0, entry['booked'] + delta)
+
+    def entries_inserted(self, entries):
+        # Пакетная вставка не возвращает id, поэтому затронутые представления сбрасываются.
+        with self._lock:
+            for key in {key for entry in entries for key in view_keys(entry)}:
+                self._drop(key)
+
+    def owner_cleared(self, kind, owner_id):
+        # Удаление всего расписания врача или больницы.
+        with self._lock:
+            for key, view in list(self._views.items()):
+                if key[0] == kind and key[1] == owner_id:
+                    self._drop(key)
+                    continue
+                for timetable_id, entry in list(view['entries'].items()):
+                    if entry[f'{kind}Id'] == owner_id:
+                        del view['entries'][timetable_id]
+                        keys = self._by_timetable.get(timetable_id)
+                        if keys is not None:
+                            keys.discard(key)
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            requests = self.hits + self.misses
+            ages = [now - view['built_at'] for view in self._views.values()]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / requests if requests else 0.0,
+                'views': len(self._views),
+                'ttlSeconds': self.ttl,
+                'maxViewAgeSeconds': max(ages) if ages else 0.0,
+                'avgServedAgeSeconds': self._served_age_total / self.hits if self.hits else 0.0,
+                'maxServedAgeSeconds': self._served_age_max
+            }
+
+
+cache = DayViewCache()
+
+
+def entries_state(entries):
+    # То же, что conditional.collection_state, но по записям представления.
+    return len(entries), max((entry['updated_at'] for entry in entries), default=None)
+
+
+def entry_to_dict(entry):
+    # Тот же формат, что и TimeTables.to_dict().
+    return {
+        'id': entry['id'],
+        'hospitalId': entry['hospitalId'],
+        'doctorId': entry['doctorId'],
+        'from': entry['from_time'].isoformat() + 'Z',
+        'to': entry['to_time'].isoformat() + 'Z',
+        'room': entry['room']
+    }
+
+
+def serialize_entry(entry):
+    result = entry_to_dict(entry)
+    result.update(slots=entry['slots'], booked=entry['booked'], free=entry['slots'] - entry['booked'])
+    return result
+
+
+def init_app(app):
+    cache.ttl = app.config.get('DAY_VIEW_TTL_SECONDS', cache.ttl)
+    cache.max_views = app.config.get('DAY_VIEW_MAX_VIEWS', cache.max_views)
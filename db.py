@@ -1,11 +1,32 @@
+from datetime import timedelta
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
 import os
 
+from compression import history_text
+
 load_dotenv()
 db = SQLAlchemy()
 
+# Инкрементальные синхронизации кэшей читают изменения с отступом назад:
+# строки транзакций, зафиксированных позже, чем их метка времени или
+# номер версии, попадут в следующую синхронизацию.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite (локальный запуск) без этой настройки игнорирует ON DELETE CASCADE.
+    if type(dbapi_connection).__module__ == 'sqlite3':
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+        # Триггеры полнотекстового индекса истории читают сжатый текст через эту функцию.
+        dbapi_connection.create_function('history_text', 2, history_text, deterministic=True)
+
 def init_app(app):
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.getenv('DATABASE_URL'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
\ No newline at end of file
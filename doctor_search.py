@@ -0,0 +1,202 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+
+from models import Doctor
+from db import db, SYNC_OVERLAP
+
+# Короче трёх символов у запроса нет триграмм, и поиск свёлся бы к перебору всех врачей.
+MIN_QUERY_LENGTH = 3
+
+
+def ngrams(text, n=3):
+    text = f'  {text.lower()} '
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def match_score(query, name):
+    # Чем меньше, тем лучше: точное совпадение, начало ФИО, начало слова,
+    # подстрока в ФИО. Совпадение только по специализации получает 4.
+    if name == query:
+        return 0
+    if name.startswith(query):
+        return 1
+    if f' {query}' in name:
+        return 2
+    if query in name:
+        return 3
+    return None
+
+
+class NgramIndex:
+    # Переносимый вариант для SQLite и локального запуска: триграммы ФИО ->
+    # множества id врачей, плюс id по каждой специализации, заранее
+    # упорядоченные по длине ФИО. Свои изменения применяются по событиям ORM
+    # после коммита; изменения других воркеров и Core-запросов — раз в
+    # check_interval секунд по updated_at (удаления — по числу строк).
+    # Полностью строится при первом поиске и когда пропали строки.
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._doctors = {}
+        self._postings = defaultdict(set)
+        self._specializations = defaultdict(list)
+        self._ready = False
+        self._watermark = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, doctor_id, full_name, specialization):
+        name = full_name.lower()
+        specialization = (specialization or '').lower()
+        self._doctors[doctor_id] = (name, specialization)
+        for gram in ngrams(name):
+            self._postings[gram].add(doctor_id)
+        if specialization:
+            bisect.insort(self._specializations[specialization], (len(name), doctor_id))
+
+    def _remove(self, doctor_id):
+        if doctor_id not in self._doctors:
+            return
+        name, specialization = self._doctors.pop(doctor_id)
+        for gram in ngrams(name):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(doctor_id)
+                if not postings:
+                    del self._postings[gram]
+        if specialization:
+            entries = self._specializations[specialization]
+            entries.remove((len(name), doctor_id))
+            if not entries:
+                del self._specializations[specialization]
+
+    def build(self):
+        with self._lock:
+            self._doctors.clear()
+            self._postings.clear()
+            self._specializations.clear()
+            self._watermark = db.session.query(func.max(Doctor.updated_at)).scalar()
+            for doctor_id, full_name, specialization in db.session.query(
+                Doctor.id, Doctor.fullName, Doctor.specialization
+            ).yield_per(10000):
+                self._add(doctor_id, full_name, specialization)
+            self._ready = True
+            self._next_check = time.monotonic() + self.check_interval
+
+    def refresh(self):
+        count, latest = db.session.query(func.count(Doctor.id), func.max(Doctor.updated_at)).one()
+        changed = []
+        if self._watermark is not None:
+            changed = db.session.query(Doctor.id, Doctor.fullName, Doctor.specialization).filter(
+                Doctor.updated_at > self._watermark - SYNC_OVERLAP
+            ).all()
+        with self._lock:
+            for doctor_id, full_name, specialization in changed:
+                self._remove(doctor_id)
+                self._add(doctor_id, full_name, specialization)
+            rebuild = len(self._doctors) != count
+            if latest is not None and (self._watermark is None or latest > self._watermark):
+                self._watermark = latest
+            self._next_check = time.monotonic() + self.check_interval
+        if rebuild:
+            self.build()
+
+    def apply(self, upserts, deletes):
+        if not self._ready:
+            return
+        with self._lock:
+            for doctor_id in deletes:
+                self._remove(doctor_id)
+            for doctor_id, full_name, specialization in upserts:
+                self._remove(doctor_id)
+                self._add(doctor_id, full_name, specialization)
+
+    def search(self, query, limit):
+        if not self._ready:
+            self.build()
+        elif time.monotonic() >= self._next_check:
+            self.refresh()
+
+        query = query.lower()
+        with self._lock:
+            grams = [self._postings.get(gram, set()) for gram in ngrams(query)
+                     if not gram.startswith(' ') and not gram.endswith(' ')]
+            if grams:
+                grams.sort(key=len)
+                candidates = set.intersection(*grams)
+            else:
+                candidates = self._doctors.keys()
+
+            ranked = []
+            for doctor_id in candidates:
+                name = self._doctors[doctor_id][0]
+                score = match_score(query, name)
+                if score is not None:
+                    ranked.append((score, len(name), doctor_id))
+            ranked = heapq.nsmallest(limit, ranked)
+
+            if len(ranked) < limit:
+                matched = {doctor_id for _, _, doctor_id in ranked}
+                by_specialization = heapq.merge(*[
+                    entries for specialization, entries in self._specializations.items() if query in specialization
+                ])
+                for length, doctor_id in by_specialization:
+                    if len(ranked) >= limit:
+                        break
+                    if doctor_id not in matched:
+                        ranked.append((4, length, doctor_id))
+
+        return [doctor_id for _, _, doctor_id in ranked]
+
+
+index = NgramIndex()
+
+
+@event.listens_for(Session, 'after_flush', propagate=True)
+def _collect_doctor_changes(session, flush_context):
+    changes = session.info.setdefault('doctor_changes', ([], []))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Doctor):
+            changes[0].append((obj.id, obj.fullName, obj.specialization))
+    for obj in session.deleted:
+        if isinstance(obj, Doctor):
+            changes[1].append(obj.id)
+
+
+@event.listens_for(Session, 'after_commit', propagate=True)
+def _apply_doctor_changes(session):
+    upserts, deletes = session.info.pop('doctor_changes', ([], []))
+    if upserts or deletes:
+        index.apply(upserts, deletes)
+
+
+@event.listens_for(Session, 'after_rollback', propagate=True)
+def _drop_doctor_changes(session):
+    session.info.pop('doctor_changes', None)
+
+
+def search_doctors(query, offset=0, count=10):
+    # Возвращает страницу врачей, упорядоченную по качеству совпадения.
+    if db.engine.dialect.name == 'postgresql':
+        pattern = '%' + escape_like(query) + '%'
+        score = func.greatest(
+            func.word_similarity(query, Doctor.fullName),
+            func.coalesce(func.word_similarity(query, Doctor.specialization), 0)
+        )
+        return Doctor.query.filter(
+            or_(Doctor.fullName.ilike(pattern, escape='\\'), Doctor.specialization.ilike(pattern, escape='\\'))
+        ).order_by(score.desc(), Doctor.id).offset(offset).limit(count).all()
+
+    ids = index.search(query, offset + count)[offset:]
+    doctors = {doctor.id: doctor for doctor in Doctor.query.filter(Doctor.id.in_(ids))} if ids else {}
+    return [doctors[doctor_id] for doctor_id in ids if doctor_id in doctors]
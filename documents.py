@@ -1,52 +1,138 @@
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import click
+import gzip
+import io
+from flask_jwt_extended import jwt_required
 from models import History
-from db import db, init_app
-from dotenv import load_dotenv
-import os
-from datetime import datetime
+from db import db
+from pagination import paginate, paginate_ranked, page_args, InvalidCursor
+from history_search import search_history, rebuild_index
+from history_storage import MIGRATE_BATCH_SIZE, migrate_history_payloads
+from history_ingest import INGEST_BATCH_SIZE, ingest_history
+from account_import import iter_rows
+from history_export import EXPORT_FORMATS, ExportProgress, export_records, export_chunks
+from streaming import STREAM_BATCH_SIZE, accepts_gzip, gzip_chunks
+from history import HISTORY_KEYS, parse_history_filters, include_data_requested, history_query, history_to_dict, with_data
+from identity import current_identity
+from schedule import parse_time
 
-load_dotenv()
+bp = Blueprint('documents', __name__, cli_group=None)
 
-app = Flask(__name__)
+def restrict_to_owner(current_user, criteria):
+    # Пациент видит только свою историю, врач — любую.
+    pacient_id = request.args.get('pacientId', type=int)
+    if 'doctor' not in current_user.roles:
+        if pacient_id is not None and pacient_id != current_user.id:
+            return jsonify({'error': 'Access forbidden: Only doctors or the account owner can access this history'}), 403
+        pacient_id = current_user.id
+    if pacient_id is not None:
+        criteria.append(History.pacient_id == pacient_id)
+    return None
 
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
-jwt = JWTManager(app)
-
-init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/api/History/Account/<int:id>', methods=['GET'])
+@bp.route('/api/History/Account/<int:id>', methods=['GET'])
 @jwt_required()
 def get_account_history(id):
-    current_user = get_jwt_identity()
-    if 'doctor' not in current_user['roles'] and current_user['id'] != id:
+    current_user = current_identity()
+    if 'doctor' not in current_user.roles and current_user.id != id:
         return jsonify({'error': 'Access forbidden: Only doctors or the account owner can access this history'}), 403
 
-    history_records = History.query.filter_by(pacient_id=id).all()
-    return jsonify([{
-        'id': record.id,
-        'date': record.date.isoformat(),
-        'hospitalId': record.hospital_id,
-        'doctorId': record.doctor_id,
-        'room': record.room,
-        'data': record.data
-    } for record in history_records]), 200
-
-@app.route('/api/History/<int:id>', methods=['GET'])
+    criteria, error = parse_history_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    include_data = include_data_requested(request.args)
+    page_params, error = page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    after, from_index, count = page_params
+
+    # Новые записи первыми, по индексу (pacient_id, date, id).
+    try:
+        history_records, next_cursor = paginate(
+            history_query([History.pacient_id == id] + criteria, include_data),
+            HISTORY_KEYS, after, from_index, count, descending=True
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    response = jsonify([history_to_dict(record, include_data) for record in history_records])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+@bp.route('/api/History/Search', methods=['GET'])
+@jwt_required()
+def search_history_records():
+    current_user = current_identity()
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query {q}'}), 400
+
+    criteria, error = parse_history_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    forbidden = restrict_to_owner(current_user, criteria)
+    if forbidden:
+        return forbidden
+
+    page_params, error = page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    after, from_index, count = page_params
+
+    try:
+        results, next_cursor = paginate_ranked(
+            lambda offset, limit: search_history(query, criteria, offset, limit), after, from_index, count
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    response = jsonify([
+        dict(history_to_dict(record), snippet=snippet, rank=rank) for record, snippet, rank in results
+    ])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+@bp.route('/api/History/Export', methods=['GET'])
+@jwt_required()
+def export_history():
+    current_user = current_identity()
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Unsupported format. Use ndjson or csv.'}), 400
+
+    criteria, error = parse_history_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    forbidden = restrict_to_owner(current_user, criteria)
+    if forbidden:
+        return forbidden
+
+    # Оборванную выгрузку продолжают с afterId = id последней полученной записи.
+    after_id = request.args.get('afterId', type=int)
+    chunks = export_chunks(export_records(criteria, after_id), fmt, header=after_id is None)
+
+    headers = {'Content-Disposition': f'attachment; filename=history.{fmt}', 'Vary': 'Accept-Encoding'}
+    if accepts_gzip():
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@bp.route('/api/History/<int:id>', methods=['GET'])
 @jwt_required()
 def get_history_detail(id):
-    current_user = get_jwt_identity()
-    history_record = History.query.get(id)
+    current_user = current_identity()
+    history_record = with_data(History.query.filter_by(id=id)).first()
 
     if not history_record:
         return jsonify({'error': 'History record not found'}), 404
 
-    if 'doctor' not in current_user['roles'] and current_user['id'] != history_record.pacient_id:
+    if 'doctor' not in current_user.roles and current_user.id != history_record.pacient_id:
         return jsonify({'error': 'Access forbidden: Only doctors or the account owner can access this history'}), 403
 
     return jsonify({
@@ -59,12 +145,12 @@ def get_history_detail(id):
         'data': history_record.data
     }), 200
 
-@app.route('/api/History', methods=['POST'])
+@bp.route('/api/History', methods=['POST'])
 @jwt_required()
 def create_history():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
-    if 'admin' not in current_user['roles'] and 'manager' not in current_user['roles'] and 'doctor' not in current_user['roles']:
+    if 'admin' not in current_user.roles and 'manager' not in current_user.roles and 'doctor' not in current_user.roles:
         return jsonify({'error': 'Access forbidden: Only admins, managers, or doctors can create history records'}), 403
 
     data = request.get_json()
@@ -73,8 +159,8 @@ def create_history():
         return jsonify({'error': 'Missing data'}), 400
 
     try:
-        date = datetime.fromisoformat(data['date'].replace('Z', '+00:00'))
-    except ValueError:
+        date = parse_time(data['date'])
+    except (AttributeError, ValueError):
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
     new_history = History(
@@ -94,16 +180,38 @@ def create_history():
 
     return jsonify({'message': 'History record created successfully', 'history_id': new_history.id}), 201
 
-@app.route('/api/History/<int:id>', methods=['PUT'])
+@bp.route('/api/History/Batch', methods=['POST'])
+@jwt_required()
+def ingest_history_batch():
+    current_user = current_identity()
+
+    if 'admin' not in current_user.roles and 'manager' not in current_user.roles and 'doctor' not in current_user.roles:
+        return jsonify({'error': 'Access forbidden: Only admins, managers, or doctors can create history records'}), 403
+
+    batch_size = max(1, request.args.get('batchSize', default=INGEST_BATCH_SIZE, type=int))
+
+    # JSON-массив или NDJSON-поток; index — номер записи во входных данных.
+    if request.mimetype == 'application/x-ndjson':
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        items = ((index, row, error) for index, (_, row, error) in enumerate(iter_rows(stream)))
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'Expected a non-empty list of history records'}), 400
+        items = ((index, row, None) for index, row in enumerate(data))
+
+    return jsonify(ingest_history(items, batch_size=batch_size)), 200
+
+@bp.route('/api/History/<int:id>', methods=['PUT'])
 @jwt_required()
 def update_history(id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     history_record = History.query.get(id)
 
     if not history_record:
         return jsonify({'error': 'History record not found'}), 404
 
-    if 'admin' not in current_user['roles'] and 'manager' not in current_user['roles'] and 'doctor' not in current_user['roles']:
+    if 'admin' not in current_user.roles and 'manager' not in current_user.roles and 'doctor' not in current_user.roles:
         return jsonify({'error': 'Access forbidden: Only admins, managers, or doctors can update history records'}), 403
 
     data = request.get_json()
@@ -112,8 +220,8 @@ def update_history(id):
         return jsonify({'error': 'Missing data'}), 400
 
     try:
-        date = datetime.fromisoformat(data['date'].replace('Z', '+00:00'))
-    except ValueError:
+        date = parse_time(data['date'])
+    except (AttributeError, ValueError):
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
     history_record.date = date
@@ -130,5 +238,48 @@ def update_history(id):
 
     return jsonify({'message': 'History record updated successfully'}), 200
 
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+@bp.cli.command('rebuild-history-search')
+def rebuild_history_search_command():
+    rebuild_index()
+    click.echo('History search index rebuilt')
+
+@bp.cli.command('migrate-history-storage')
+@click.option('--batch-size', default=MIGRATE_BATCH_SIZE, show_default=True)
+def migrate_history_storage_command(batch_size):
+    migrated = migrate_history_payloads(batch_size, on_progress=lambda done: click.echo(f'{done} records migrated'))
+    click.echo(f'History storage migrated: {migrated} records')
+
+@bp.cli.command('export-history')
+@click.argument('output', type=click.Path(allow_dash=True))
+@click.option('--pacient-id', type=int)
+@click.option('--hospital-id', type=int)
+@click.option('--doctor-id', type=int)
+@click.option('--date-from')
+@click.option('--date-to')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default=None)
+@click.option('--gzip', 'compress', is_flag=True)
+@click.option('--after-id', type=int)
+@click.option('--batch-size', default=STREAM_BATCH_SIZE, show_default=True)
+def export_history_command(output, pacient_id, hospital_id, doctor_id, date_from, date_to, fmt, compress, after_id, batch_size):
+    fmt = fmt or ('csv' if '.csv' in output else 'ndjson')
+    criteria, error = parse_history_filters({
+        'dateFrom': date_from, 'dateTo': date_to, 'hospitalId': hospital_id, 'doctorId': doctor_id
+    })
+    if error:
+        raise click.UsageError(error)
+    if pacient_id is not None:
+        criteria.append(History.pacient_id == pacient_id)
+
+    progress = ExportProgress()
+    chunks = export_chunks(export_records(criteria, after_id, batch_size, progress), fmt, header=after_id is None)
+
+    # С --after-id выгрузка дописывается в конец файла (для gzip — новым членом архива).
+    with click.open_file(output, 'ab' if after_id is not None else 'wb') as raw:
+        stream = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+        try:
+            for chunk in chunks:
+                stream.write(chunk.encode('utf-8'))
+        finally:
+            if compress:
+                stream.close()
+            click.echo(f'Exported {progress.exported} records, last id {progress.last_id}', err=True)
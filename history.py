@@ -0,0 +1,58 @@
+from sqlalchemy.orm import defer, undefer
+
+from models import History
+from schedule import parse_time
+
+HISTORY_KEYS = [History.date, History.id]
+
+
+def parse_history_filters(args):
+    # dateFrom/dateTo (ISO8601), hospitalId, doctorId -> (criteria, error)
+    criteria = []
+    try:
+        if args.get('dateFrom'):
+            criteria.append(History.date >= parse_time(args['dateFrom']))
+        if args.get('dateTo'):
+            criteria.append(History.date <= parse_time(args['dateTo']))
+    except ValueError:
+        return None, 'Invalid date format. Use ISO8601 format.'
+
+    for param, column in (('hospitalId', History.hospital_id), ('doctorId', History.doctor_id)):
+        if args.get(param):
+            try:
+                criteria.append(column == int(args[param]))
+            except ValueError:
+                return None, f'{{{param}}} must be an integer'
+
+    return criteria, None
+
+
+def include_data_requested(args):
+    return args.get('includeData', '').lower() in ('1', 'true', 'yes')
+
+
+def with_data(query):
+    # Текст записи (сжатый payload и старая колонка data) в том же SELECT.
+    return query.options(undefer(History.payload), undefer(History.legacy_data))
+
+
+def history_query(criteria, include_data=False):
+    # Без includeData текст записи не выбирается и не распаковывается вовсе.
+    query = History.query.filter(*criteria)
+    if include_data:
+        return with_data(query)
+    return query.options(defer(History.payload, raiseload=True), defer(History.legacy_data, raiseload=True))
+
+
+def history_to_dict(record, include_data=False):
+    result = {
+        'id': record.id,
+        'date': record.date.isoformat(),
+        'pacientId': record.pacient_id,
+        'hospitalId': record.hospital_id,
+        'doctorId': record.doctor_id,
+        'room': record.room
+    }
+    if include_data:
+        result['data'] = record.data
+    return result
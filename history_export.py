@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models import History
+from db import db
+from streaming import STREAM_BATCH_SIZE
+
+EXPORT_FIELDS = ['id', 'date', 'pacientId', 'hospitalId', 'doctorId', 'room', 'data']
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+class ExportProgress:
+    # Сколько записей отдано и id последней — с него экспорт продолжается (afterId).
+
+    def __init__(self):
+        self.exported = 0
+        self.last_id = None
+
+
+def export_records(criteria, after_id=None, batch_size=STREAM_BATCH_SIZE, progress=None):
+    # Строки, а не объекты ORM, через серверный курсор (yield_per): память не
+    # растёт с объёмом выгрузки. Порядок по id — в нём же продолжается выгрузка.
+    statement = select(
+        History.id, History.date, History.pacient_id, History.hospital_id, History.doctor_id, History.room,
+        History.payload, History.legacy_data
+    ).where(*criteria).order_by(History.id)
+    if after_id is not None:
+        statement = statement.where(History.id > after_id)
+
+    for row in db.session.execute(statement.execution_options(yield_per=batch_size)):
+        if progress is not None:
+            progress.exported += 1
+            progress.last_id = row.id
+        yield {
+            'id': row.id,
+            'date': row.date.isoformat(),
+            'pacientId': row.pacient_id,
+            'hospitalId': row.hospital_id,
+            'doctorId': row.doctor_id,
+            'room': row.room,
+            'data': row.payload if row.payload is not None else row.legacy_data
+        }
+
+
+def ndjson_chunks(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_chunks(records, header=True):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+
+    def take():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    if header:
+        writer.writeheader()
+        yield take()
+    for record in records:
+        writer.writerow(record)
+        yield take()
+
+
+def export_chunks(records, fmt='ndjson', header=True):
+    if fmt == 'csv':
+        return csv_chunks(records, header)
+    return ndjson_chunks(records)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+from itertools import islice
+
+from sqlalchemy import Text, bindparam, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import History, User, Hospital, Doctor, HISTORY_FTS_CONFIG
+from db import db
+from schedule import parse_time
+
+INGEST_BATCH_SIZE = 1000
+INGEST_FIELDS = ['date', 'pacientId', 'hospitalId', 'doctorId', 'room', 'data']
+REPORT_COUNTERS = {'created': 'created', 'duplicate': 'duplicates', 'error': 'errors'}
+
+
+def parse_history_record(row):
+    # Возвращает (values, error) — те же проверки, что и у одиночного POST /api/History.
+    if not isinstance(row, dict):
+        return None, 'Expected a JSON object'
+    if not all(key in row for key in INGEST_FIELDS):
+        return None, 'Missing data'
+
+    try:
+        date = parse_time(row['date'])
+    except (AttributeError, ValueError):
+        return None, 'Invalid date format. Use ISO8601 format.'
+
+    for key in ('pacientId', 'hospitalId', 'doctorId'):
+        if not isinstance(row[key], int) or isinstance(row[key], bool):
+            return None, f'{{{key}}} must be an integer'
+    for key in ('room', 'data'):
+        if not isinstance(row[key], str):
+            return None, f'{{{key}}} must be a string'
+
+    return {
+        'date': date,
+        'pacient_id': row['pacientId'],
+        'hospital_id': row['hospitalId'],
+        'doctor_id': row['doctorId'],
+        'room': row['room'],
+        'data': row['data']
+    }, None
+
+
+def ingest_key(row, values):
+    # Ключ идемпотентности: externalId источника, если он есть, иначе хеш
+    # содержимого записи. Повторно присланная запись находится по этому ключу.
+    if row.get('externalId') is not None:
+        source = ['external', str(row['externalId'])]
+    else:
+        source = [values['pacient_id'], values['hospital_id'], values['doctor_id'],
+                  values['date'].isoformat(), values['room'], values['data']]
+    return hashlib.sha256(json.dumps(source, ensure_ascii=False, separators=(',', ':')).encode()).hexdigest()
+
+
+def existing_ids(column, ids, *criteria):
+    if not ids:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(ids), *criteria)}
+
+
+def ingested_ids(keys):
+    if not keys:
+        return {}
+    return dict(db.session.query(History.ingest_key, History.id).filter(History.ingest_key.in_(keys)))
+
+
+def insert_statement():
+    # Многострочный INSERT ... ON CONFLICT (ingest_key) DO NOTHING RETURNING:
+    # параллельная повторная отправка той же пачки не создаёт дубликатов.
+    table = History.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).values(
+            search_vector=func.to_tsvector(HISTORY_FTS_CONFIG, bindparam('search_text', type_=Text()))
+        ).on_conflict_do_nothing(index_elements=['ingest_key'])
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table).on_conflict_do_nothing(index_elements=['ingest_key'])
+    else:
+        statement = insert(table)
+    return statement.returning(table.c.id, table.c.ingest_key)
+
+
+def ingest_history(items, batch_size=INGEST_BATCH_SIZE):
+    # items — (index, row или None, ошибка разбора). Проверка ссылок, поиск уже
+    # загруженных записей и INSERT выполняются пачками по batch_size;
+    # каждая пачка — одна транзакция.
+    report = {'created': 0, 'duplicates': 0, 'errors': 0, 'results': []}
+    items = iter(items)
+
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            break
+
+        results = []
+        candidates = []
+        for index, row, error in batch:
+            values = None
+            if error is None:
+                values, error = parse_history_record(row)
+            if error is not None:
+                results.append({'index': index, 'status': 'error', 'error': error})
+                continue
+            values['ingest_key'] = ingest_key(row, values)
+            candidates.append((index, values))
+
+        pacients = existing_ids(User.id, {values['pacient_id'] for _, values in candidates})
+        hospitals = existing_ids(Hospital.id, {values['hospital_id'] for _, values in candidates},
+                                 Hospital.is_deleted.isnot(True))
+        doctors = existing_ids(Doctor.id, {values['doctor_id'] for _, values in candidates})
+        known = ingested_ids({values['ingest_key'] for _, values in candidates})
+
+        new_rows = []
+        pending = set()
+        for index, values in candidates:
+            key = values['ingest_key']
+            if values['pacient_id'] not in pacients:
+                results.append({'index': index, 'status': 'error', 'error': 'Pacient not found'})
+            elif values['hospital_id'] not in hospitals:
+                results.append({'index': index, 'status': 'error', 'error': 'Hospital not found'})
+            elif values['doctor_id'] not in doctors:
+                results.append({'index': index, 'status': 'error', 'error': 'Doctor not found'})
+            elif key in known or key in pending:
+                results.append({'index': index, 'status': 'duplicate', 'key': key})
+            else:
+                pending.add(key)
+                new_rows.append((index, values))
+
+        if new_rows:
+            try:
+                rows = db.session.execute(insert_statement(), [
+                    {'date': values['date'], 'pacient_id': values['pacient_id'], 'hospital_id': values['hospital_id'],
+                     'doctor_id': values['doctor_id'], 'room': values['room'], 'data': '', 'payload': values['data'],
+                     'search_text': values['data'], 'ingest_key': values['ingest_key']}
+                    for _, values in new_rows
+                ])
+                inserted = {key: record_id for record_id, key in rows}
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                results.extend(
+                    {'index': index, 'status': 'error', 'error': 'Database error', 'details': str(e)}
+                    for index, _ in new_rows
+                )
+                new_rows = []
+                inserted = {}
+
+            # Строки, которые параллельно успел вставить другой запрос, — тоже дубликаты.
+            known.update(ingested_ids({values['ingest_key'] for _, values in new_rows} - set(inserted)))
+            known.update(inserted)
+            for index, values in new_rows:
+                key = values['ingest_key']
+                if key in inserted:
+                    results.append({'index': index, 'status': 'created', 'id': inserted[key], 'key': key})
+                else:
+                    results.append({'index': index, 'status': 'duplicate', 'key': key})
+
+        for result in results:
+            if result['status'] == 'duplicate':
+                result['id'] = known.get(result['key'])
+            report[REPORT_COUNTERS[result['status']]] += 1
+        report['results'].extend(results)
+
+    report['results'].sort(key=lambda result: result['index'])
+    return report
@@ -0,0 +1,79 @@
+import re
+
+from sqlalchemy import Text, bindparam, column, func, literal_column, table, text
+from sqlalchemy.dialects.postgresql import ARRAY, REGCONFIG
+from sqlalchemy.orm import defer
+
+from models import History, HISTORY_FTS_CONFIG, HISTORY_FTS_SQLITE
+from db import db
+from history import with_data
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+history_fts = table('history_fts', column('rowid'), column('data'))
+
+
+def match_expression(query):
+    # Слова запроса -> выражение FTS5: каждое слово в кавычках (без
+    # операторов из пользовательского ввода) и с поиском по префиксу,
+    # раз unicode61 не умеет в морфологию. Все слова обязательны.
+    words = re.findall(r'\w+', query)
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_history(query, criteria, offset=0, count=10):
+    # Возвращает [(запись, фрагмент с подсветкой, ранг)], лучшие первыми.
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.websearch_to_tsquery(HISTORY_FTS_CONFIG, query)
+        rank = func.ts_rank_cd(History.search_vector, tsquery)
+        rows = with_data(db.session.query(History, rank)).filter(
+            History.search_vector.op('@@')(tsquery), *criteria
+        ).order_by(rank.desc(), History.id.desc()).offset(offset).limit(count).all()
+        # Текст хранится сжатым, поэтому ts_headline получает уже распакованные
+        # тексты страницы — одним запросом на всю страницу.
+        snippets = headlines([record.data for record, _ in rows], query)
+        return [(record, snippet, rank) for (record, rank), snippet in zip(rows, snippets)]
+
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    fts = literal_column('history_fts')
+    # bm25 в SQLite отрицательный: чем меньше, тем релевантнее.
+    rank = func.bm25(fts)
+    snippet = func.snippet(fts, 0, HIGHLIGHT_START, HIGHLIGHT_STOP, '…', 16)
+    rows = db.session.query(History, snippet, rank).options(
+        defer(History.payload, raiseload=True), defer(History.legacy_data, raiseload=True)
+    ).join(
+        history_fts, history_fts.c.rowid == History.id
+    ).filter(fts.op('MATCH')(expression), *criteria).order_by(rank, History.id.desc()).offset(offset).limit(count).all()
+    return [(record, snippet, -rank) for record, snippet, rank in rows]
+
+
+def headlines(texts, query):
+    if not texts:
+        return []
+    statement = text(
+        'SELECT ts_headline(:config, document, websearch_to_tsquery(:config, :query), :options) '
+        'FROM unnest(:texts) WITH ORDINALITY AS page(document, position) ORDER BY position'
+    ).bindparams(
+        bindparam('config', type_=REGCONFIG), bindparam('texts', type_=ARRAY(Text))
+    )
+    return db.session.execute(statement, {
+        'config': 'russian',
+        'query': query,
+        'options': f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=30, MinWords=10, MaxFragments=2',
+        'texts': texts
+    }).scalars().all()
+
+
+def rebuild_index():
+    # Создаёт history_fts с триггерами, если их нет (база старше поиска), и заполняет заново.
+    if db.engine.dialect.name != 'sqlite':
+        return
+    for statement in HISTORY_FTS_SQLITE:
+        db.session.execute(text(statement))
+    db.session.execute(text('DELETE FROM history_fts'))
+    db.session.execute(text('INSERT INTO history_fts(rowid, data) SELECT id, history_text(payload, data) FROM history'))
+    db.session.commit()
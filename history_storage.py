@@ -0,0 +1,74 @@
+from sqlalchemy import LargeBinary, Text, bindparam, cast, func, inspect, select, text, update
+
+from models import History, HISTORY_FTS_CONFIG, HISTORY_FTS_SQLITE
+from db import db
+from compression import CompressedText
+
+MIGRATE_BATCH_SIZE = 1000
+
+
+def ensure_schema():
+    # Базы, созданные до сжатия истории: новые колонки, индекс по search_vector
+    # вместо индекса по выражению над data, триггеры FTS, читающие payload,
+    # уникальный ключ пакетной загрузки.
+    dialect = db.engine.dialect
+    columns = {column['name'] for column in inspect(db.engine).get_columns('history')}
+    for name in ('payload', 'search_vector', 'ingest_key'):
+        if name not in columns:
+            column_type = History.__table__.c[name].type.compile(dialect=dialect)
+            db.session.execute(text(f'ALTER TABLE history ADD COLUMN {name} {column_type}'))
+
+    if dialect.name == 'postgresql':
+        db.session.execute(text('DROP INDEX IF EXISTS ix_history_data_fts'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_history_search_vector ON history USING gin (search_vector)'))
+    elif dialect.name == 'sqlite':
+        for trigger in ('history_fts_insert', 'history_fts_update', 'history_fts_delete'):
+            db.session.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+        for statement in HISTORY_FTS_SQLITE:
+            db.session.execute(text(statement))
+    db.session.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_history_ingest_key ON history (ingest_key)'))
+    db.session.commit()
+
+
+def migrate_history_payloads(batch_size=MIGRATE_BATCH_SIZE, on_progress=None):
+    # Переносит текст из data в сжатый payload пачками по id; каждая пачка —
+    # отдельная транзакция, поэтому прерванный перенос можно просто запустить снова.
+    ensure_schema()
+    table = History.__table__
+    values = {'payload': bindparam('record_payload', type_=CompressedText()), 'data': ''}
+    if db.engine.dialect.name == 'postgresql':
+        values['search_vector'] = func.to_tsvector(HISTORY_FTS_CONFIG, bindparam('record_text', type_=Text()))
+    statement = update(table).where(table.c.id == bindparam('record_id')).values(values)
+
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.data).where(table.c.payload.is_(None), table.c.id > last_id)
+            .order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return migrated
+        db.session.execute(statement, [
+            {'record_id': record_id, 'record_payload': data, 'record_text': data} for record_id, data in rows
+        ])
+        db.session.commit()
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        if on_progress:
+            on_progress(migrated)
+
+
+def storage_stats():
+    # Объём текста истории в байтах: несжатый в data и сжатый в payload.
+    table = History.__table__
+    if db.engine.dialect.name == 'postgresql':
+        legacy_bytes = func.octet_length(table.c.data)
+    else:
+        legacy_bytes = func.length(cast(table.c.data, LargeBinary))
+    rows, legacy, payload = db.session.execute(select(
+        func.count(table.c.id),
+        func.coalesce(func.sum(legacy_bytes), 0),
+        func.coalesce(func.sum(func.length(table.c.payload)), 0)
+    )).one()
+    return {'rows': rows, 'legacyBytes': legacy, 'payloadBytes': payload}
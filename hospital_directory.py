@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Hospital, Room, TimeTables, DirectoryVersion
+from db import db
+from pagination import encode_cursor, decode_cursor
+
+DIRECTORY = 'hospitals'
+EXPANDS = ('rooms', 'timetableCount')
+
+RoomEntry = namedtuple('RoomEntry', ['id', 'number', 'type'])
+HospitalEntry = namedtuple('HospitalEntry', ['id', 'name', 'address', 'contactPhone', 'updated_at', 'rooms'])
+Snapshot = namedtuple('Snapshot', ['version', 'hospitals', 'ids', 'by_id', 'last_modified'])
+
+
+def bump_version():
+    # Вызывается в транзакции изменения больницы или её кабинетов.
+    # INSERT ... ON CONFLICT DO UPDATE: первые два писателя не гоняются за вставку строки.
+    dialect = db.engine.dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(DirectoryVersion.__table__).values(name=DIRECTORY, version=1)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['name'], set_={'version': DirectoryVersion.__table__.c.version + 1}
+    ))
+
+
+class HospitalDirectory:
+    # Неизменяемый снимок больниц (без удалённых) и их кабинетов в памяти
+    # процесса. Раз в check_interval секунд читается одна строка версии;
+    # при её смене снимок перестраивается двумя запросами и подменяется
+    # целиком присваиванием ссылки — читатели видят либо старый, либо новый.
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('HOSPITAL_DIRECTORY_CHECK_SECONDS', self.check_interval)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() >= self._next_check:
+                version = db.session.query(DirectoryVersion.version).filter_by(name=DIRECTORY).scalar() or 0
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self._build(version)
+                self._next_check = time.monotonic() + self.check_interval
+        return snapshot
+
+    def invalidate(self):
+        # Собственные изменения воркера видны следующему же запросу.
+        self._next_check = 0.0
+
+    def _build(self, version):
+        rooms = {}
+        for room_id, hospital_id, number, type_ in db.session.query(
+            Room.id, Room.hospitalId, Room.number, Room.type
+        ).join(Hospital, Room.hospitalId == Hospital.id).filter(
+            Hospital.is_deleted.isnot(True)
+        ).order_by(Room.hospitalId, Room.id):
+            rooms.setdefault(hospital_id, []).append(RoomEntry(room_id, number, type_))
+
+        hospitals = tuple(
+            HospitalEntry(row.id, row.name, row.address, row.contactPhone, row.updated_at, tuple(rooms.get(row.id, ())))
+            for row in db.session.query(
+                Hospital.id, Hospital.name, Hospital.address, Hospital.contactPhone, Hospital.updated_at
+            ).filter(Hospital.is_deleted.isnot(True)).order_by(Hospital.id)
+        )
+        last_modified = max((hospital.updated_at for hospital in hospitals), default=None)
+        return Snapshot(
+            version=version,
+            hospitals=hospitals,
+            ids=tuple(hospital.id for hospital in hospitals),
+            by_id={hospital.id: hospital for hospital in hospitals},
+            last_modified=last_modified
+        )
+
+
+def page(snapshot, after=None, offset=0, count=10):
+    # То же, что paginate() по Hospital.id, но по снимку.
+    if after:
+        start = bisect.bisect_right(snapshot.ids, decode_cursor(after, [Hospital.id])[0])
+    else:
+        start = max(offset, 0)
+
+    rows = snapshot.hospitals[start:start + count]
+    next_cursor = None
+    if rows and start + count < len(snapshot.hospitals):
+        next_cursor = encode_cursor([rows[-1].id])
+    return rows, next_cursor
+
+
+def parse_expand(value):
+    # expand=rooms,timetableCount -> ({'rooms', 'timetableCount'}, error)
+    expand = {part.strip() for part in (value or '').split(',') if part.strip()}
+    unknown = expand.difference(EXPANDS)
+    if unknown:
+        return None, f"Unknown expand value: {', '.join(sorted(unknown))}. Allowed: {', '.join(EXPANDS)}"
+    return expand, None
+
+
+def timetable_counts(hospital_ids):
+    # Один агрегатный запрос на страницу, сколько бы больниц в ней ни было.
+    if not hospital_ids:
+        return {}
+    return dict(db.session.query(TimeTables.hospitalId, func.count(TimeTables.id)).filter(
+        TimeTables.hospitalId.in_(hospital_ids)
+    ).group_by(TimeTables.hospitalId).all())
+
+
+def hospital_to_dict(hospital, expand=(), counts=None):
+    result = {'id': hospital.id, 'name': hospital.name}
+    if 'rooms' in expand:
+        result['rooms'] = [{'id': room.id, 'number': room.number, 'type': room.type} for room in hospital.rooms]
+    if 'timetableCount' in expand:
+        result['timetableCount'] = counts.get(hospital.id, 0)
+    return result
+
+
+directory = HospitalDirectory()
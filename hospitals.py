@@ -1,72 +1,90 @@
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
 
-from models import Hospital, Room
-from db import db, init_app
-from dotenv import load_dotenv
-import os
+from models import Hospital
+from db import db
+from rooms import parse_rooms, insert_rooms, sync_rooms
+from hospital_directory import directory, page, bump_version, parse_expand, timetable_counts, hospital_to_dict
+from conditional import make_etag, not_modified, add_validators
+from pagination import page_args, InvalidCursor
+from identity import current_identity
 
-load_dotenv()
+bp = Blueprint('hospitals', __name__, cli_group=None)
 
-app = Flask(__name__)
+@bp.route('/api/Hospitals', methods=['GET'])
+@jwt_required()
+def get_hospitals():
+    page_params, error = page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    after, from_param, count_param = page_params
+    expand, error = parse_expand(request.args.get('expand'))
+    if error:
+        return jsonify({'error': error}), 400
 
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
-jwt = JWTManager(app)
+    snapshot = directory.snapshot()
 
-init_app(app)
-with app.app_context():
-    db.create_all()
+    try:
+        hospitals, next_cursor = page(snapshot, after, from_param, count_param)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
 
-@app.route('/api/Hospitals', methods=['GET'])
-@jwt_required()
-def get_hospitals():
-    from_param = request.args.get('from', default=0, type=int)
-    count_param = request.args.get('count', default=10, type=int)
+    # Кабинеты уже лежат в снимке; число расписаний — один запрос на всю страницу.
+    counts = timetable_counts([hospital.id for hospital in hospitals]) if 'timetableCount' in expand else None
 
-    hospitals_query = Hospital.query.offset(from_param).limit(count_param)
-    hospitals = hospitals_query.all()
+    etag = make_etag(snapshot.version, sorted(counts.items()) if counts else None)
+    response = not_modified(etag)
+    if response:
+        return response
 
-    hospital_list = [{'id': hospital.id, 'name': hospital.name} for hospital in hospitals]
+    hospital_list = [hospital_to_dict(hospital, expand, counts) for hospital in hospitals]
 
-    return jsonify({'hospitals': hospital_list}), 200
+    return add_validators(jsonify({'hospitals': hospital_list, 'next': next_cursor}), etag, snapshot.last_modified), 200
 
-@app.route('/api/Hospitals/<int:id>', methods=['GET'])
+@bp.route('/api/Hospitals/<int:id>', methods=['GET'])
 @jwt_required()
 def get_hospital_by_id(id):
-    hospital = Hospital.query.get(id)
+    hospital = directory.snapshot().by_id.get(id)
 
     if not hospital:
         return jsonify({'error': 'Hospital not found'}), 404
 
+    last_modified = hospital.updated_at
+    etag = make_etag(last_modified)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+
     hospital_data = {
         'id': hospital.id,
         'name': hospital.name
     }
 
-    return jsonify({'hospital': hospital_data}), 200
+    return add_validators(jsonify({'hospital': hospital_data}), etag, last_modified), 200
 
-@app.route('/api/Hospitals/<int:id>/Rooms', methods=['GET'])
+@bp.route('/api/Hospitals/<int:id>/Rooms', methods=['GET'])
 @jwt_required()
 def get_rooms_by_hospital_id(id):
 
-    hospital = Hospital.query.get(id)
+    snapshot = directory.snapshot()
+    hospital = snapshot.by_id.get(id)
 
     if not hospital:
         return jsonify({'error': 'Hospital not found'}), 404
 
-    rooms = Room.query.filter_by(hospital_id=id).all()
+    etag = make_etag(snapshot.version)
+    response = not_modified(etag)
+    if response:
+        return response
 
-    room_list = [{'id': room.id, 'number': room.number, 'type': room.type} for room in rooms]
+    room_list = [{'id': room.id, 'number': room.number, 'type': room.type} for room in hospital.rooms]
 
-    return jsonify({'rooms': room_list}), 200
+    return add_validators(jsonify({'rooms': room_list}), etag), 200
 
-@app.route('/api/Hospitals', methods=['POST'])
+@bp.route('/api/Hospitals', methods=['POST'])
 @jwt_required()
 def create_hospital():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     if not current_user.is_admin:
         return jsonify({'error': 'Access forbidden: Admins only'}), 403
@@ -76,70 +94,74 @@ def create_hospital():
     if not data or not all(key in data for key in ['name', 'address', 'contactPhone', 'rooms']):
         return jsonify({'error': 'Missing data'}), 400
 
+    numbers, error = parse_rooms(data['rooms'])
+    if error:
+        return jsonify({'error': error}), 400
+
     new_hospital = Hospital(
         name=data['name'],
         address=data['address'],
         contactPhone=data['contactPhone']
     )
 
+    # Больница и её кабинеты фиксируются одной транзакцией.
     try:
         db.session.add(new_hospital)
+        db.session.flush()
+        insert_rooms(new_hospital.id, numbers)
+        bump_version()
         db.session.commit()
-
-        for room_name in data['rooms']:
-            new_room = Room(number=room_name, type='General', hospital_id=new_hospital.id)
-            db.session.add(new_room)
-
-        db.session.commit()
-
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
+    directory.invalidate()
+
     return jsonify({'message': 'Hospital created successfully', 'id': new_hospital.id}), 201
 
-@app.route('/api/Hospitals/<int:id>', methods=['PUT'])
+@bp.route('/api/Hospitals/<int:id>', methods=['PUT'])
 @jwt_required()
 def update_hospital(id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     if not current_user.is_admin:
         return jsonify({'error': 'Access forbidden: Admins only'}), 403
 
-    hospital = Hospital.query.get(id)
-
-    if not hospital:
-        return jsonify({'error': 'Hospital not found'}), 404
-
     data = request.get_json()
 
-
     if not data or not all(key in data for key in ['name', 'address', 'contactPhone', 'rooms']):
         return jsonify({'error': 'Missing data'}), 400
 
+    numbers, error = parse_rooms(data['rooms'])
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Блокировка строки больницы: параллельные правки кабинетов применяются по очереди.
+    hospital = Hospital.query.filter_by(id=id).with_for_update().first()
+
+    if not hospital:
+        return jsonify({'error': 'Hospital not found'}), 404
+
     hospital.name = data['name']
     hospital.address = data['address']
     hospital.contactPhone = data['contactPhone']
 
     try:
+        sync_rooms(hospital.id, numbers)
+        bump_version()
         db.session.commit()
-
-        Room.query.filter_by(hospital_id=hospital.id).delete()
-
-        for room_name in data['rooms']:
-            new_room = Room(number=room_name, type='General', hospital_id=hospital.id)  # Предполагаем, что все кабинеты общего типа
-            db.session.add(new_room)
-
-        db.session.commit()
-
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
+    directory.invalidate()
+
     return jsonify({'message': 'Hospital updated successfully'}), 200
 
-@app.route('/api/Hospitals/<int:id>', methods=['DELETE'])
+@bp.route('/api/Hospitals/<int:id>', methods=['DELETE'])
 @jwt_required()
 def soft_delete_hospital(id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     if not current_user.is_admin:
         return jsonify({'error': 'Access forbidden: Admins only'}), 403
@@ -150,15 +172,13 @@ def soft_delete_hospital(id):
         return jsonify({'error': 'Hospital not found'}), 404
 
     try:
-
         hospital.is_deleted = True
+        bump_version()
         db.session.commit()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
-    return jsonify({'message': 'Hospital soft deleted successfully'}), 200
-
+    directory.invalidate()
 
-
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    return jsonify({'message': 'Hospital soft deleted successfully'}), 200
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt
+from sqlalchemy import func
+
+from models import User, ROLES_VERSION_SEQUENCE
+from db import db, SYNC_OVERLAP
+
+# Токен календарной ленты: долгоживущий, годен только для .ics-маршрутов.
+FEED_SCOPE = 'calendar'
+FEED_TOKEN_EXPIRES = timedelta(days=365)
+
+
+class Identity:
+    # Всё, что нужно для проверки прав, берётся из claims токена без запроса в БД.
+
+    def __init__(self, claims):
+        self.id = int(claims['sub'])
+        self.username = claims.get('username')
+        self.roles = claims.get('roles', [])
+
+    @property
+    def is_admin(self):
+        return 'admin' in self.roles
+
+    @property
+    def is_manager(self):
+        return 'manager' in self.roles
+
+    @property
+    def is_doctor(self):
+        return 'doctor' in self.roles
+
+
+def identity_claims(user):
+    return {
+        'username': user.username,
+        'roles': user.roles,
+        'rv': user.roles_version
+    }
+
+
+def create_user_tokens(user):
+    claims = identity_claims(user)
+    return (
+        create_access_token(identity=str(user.id), additional_claims=claims),
+        create_refresh_token(identity=str(user.id), additional_claims=claims)
+    )
+
+
+def create_feed_token(user):
+    claims = dict(identity_claims(user), scope=FEED_SCOPE)
+    expires = current_app.config.get('JWT_FEED_TOKEN_EXPIRES', FEED_TOKEN_EXPIRES)
+    return create_access_token(identity=str(user.id), additional_claims=claims, expires_delta=expires)
+
+
+def accepts_feed_token(view):
+    # Маршрут, которому можно предъявить токен ленты (например, в ?jwt= URL календаря).
+    view.accepts_feed_token = True
+    return view
+
+
+def scope_allowed(jwt_payload):
+    if jwt_payload.get('scope') != FEED_SCOPE:
+        return True
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'accepts_feed_token', False)
+
+
+def current_identity():
+    if 'identity' not in g:
+        g.identity = Identity(get_jwt())
+    return g.identity
+
+
+def current_user_row():
+    # Полная строка User загружается только если обработчику она действительно нужна.
+    if 'user_row' not in g:
+        g.user_row = db.session.get(User, current_identity().id)
+    return g.user_row
+
+
+def bump_roles_version(user):
+    # roles_version — глобально возрастающая метка, поэтому воркеры могут
+    # дочитывать только изменения с недавно увиденной метки.
+    if db.engine.dialect.name == 'postgresql':
+        user.roles_version = db.session.execute(ROLES_VERSION_SEQUENCE.next_value()).scalar()
+        return
+    latest = db.session.query(func.coalesce(func.max(User.roles_version), 0)).scalar()
+    user.roles_version = latest + 1
+
+
+class RoleVersions:
+
+    def __init__(self, sync_interval=1.0):
+        self.sync_interval = sync_interval
+        self._versions = {}
+        self._last_version = 0
+        # (время синхронизации, старшая увиденная метка) за последние SYNC_OVERLAP секунд.
+        self._seen = deque()
+        self._since = 0
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, user_id):
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+        return self._versions.get(user_id, 0)
+
+    def sync(self):
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            now = time.monotonic()
+            while self._seen and self._seen[0][0] <= now - SYNC_OVERLAP.total_seconds():
+                self._since = self._seen.popleft()[1]
+
+            rows = db.session.query(User.id, User.roles_version).filter(
+                User.roles_version > self._since
+            ).all()
+
+            for user_id, version in rows:
+                self._versions[user_id] = version
+                self._last_version = max(self._last_version, version)
+
+            self._seen.append((now, self._last_version))
+            self._next_sync = now + self.sync_interval
+
+    def is_current(self, jwt_header, jwt_payload):
+        if 'rv' not in jwt_payload:
+            return False
+        return self.current(int(jwt_payload['sub'])) == jwt_payload['rv']
+
+
+def verify_token(jwt_header, jwt_payload):
+    return scope_allowed(jwt_payload) and versions.is_current(jwt_header, jwt_payload)
+
+
+versions = RoleVersions()
+
+
+def token_rejected(jwt_header, jwt_payload):
+    if not scope_allowed(jwt_payload):
+        return jsonify({'error': 'Feed token is only valid for calendar feeds'}), 403
+    return jsonify({'error': 'Token roles are outdated, sign in again'}), 401
+
+
+def init_app(app, jwt):
+    versions.sync_interval = app.config.get('JWT_ROLES_SYNC_SECONDS', versions.sync_interval)
+    jwt.token_verification_loader(verify_token)
+    jwt.token_verification_failed_loader(token_rejected)
@@ -0,0 +1,87 @@
+import threading
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import TimeTables, BackgroundJob
+from db import db
+from calendar_feed import record_tombstones
+
+DELETE_CHUNK_SIZE = 5000
+# До этого числа строк расписание удаляется прямо в запросе одним DELETE.
+INLINE_DELETE_LIMIT = 5000
+
+
+def count_timetables(condition):
+    return db.session.query(func.count(TimeTables.id)).filter(condition).scalar()
+
+
+def delete_timetables(condition):
+    # Один DELETE по условию; записи на приём удаляются каскадом в БД.
+    record_tombstones(condition)
+    deleted = TimeTables.query.filter(condition).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def delete_timetables_in_chunks(condition, chunk_size=DELETE_CHUNK_SIZE, on_progress=None):
+    deleted = 0
+    while True:
+        ids = db.session.scalars(select(TimeTables.id).where(condition).limit(chunk_size)).all()
+        if not ids:
+            return deleted
+        record_tombstones(TimeTables.id.in_(ids))
+        count = TimeTables.query.filter(TimeTables.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += count
+        if on_progress:
+            on_progress(deleted)
+
+
+def start_timetable_delete(kind, condition, total, on_finish=None):
+    # on_finish вызывается после удаления, успешного или нет (например, сброс кэшей).
+    job = BackgroundJob(id=str(uuid.uuid4()), kind=kind, total=total, created_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    threading.Thread(target=_run_timetable_delete, args=(app, job.id, condition, on_finish), daemon=True).start()
+    return job
+
+
+def _update_job(job_id, **values):
+    BackgroundJob.query.filter_by(id=job_id).update(values)
+    db.session.commit()
+
+
+def _run_timetable_delete(app, job_id, condition, on_finish=None):
+    with app.app_context():
+        try:
+            _update_job(job_id, status='running')
+            delete_timetables_in_chunks(condition, on_progress=lambda deleted: _update_job(job_id, processed=deleted))
+            _update_job(job_id, status='done', finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            try:
+                _update_job(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+            except Exception:
+                db.session.rollback()
+        finally:
+            # Пока шло удаление, представления могли перестроиться из частично удалённых строк.
+            if on_finish:
+                on_finish()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'error': job.error,
+        'createdAt': job.created_at.isoformat() + 'Z',
+        'finishedAt': job.finished_at.isoformat() + 'Z' if job.finished_at else None
+    }
@@ -1,5 +1,11 @@
+from datetime import datetime
+
 from db import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, literal_column
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, TSVECTOR
+from sqlalchemy.orm import deferred
+from passwords import hash_password, verify_password, needs_rehash
+from compression import CompressedText
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -10,35 +16,77 @@ class User(db.Model):
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     is_manager = db.Column(db.Boolean, default = False)
+    is_doctor = db.Column(db.Boolean, default=False)
+    is_active = db.Column(db.Boolean, default=True)
+    roles_version = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+    @property
+    def roles(self):
+        roles = ['user']
+        if self.is_admin:
+            roles.append('admin')
+        if self.is_manager:
+            roles.append('manager')
+        if self.is_doctor:
+            roles.append('doctor')
+        return roles
+
+    def set_roles(self, roles):
+        self.is_admin = 'admin' in roles
+        self.is_manager = 'manager' in roles
+        self.is_doctor = 'doctor' in roles
+
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password)
+
+# Метки roles_version в PostgreSQL выдаёт последовательность: max()+1 внутри
+# незафиксированных транзакций давал одинаковые метки параллельным изменениям.
+ROLES_VERSION_SEQUENCE = db.Sequence('users_roles_version_seq', metadata=db.metadata)
 
 class TokenBlackList(db.Model):
     __tablename__ = 'token_black_list'
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), unique=True, nullable=False)
     revoked = db.Column(db.Boolean, default=False, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, index=True)
 
-    def __init__(self, jti):
+    def __init__(self, jti, expires_at=None):
         self.jti = jti
         self.revoked = True
+        self.expires_at = expires_at
 
 class Doctor(db.Model):
     __tablename__ = 'doctors'
+    __table_args__ = (
+        db.Index('ix_doctors_fullName_trgm', 'fullName', postgresql_using='gin',
+                 postgresql_ops={'fullName': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_doctors_specialization_trgm', 'specialization', postgresql_using='gin',
+                 postgresql_ops={'specialization': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     fullName = db.Column(db.String(200), nullable=False)
     specialization = db.Column(db.String(100), nullable=True)
     phone = db.Column(db.String(15), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __init__(self, fullName, specialization=None, phone=None):
         self.fullName = fullName
         self.specialization = specialization
         self.phone = phone
 
+event.listen(
+    Doctor.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
 class Hospital(db.Model):
     __tablename__ = 'hospitals'
     id = db.Column(db.Integer, primary_key=True)
@@ -47,8 +95,9 @@ class Hospital(db.Model):
     contactPhone = db.Column(db.String(15), nullable=False)
     rooms_description = db.Column(db.String(100), nullable=False)
     is_deleted = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def __init__(self, name, address, contactPhone, rooms_description, is_deleted):
+    def __init__(self, name, address, contactPhone, rooms_description='', is_deleted=False):
         self.name = name
         self.address = address
         self.contactPhone = contactPhone
@@ -62,44 +111,82 @@ class Room(db.Model):
     number = db.Column(db.String(10), nullable=False)
     type = db.Column(db.String(50), nullable=False)
     hospitalId = db.Column(db.Integer, db.ForeignKey('hospitals.id'), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     hospital = db.relationship('Hospital', backref=db.backref('rooms', lazy=True))
 
     def __init__(self, number, type, hospital_id):
         self.number = number
         self.type = type
-        self.hospital_id = hospital_id
+        self.hospitalId = hospital_id
 
 class TimeTables(db.Model):
     __tablename__ = 'timetables'
+    __table_args__ = (
+        # Врач и кабинет не могут быть заняты двумя пересекающимися записями.
+        ExcludeConstraint(
+            ('doctorId', '='),
+            (func.tsrange(db.text('from_time'), db.text('to_time')), '&&'),
+            name='ex_timetables_doctor_overlap', using='gist'
+        ).ddl_if(dialect='postgresql'),
+        ExcludeConstraint(
+            ('hospitalId', '='),
+            ('room', '='),
+            (func.tsrange(db.text('from_time'), db.text('to_time')), '&&'),
+            name='ex_timetables_room_overlap', using='gist'
+        ).ddl_if(dialect='postgresql'),
+        db.Index('ix_timetables_hospital_from', 'hospitalId', 'from_time'),
+        db.Index('ix_timetables_doctor_from', 'doctorId', 'from_time'),
+        db.Index('ix_timetables_hospital_room_from', 'hospitalId', 'room', 'from_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     hospitalId = db.Column(db.Integer, db.ForeignKey('hospitals.id'), nullable=False)
     doctorId = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
-    from_time = db.Column(db.DateTime, nullable=False)
+    from_time = db.Column(db.DateTime, nullable=False, index=True)
     to_time = db.Column(db.DateTime, nullable=False)
     room = db.Column(db.String(100), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     hospital = db.relationship('Hospital', backref='timetables')
     doctor = db.relationship('Doctor', backref='timetables')
 
     def __init__(self, hospital_id, doctor_id, from_time, to_time, room):
-        self.hospital_id = hospital_id
-        self.doctor_id = doctor_id
+        self.hospitalId = hospital_id
+        self.doctorId = doctor_id
         self.from_time = from_time
         self.to_time = to_time
         self.room = room
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'hospitalId': self.hospitalId,
+            'doctorId': self.doctorId,
+            'from': self.from_time.isoformat() + 'Z',
+            'to': self.to_time.isoformat() + 'Z',
+            'room': self.room
+        }
+
     def __repr__(self):
-        return f'<TimeTable {self.id}: {self.doctor_id} at {self.hospital_id} from {self.from_time} to {self.to_time}>'
+        return f'<TimeTable {self.id}: {self.doctorId} at {self.hospitalId} from {self.from_time} to {self.to_time}>'
+
+event.listen(
+    TimeTables.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.UniqueConstraint('timetable_id', 'time', name='uq_appointments_timetable_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    timetable_id = db.Column(db.Integer, db.ForeignKey('timetables.id'), nullable=False)
+    timetable_id = db.Column(db.Integer, db.ForeignKey('timetables.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     time = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    timetable = db.relationship('TimeTables', backref='appointments')
+    timetable = db.relationship('TimeTables', backref=db.backref('appointments', passive_deletes=True))
     user = db.relationship('User', backref='appointments')
 
     def __init__(self, timetable_id, user_id, time):
@@ -110,15 +197,34 @@ class Appointment(db.Model):
     def __repr__(self):
         return f'<Appointment {self.id} for User {self.user_id} at {self.time}>'
 
+# Конфигурация полнотекстового поиска по тексту истории в PostgreSQL.
+HISTORY_FTS_CONFIG = literal_column("'russian'")
+
 class History(db.Model):
     __tablename__ = 'history'
+    __table_args__ = (
+        # Лента пациента: фильтр по pacient_id, сортировка date DESC, id DESC.
+        db.Index('ix_history_pacient_date', 'pacient_id', 'date', 'id'),
+        db.Index('ix_history_search_vector', 'search_vector', postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ux_history_ingest_key', 'ingest_key', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, nullable=False)
     pacient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     hospital_id = db.Column(db.Integer, db.ForeignKey('hospitals.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
     room = db.Column(db.String(100), nullable=False)
-    data = db.Column(db.String, nullable=False)
+    # Текст записи хранится сжатым в payload и читается только по запросу
+    # (deferred). Старая колонка data остаётся пустой строкой; в ней лежит
+    # текст лишь у записей, которые ещё не перенёс migrate_history_payloads().
+    legacy_data = deferred(db.Column('data', db.String, nullable=False, default=''))
+    payload = deferred(db.Column(CompressedText, nullable=True))
+    # tsvector для поиска в PostgreSQL: из сжатого текста его не построить
+    # выражением в индексе, поэтому он пишется вместе с записью.
+    search_vector = deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite'), nullable=True))
+    # Ключ идемпотентности пакетной загрузки (см. history_ingest); у записей,
+    # созданных по одной, пуст.
+    ingest_key = db.Column(db.String(64), nullable=True)
 
     pacient = db.relationship('User', backref='history')
     hospital = db.relationship('Hospital', backref='history')
@@ -132,5 +238,88 @@ class History(db.Model):
         self.room = room
         self.data = data
 
+    @property
+    def data(self):
+        return self.payload if self.payload is not None else self.legacy_data
+
+    @data.setter
+    def data(self, value):
+        self.payload = value
+        self.legacy_data = ''
+
     def __repr__(self):
         return f'<History {self.id}: {self.pacient_id} on {self.date}>'
+
+@event.listens_for(History, 'before_insert')
+@event.listens_for(History, 'before_update')
+def _set_history_search_vector(mapper, connection, target):
+    if connection.dialect.name == 'postgresql' and 'payload' in target.__dict__:
+        target.search_vector = func.to_tsvector(HISTORY_FTS_CONFIG, target.payload or '')
+
+# SQLite (локальный запуск и тесты): таблица FTS5 с копией текста, которую
+# поддерживают триггеры, — так её видят и пакетные INSERT без ORM. Сжатый
+# текст триггеры читают SQL-функцией history_text() (см. db.py).
+HISTORY_FTS_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(data, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN "
+    "INSERT INTO history_fts(rowid, data) VALUES (new.id, history_text(new.payload, new.data)); END",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF data, payload ON history BEGIN "
+    "UPDATE history_fts SET data = history_text(new.payload, new.data) WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN "
+    "DELETE FROM history_fts WHERE rowid = old.id; END",
+]
+for statement in HISTORY_FTS_SQLITE:
+    event.listen(History.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, id, kind, total, created_at):
+        self.id = id
+        self.kind = kind
+        self.status = 'pending'
+        self.total = total
+        self.processed = 0
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id}: {self.kind} {self.status} {self.processed}/{self.total}>'
+
+class CalendarTombstone(db.Model):
+    # Записи расписания, удалённые или перенесённые к другому врачу/в другой
+    # кабинет: по ним инкрементальная .ics-лента отдаёт отменённые события.
+    __tablename__ = 'calendar_tombstones'
+    __table_args__ = (
+        db.Index('ix_calendar_tombstones_doctor_deleted', 'doctorId', 'deleted_at'),
+        db.Index('ix_calendar_tombstones_room_deleted', 'hospitalId', 'room', 'deleted_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    timetable_id = db.Column(db.Integer, nullable=False)
+    hospitalId = db.Column(db.Integer, nullable=False)
+    doctorId = db.Column(db.Integer, nullable=False)
+    room = db.Column(db.String(100), nullable=False)
+    from_time = db.Column(db.DateTime, nullable=False)
+    to_time = db.Column(db.DateTime, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CalendarTombstone {self.timetable_id} at {self.deleted_at}>'
+
+class DirectoryVersion(db.Model):
+    # Версия справочника, который воркеры держат в памяти (например, больниц):
+    # увеличивается в той же транзакции, что и изменение данных.
+    __tablename__ = 'directory_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, name, version=0):
+        self.name = name
+        self.version = version
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import tuple_
+
+
+MAX_PAGE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise InvalidCursor(token)
+
+
+def encode_cursor(values):
+    return _encode([value.isoformat() if isinstance(value, datetime) else value for value in values])
+
+
+def decode_cursor(token, keys):
+    values = _decode(token)
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor(token)
+
+    try:
+        return [_cursor_value(key, value) for key, value in zip(keys, values)]
+    except (TypeError, ValueError):
+        raise InvalidCursor(token)
+
+
+def _cursor_value(key, value):
+    # Курсор присылает клиент: значение другого типа — ошибка курсора, а не
+    # TypeError при сравнении в памяти или DataError в БД.
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is int and isinstance(value, bool):
+        raise TypeError(value)
+    if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, python_type):
+        raise TypeError(value)
+    return value
+
+
+def page_args():
+    # Возвращает ((after, from, count), error); count ограничен 1..MAX_PAGE,
+    # чтобы страница не превращалась в чтение всей таблицы.
+    offset = request.args.get('from', default=0, type=int)
+    if offset < 0:
+        return None, '{from} must not be negative'
+
+    count = max(1, min(request.args.get('count', default=10, type=int), MAX_PAGE))
+    return (request.args.get('after'), offset, count), None
+
+
+def paginate(query, keys, after=None, offset=0, count=10, descending=False):
+    # keys — колонки сортировки, последняя должна быть уникальной (обычно id).
+    # С after страница начинается сразу за курсором по индексу, без OFFSET;
+    # from/count остаются для совместимости.
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+
+    if after:
+        values = decode_cursor(after, keys)
+        if len(keys) == 1:
+            left, right = keys[0], values[0]
+        else:
+            left, right = tuple_(*keys), tuple_(*values)
+        query = query.filter(left < right if descending else left > right)
+    elif offset:
+        query = query.offset(offset)
+
+    rows = query.limit(count + 1).all()
+
+    next_cursor = None
+    if len(rows) > count:
+        rows = rows[:count]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys]) if rows else None
+
+    return rows, next_cursor
+
+
+def paginate_ranked(search, after=None, offset=0, count=10):
+    # Для выдачи, упорядоченной по релевантности, курсор хранит позицию в выдаче.
+    if after:
+        position = _decode(after)
+        if not isinstance(position, int) or position < 0:
+            raise InvalidCursor(after)
+        offset = position
+
+    rows = search(offset, count + 1)
+
+    next_cursor = None
+    if len(rows) > count:
+        rows = rows[:count]
+        next_cursor = _encode(offset + count)
+
+    return rows, next_cursor
@@ -0,0 +1,80 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash, check_password_hash
+
+load_dotenv()
+
+# Метод и стоимость в формате werkzeug: 'scrypt:N:r:p' или 'pbkdf2:sha256:iterations'.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', max(1, (os.cpu_count() or 1) // 2)))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv('PASSWORD_HASH_WAIT_SECONDS', 2))
+
+# Хеш считается в потоке запроса, но одновременно — не больше
+# PASSWORD_HASH_CONCURRENCY хешей на процесс: всплеск SignIn/SignUp не занимает
+# все ядра, и остальные запросы воркера продолжают обслуживаться. Запрос, не
+# дождавшийся очереди за PASSWORD_HASH_WAIT_SECONDS, получает 503.
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_CONCURRENCY)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+def _limited(func, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_WAIT_SECONDS):
+        raise PasswordHashBusy()
+    try:
+        return func(*args)
+    finally:
+        _slots.release()
+
+
+def _scheme(method):
+    # werkzeug дописывает параметры по умолчанию ('pbkdf2:sha256' -> 'pbkdf2:sha256:1000000'),
+    # поэтому префикс сравнения берётся из настоящего хеша.
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+# Считается при первой проверке, а не при импорте: один хеш scrypt — это
+# ~0.1 с к старту каждого воркера.
+_current_scheme = None
+
+
+def hash_password(password, method=None):
+    return _limited(generate_password_hash, password, method or PASSWORD_HASH_METHOD)
+
+
+def hash_passwords(passwords, method=None):
+    # Для массового импорта: хеши считаются в отдельных процессах на всех ядрах.
+    # Процессы запускаются через spawn: fork многопоточного воркера может
+    # унести в дочерний процесс захваченную другим потоком блокировку.
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+            atexit.register(_process_pool.shutdown)
+    passwords = list(passwords)
+    chunksize = max(1, len(passwords) // (PASSWORD_HASH_WORKERS * 4))
+    return list(_process_pool.map(generate_password_hash, passwords, repeat(method or PASSWORD_HASH_METHOD), chunksize=chunksize))
+
+
+def verify_password(pwhash, password):
+    return _limited(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    global _current_scheme
+    if _current_scheme is None:
+        _current_scheme = _scheme(PASSWORD_HASH_METHOD)
+    return pwhash.split('$', 1)[0] != _current_scheme
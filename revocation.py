@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import TokenBlackList
+from db import db, SYNC_OVERLAP
+
+# Токен без exp не истекает — и его отзыв тоже.
+NEVER_EXPIRES = datetime(9999, 12, 31)
+
+
+def token_expires_at(jwt_payload):
+    exp = jwt_payload.get('exp')
+    if exp is None:
+        return None
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+class RevocationStore:
+    # Отозванные jti держатся в памяти процесса до истечения токена.
+    # Таблица опрашивается не на каждый запрос, а раз в sync_interval секунд
+    # и только на строки, отозванные с прошлой синхронизации (минус
+    # SYNC_OVERLAP), чтобы отзывы с других воркеров тоже попадали в кэш.
+    # Водяной знак по id не годится: id из последовательности фиксируются
+    # не по порядку.
+
+    def __init__(self, sync_interval=1.0, prune_interval=3600.0):
+        self.sync_interval = sync_interval
+        self.prune_interval = prune_interval
+        self._revoked = {}
+        self._synced_at = None
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+        self._pruner = None
+
+    def init_app(self, app, jwt):
+        self.sync_interval = app.config.get('JWT_REVOCATION_SYNC_SECONDS', self.sync_interval)
+        self.prune_interval = app.config.get('JWT_REVOCATION_PRUNE_SECONDS', self.prune_interval)
+        jwt.token_in_blocklist_loader(self.is_revoked)
+
+        if self._pruner is None and self.prune_interval:
+            self._pruner = threading.Thread(target=self._prune_loop, args=(app,), daemon=True)
+            self._pruner.start()
+
+    def is_revoked(self, jwt_header, jwt_payload):
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+        return jwt_payload['jti'] in self._revoked
+
+    def revoke(self, jwt_payload):
+        jti = jwt_payload['jti']
+        expires_at = token_expires_at(jwt_payload) or NEVER_EXPIRES
+
+        # Повторный отзыв того же токена ничего не меняет: INSERT ... ON CONFLICT DO NOTHING.
+        insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+        db.session.execute(insert(TokenBlackList.__table__).values(
+            jti=jti, revoked=True, expires_at=expires_at
+        ).on_conflict_do_nothing(index_elements=['jti']))
+        db.session.commit()
+
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def sync(self):
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            now = datetime.utcnow()
+            # Строки без expires_at остались от старой схемы: их токены давно истекли.
+            query = db.session.query(TokenBlackList.jti, TokenBlackList.expires_at).filter(
+                TokenBlackList.revoked.is_(True),
+                TokenBlackList.expires_at > now
+            )
+            if self._synced_at is not None:
+                query = query.filter(TokenBlackList.revoked_at > self._synced_at - SYNC_OVERLAP)
+
+            for jti, expires_at in query.all():
+                self._revoked[jti] = expires_at
+
+            self._synced_at = now
+
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def prune(self):
+        now = datetime.utcnow()
+        with self._lock:
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+        deleted = TokenBlackList.query.filter(
+            or_(TokenBlackList.expires_at.is_(None), TokenBlackList.expires_at <= now)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def _prune_loop(self, app):
+        while True:
+            time.sleep(self.prune_interval)
+            with app.app_context():
+                try:
+                    self.prune()
+                except Exception:
+                    db.session.rollback()
+
+
+store = RevocationStore()
+
+
+def init_app(app, jwt):
+    store.init_app(app, jwt)
@@ -0,0 +1,50 @@
+from sqlalchemy import func
+
+from models import Room
+from db import db
+
+ROOM_NUMBER_LENGTH = Room.__table__.c.number.type.length
+DEFAULT_ROOM_TYPE = 'General'
+
+
+def parse_rooms(value):
+    # Возвращает (номера кабинетов без повторов в порядке запроса, error).
+    if not isinstance(value, list):
+        return None, '{rooms} must be a list'
+
+    numbers = []
+    for number in value:
+        if not isinstance(number, (str, int)) or isinstance(number, bool):
+            return None, 'Room numbers must be strings'
+        number = str(number).strip()
+        if not number or len(number) > ROOM_NUMBER_LENGTH:
+            return None, f'Room numbers must be 1 to {ROOM_NUMBER_LENGTH} characters long'
+        if number not in numbers:
+            numbers.append(number)
+    return numbers, None
+
+
+def insert_rooms(hospital_id, numbers):
+    if numbers:
+        db.session.execute(Room.__table__.insert(), [
+            {'number': number, 'type': DEFAULT_ROOM_TYPE, 'hospitalId': hospital_id} for number in numbers
+        ])
+
+
+def sync_rooms(hospital_id, numbers):
+    # Сверяет сохранённые кабинеты с запрошенными: оставшиеся сохраняют id,
+    # лишние удаляются одним DELETE, новые добавляются одним INSERT.
+    # Транзакцию фиксирует вызывающий код. Возвращает (добавлено, удалено).
+    keep_ids = dict(db.session.query(Room.number, func.min(Room.id)).filter(
+        Room.hospitalId == hospital_id
+    ).group_by(Room.number).all())
+
+    wanted = set(numbers)
+    stale = Room.query.filter(
+        Room.hospitalId == hospital_id,
+        Room.id.notin_([room_id for number, room_id in keep_ids.items() if number in wanted])
+    ).delete(synchronize_session=False)
+
+    added = [number for number in numbers if number not in keep_ids]
+    insert_rooms(hospital_id, added)
+    return len(added), stale
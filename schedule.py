@@ -0,0 +1,208 @@
+import heapq
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import or_, tuple_
+
+from models import TimeTables, Hospital, Doctor
+from db import db
+
+TIMETABLE_FIELDS = ['hospitalId', 'doctorId', 'from', 'to', 'room']
+OVERLAP_CONSTRAINTS = ('ex_timetables_doctor_overlap', 'ex_timetables_room_overlap')
+
+
+def parse_time(value):
+    value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def check_range(from_time, to_time):
+    if to_time <= from_time:
+        return '{to} must be greater than {from}'
+
+    if (to_time - from_time).total_seconds() > 12 * 3600:
+        return 'The time difference cannot exceed 12 hours'
+
+    if from_time.minute % 30 != 0 or to_time.minute % 30 != 0:
+        return '{from} and {to} must be multiples of 30 minutes'
+
+    return None
+
+
+def parse_timetable_entry(data):
+    # Возвращает (entry, error) — те же проверки, что и у одиночного POST /api/Timetable.
+    if not isinstance(data, dict) or not all(key in data for key in TIMETABLE_FIELDS):
+        return None, 'Missing data'
+
+    try:
+        from_time = parse_time(data['from'])
+        to_time = parse_time(data['to'])
+    except (AttributeError, ValueError):
+        return None, 'Invalid date format. Use ISO8601 format.'
+
+    error = check_range(from_time, to_time)
+    if error:
+        return None, error
+
+    try:
+        hospital_id = int(data['hospitalId'])
+        doctor_id = int(data['doctorId'])
+    except (TypeError, ValueError):
+        return None, '{hospitalId} and {doctorId} must be integers'
+
+    return {
+        'hospitalId': hospital_id,
+        'doctorId': doctor_id,
+        'from_time': from_time,
+        'to_time': to_time,
+        'room': str(data['room'])
+    }, None
+
+
+def parse_template(template):
+    # Недельный шаблон: {'hospitalId', 'doctorId', 'room', 'weekly': [{'day': 1..7, 'from': 'HH:MM', 'to': 'HH:MM'}]},
+    # day — день недели по ISO, 1 — понедельник. Возвращает (template, error).
+    if not isinstance(template, dict) or not all(key in template for key in ['hospitalId', 'doctorId', 'room', 'weekly']):
+        return None, 'Missing data'
+
+    try:
+        hospital_id = int(template['hospitalId'])
+        doctor_id = int(template['doctorId'])
+    except (TypeError, ValueError):
+        return None, '{hospitalId} and {doctorId} must be integers'
+
+    if not isinstance(template['weekly'], list) or not all(isinstance(slot, dict) for slot in template['weekly']):
+        return None, 'Invalid template: {weekly} must be a list of slots'
+
+    slots = []
+    for slot in template['weekly']:
+        try:
+            day, from_clock, to_clock = int(slot['day']), time.fromisoformat(slot['from']), time.fromisoformat(slot['to'])
+        except (KeyError, TypeError, ValueError):
+            return None, 'Invalid weekly slot: expected day 1-7 and HH:MM times'
+
+        if day not in range(1, 8):
+            return None, 'day must be between 1 and 7'
+
+        error = check_range(datetime.combine(date.min, from_clock), datetime.combine(date.min, to_clock))
+        if error:
+            return None, error
+
+        slots.append((day, from_clock, to_clock))
+
+    return {'hospitalId': hospital_id, 'doctorId': doctor_id, 'room': str(template['room']), 'weekly': slots}, None
+
+
+def expand_templates(templates, from_date, to_date):
+    # Разворачивает разобранные шаблоны в записи расписания на каждый день диапазона.
+    entries = []
+    current = from_date
+    while current <= to_date:
+        weekday = current.isoweekday()
+        for template in templates:
+            for day, from_clock, to_clock in template['weekly']:
+                if day == weekday:
+                    entries.append({
+                        'hospitalId': template['hospitalId'],
+                        'doctorId': template['doctorId'],
+                        'from_time': datetime.combine(current, from_clock),
+                        'to_time': datetime.combine(current, to_clock),
+                        'room': template['room']
+                    })
+        current += timedelta(days=1)
+    return entries
+
+
+def overlapping_pairs(intervals):
+    # intervals: (key, start, end, ref). Сортировка по (key, start) и проход
+    # с кучей активных интервалов по времени окончания — каждая пара
+    # пересекающихся интервалов с одинаковым ключом находится за один проход.
+    active = []
+    current_key = None
+    for key, start, end, ref in sorted(intervals, key=lambda item: (item[0], item[1])):
+        if key != current_key:
+            active = []
+            current_key = key
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            yield key, ref, other
+        heapq.heappush(active, (end, id(ref), ref))
+
+
+def find_conflicts(entries, exclude_ids=()):
+    # Проверяет пачку записей друг с другом и с уже сохранёнными расписаниями:
+    # один запрос в БД на всю пачку. Возвращает {индекс записи: [ошибки]}.
+    if not entries:
+        return {}
+
+    window_from = min(entry['from_time'] for entry in entries)
+    window_to = max(entry['to_time'] for entry in entries)
+    doctor_ids = {entry['doctorId'] for entry in entries}
+    rooms = {(entry['hospitalId'], entry['room']) for entry in entries}
+
+    existing = db.session.query(
+        TimeTables.id, TimeTables.hospitalId, TimeTables.doctorId, TimeTables.from_time, TimeTables.to_time, TimeTables.room
+    ).filter(
+        TimeTables.from_time < window_to,
+        TimeTables.to_time > window_from,
+        or_(TimeTables.doctorId.in_(doctor_ids), tuple_(TimeTables.hospitalId, TimeTables.room).in_(rooms))
+    )
+    if exclude_ids:
+        existing = existing.filter(TimeTables.id.notin_(exclude_ids))
+
+    intervals = []
+    for row_id, hospital_id, doctor_id, from_time, to_time, room in existing:
+        intervals.append((('doctor', doctor_id), from_time, to_time, ('existing', row_id)))
+        intervals.append((('room', hospital_id, room), from_time, to_time, ('existing', row_id)))
+    for index, entry in enumerate(entries):
+        intervals.append((('doctor', entry['doctorId']), entry['from_time'], entry['to_time'], ('new', index)))
+        intervals.append((('room', entry['hospitalId'], entry['room']), entry['from_time'], entry['to_time'], ('new', index)))
+
+    conflicts = {}
+    for key, ref, other in overlapping_pairs(intervals):
+        for this, that in ((ref, other), (other, ref)):
+            if this[0] != 'new':
+                continue
+            what = 'Doctor' if key[0] == 'doctor' else 'Room'
+            target = f'timetable entry {that[1]}' if that[0] == 'existing' else f'item {that[1]} of this request'
+            conflicts.setdefault(this[1], []).append(f'{what} is already scheduled at this time ({target})')
+
+    return conflicts
+
+
+def is_overlap_conflict(error):
+    # Пересечение расписаний — только нарушение ограничений-исключений;
+    # остальные ошибки целостности (внешние ключи) — не 409.
+    message = str(error.orig)
+    return any(name in message for name in OVERLAP_CONSTRAINTS)
+
+
+def find_missing_references(entries):
+    # Проверяет больницы и врачей всей пачки двумя запросами.
+    # Возвращает {индекс записи: [ошибки]}, как и find_conflicts.
+    if not entries:
+        return {}
+
+    hospital_ids = {entry['hospitalId'] for entry in entries}
+    doctor_ids = {entry['doctorId'] for entry in entries}
+    hospitals = {value for (value,) in db.session.query(Hospital.id).filter(
+        Hospital.id.in_(hospital_ids), Hospital.is_deleted.isnot(True)
+    )}
+    doctors = {value for (value,) in db.session.query(Doctor.id).filter(Doctor.id.in_(doctor_ids))}
+
+    missing = {}
+    for index, entry in enumerate(entries):
+        if entry['hospitalId'] not in hospitals:
+            missing.setdefault(index, []).append('Hospital not found')
+        if entry['doctorId'] not in doctors:
+            missing.setdefault(index, []).append('Doctor not found')
+
+    return missing
+
+
+def insert_entries(entries, batch_size=1000):
+    # Многострочный INSERT порциями; транзакцию фиксирует вызывающий код.
+    for start in range(0, len(entries), batch_size):
+        db.session.execute(TimeTables.__table__.insert(), entries[start:start + batch_size])
@@ -0,0 +1,163 @@
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import AddConstraint, CreateSequence
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+
+from models import Appointment, TimeTables, ROLES_VERSION_SEQUENCE
+from db import db
+
+SLOT_CONSTRAINT = 'uq_appointments_timetable_time'
+
+
+def upgrade_schema():
+    # Доводит базу, созданную старой версией (db.create_all() не трогает
+    # существующие таблицы), до текущих моделей. Каждый шаг проверяет, сделан
+    # ли он уже, поэтому init-db можно запускать при каждом развёртывании.
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+        db.session.commit()
+
+    add_missing_columns()
+    ensure_appointment_constraints()
+    create_missing_indexes()
+    if dialect == 'postgresql':
+        ensure_exclusion_constraints()
+        ensure_roles_version_sequence()
+
+
+def column_default(column):
+    # Значение для уже существующих строк: то же, что ORM подставил бы при вставке.
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        # SQLAlchemy оборачивает функцию по умолчанию в вызов с контекстом выполнения.
+        return default.arg(None)
+    return default.arg if default.is_scalar else None
+
+
+def add_missing_columns():
+    # Колонка добавляется допускающей NULL и заполняется значением по умолчанию;
+    # NOT NULL затем ставится там, где это умеет ALTER TABLE (в SQLite — нет,
+    # значение по умолчанию всё равно подставляет ORM).
+    dialect = db.engine.dialect
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            column_type = column.type.compile(dialect=dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+            value = column_default(column)
+            if value is not None:
+                db.session.execute(table.update().values({column.name: value}))
+            if not column.nullable and dialect.name == 'postgresql':
+                db.session.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN "{column.name}" SET NOT NULL'))
+    db.session.commit()
+
+
+def ensure_appointment_constraints():
+    # Уникальный слот (timetable_id, time) и ON DELETE CASCADE по расписанию.
+    inspector = inspect(db.engine)
+    foreign_key = next(
+        key for key in inspector.get_foreign_keys('appointments') if key['referred_table'] == 'timetables'
+    )
+    has_cascade = (foreign_key.get('options') or {}).get('ondelete', '').upper() == 'CASCADE'
+    has_unique = SLOT_CONSTRAINT in {
+        item['name'] for item in inspector.get_unique_constraints('appointments') + inspector.get_indexes('appointments')
+    }
+    if has_unique and has_cascade:
+        return
+
+    if not has_unique:
+        table = Appointment.__table__
+        duplicates = db.session.execute(
+            select(func.count()).select_from(
+                select(table.c.timetable_id, table.c.time).group_by(table.c.timetable_id, table.c.time)
+                .having(func.count() > 1).subquery()
+            )
+        ).scalar()
+        if duplicates:
+            raise RuntimeError(
+                f'appointments has {duplicates} slots booked more than once; '
+                f'resolve them before adding {SLOT_CONSTRAINT}'
+            )
+
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite не меняет ограничения существующей таблицы — она пересоздаётся.
+        rebuild_appointments()
+        return
+
+    if not has_cascade:
+        db.session.execute(text(f'ALTER TABLE appointments DROP CONSTRAINT "{foreign_key["name"]}"'))
+        db.session.execute(text(
+            f'ALTER TABLE appointments ADD CONSTRAINT "{foreign_key["name"]}" FOREIGN KEY (timetable_id) '
+            'REFERENCES timetables (id) ON DELETE CASCADE'
+        ))
+    if not has_unique:
+        db.session.execute(text(
+            f'ALTER TABLE appointments ADD CONSTRAINT {SLOT_CONSTRAINT} UNIQUE (timetable_id, time)'
+        ))
+    db.session.commit()
+
+
+def rebuild_appointments():
+    db.session.commit()
+    table = Appointment.__table__
+    names = ', '.join(f'"{column.name}"' for column in table.columns)
+    with db.engine.connect() as connection:
+        # Внешние ключи выключаются на время копирования: осиротевшие записи,
+        # оставшиеся со времён без PRAGMA foreign_keys, переносятся как есть.
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.exec_driver_sql('BEGIN')
+        connection.exec_driver_sql('ALTER TABLE appointments RENAME TO appointments_old')
+        table.create(connection)
+        connection.exec_driver_sql(f'INSERT INTO appointments ({names}) SELECT {names} FROM appointments_old')
+        connection.exec_driver_sql('DROP TABLE appointments_old')
+        connection.commit()
+        connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+
+
+def create_missing_indexes():
+    # Индексы моделей, которых нет в базе; индексы только для PostgreSQL
+    # (ddl_if) на SQLite пропускаются.
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+
+
+def ensure_exclusion_constraints():
+    # Запрет пересечений записей расписания врача и кабинета (см. models.TimeTables).
+    for constraint in TimeTables.__table__.constraints:
+        if not isinstance(constraint, ExcludeConstraint):
+            continue
+        exists = db.session.execute(
+            text('SELECT 1 FROM pg_constraint WHERE conname = :name'), {'name': constraint.name}
+        ).scalar()
+        if not exists:
+            db.session.execute(AddConstraint(constraint))
+    db.session.commit()
+
+
+def ensure_roles_version_sequence():
+    # Метки, выданные до последовательности как max()+1, не должны повториться.
+    db.session.execute(CreateSequence(ROLES_VERSION_SEQUENCE, if_not_exists=True))
+    db.session.execute(text(
+        "SELECT setval('users_roles_version_seq', GREATEST("
+        "(SELECT COALESCE(MAX(roles_version), 0) FROM users), "
+        "(SELECT last_value FROM users_roles_version_seq), 1))"
+    ))
+    db.session.commit()
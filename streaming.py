@@ -0,0 +1,53 @@
+import json
+import zlib
+
+from flask import Response, request, stream_with_context
+
+STREAM_BATCH_SIZE = 500
+# Сжатый поток сбрасывается клиенту не реже, чем раз на столько байт входа.
+GZIP_FLUSH_BYTES = 64 * 1024
+
+
+def wants_ndjson():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def accepts_gzip():
+    return 'gzip' in request.accept_encodings
+
+
+def gzip_chunks(chunks, flush_bytes=GZIP_FLUSH_BYTES):
+    # Сжимает поток строк на лету; в памяти — только окно zlib и текущий кусок.
+    compressor = zlib.compressobj(wbits=31)
+    pending = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending += len(data)
+        output = compressor.compress(data)
+        if pending >= flush_bytes:
+            output += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if output:
+            yield output
+    yield compressor.flush()
+
+
+def stream_json(rows, serialize):
+    # Тело ответа собирается по мере чтения строк (yield_per -> серверный курсор),
+    # поэтому в памяти не оказывается весь результат запроса.
+    if wants_ndjson():
+        def generate_ndjson():
+            for row in rows:
+                yield json.dumps(serialize(row), ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+    def generate_array():
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(serialize(row), ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate_array()), mimetype='application/json')
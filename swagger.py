@@ -1,211 +1,704 @@
-from datetime import datetime
-
-from flask import Flask, request
+from flask import Flask
 from flask_restx import Api, Resource, fields
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from models import *
-from db import db, init_app
-import os
 
-app = Flask(__name__)
-api = Api(app, doc='/docs')
+# Документация Swagger (/docs, /swagger.json). Модуль импортируется только при
+# первом обращении к документации (см. app.py): flask_restx не загружается при
+# старте воркера. API обслуживают блюпринты основного приложения, поэтому
+# ресурсы здесь только описывают маршруты и форматы — обработчиков у них нет.
+api = Api(
+    doc='/docs',
+    title='Hospital API',
+    authorizations={'Bearer': {'type': 'apiKey', 'in': 'header', 'name': 'Authorization'}},
+    security='Bearer'
+)
+
+PAGE_PARAMS = {
+    'from': 'Смещение (устаревшее, вместо него after)',
+    'count': 'Размер страницы, от 1 до 100',
+    'after': 'Курсор следующей страницы'
+}
+RANGE_PARAMS = {
+    'from': 'Начало окна (ISO8601)',
+    'to': 'Конец окна (ISO8601)',
+    'format': 'ndjson — ответ потоком NDJSON вместо JSON-массива'
+}
+FEED_PARAMS = {
+    'jwt': 'Токен ленты (POST /api/Authentication/FeedToken) для подписки календаря',
+    'syncToken': 'X-Sync-Token предыдущего ответа: только изменения с того момента',
+    'since': 'Только изменения после этого времени (ISO8601)'
+}
+HISTORY_FILTER_PARAMS = {
+    'dateFrom': 'Не раньше даты (ISO8601)',
+    'dateTo': 'Не позже даты (ISO8601)',
+    'hospitalId': 'ID больницы',
+    'doctorId': 'ID доктора'
+}
+
+message_model = api.model('Message', {
+    'message': fields.String(description='Результат операции'),
+})
 
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
-jwt = JWTManager(app)
+error_model = api.model('Error', {
+    'error': fields.String(description='Описание ошибки'),
+    'details': fields.String(description='Подробности ошибки базы данных'),
+})
 
-user_model = api.model('User', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор пользователя'),
+sign_up_model = api.model('SignUp', {
     'lastName': fields.String(required=True, description='Фамилия пользователя'),
     'firstName': fields.String(required=True, description='Имя пользователя'),
     'username': fields.String(required=True, description='Логин пользователя'),
+    'password': fields.String(required=True, description='Пароль'),
+})
+
+sign_in_model = api.model('SignIn', {
+    'username': fields.String(required=True, description='Логин пользователя'),
+    'password': fields.String(required=True, description='Пароль'),
+})
+
+tokens_model = api.model('Tokens', {
+    'access_token': fields.String(description='Токен доступа'),
+    'refresh_token': fields.String(description='Токен обновления'),
+})
+
+feed_token_model = api.model('FeedToken', {
+    'feed_token': fields.String(description='Долгоживущий токен, действующий только для .ics-лент'),
+})
+
+account_model = api.model('Account', {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор пользователя'),
+    'lastName': fields.String(description='Фамилия пользователя'),
+    'firstName': fields.String(description='Имя пользователя'),
+    'username': fields.String(description='Логин пользователя'),
+})
+
+account_list_item_model = api.inherit('AccountListItem', account_model, {
     'is_admin': fields.Boolean(description='Администраторский доступ'),
 })
 
+account_update_model = api.model('AccountUpdate', {
+    'lastName': fields.String(description='Фамилия пользователя'),
+    'firstName': fields.String(description='Имя пользователя'),
+    'password': fields.String(description='Новый пароль'),
+})
 
-@api.route('/api/Authentication/SignUp')
-class Register(Resource):
-    @api.expect(user_model, validate=True)
-    @api.doc('register_user')
-    def post(self):
-        """Регистрация нового пользователя"""
-        data = request.get_json()
-        if not data or not all(key in data for key in ['lastName', 'firstName', 'username', 'password']):
-            api.abort(400, "Отсутствуют обязательные данные")
+account_create_model = api.model('AccountCreate', {
+    'lastName': fields.String(required=True, description='Фамилия пользователя'),
+    'firstName': fields.String(required=True, description='Имя пользователя'),
+    'username': fields.String(required=True, description='Логин пользователя'),
+    'password': fields.String(required=True, description='Пароль'),
+    'roles': fields.List(fields.String, required=True, description='Роли: admin, manager, doctor'),
+})
+
+account_admin_update_model = api.model('AccountAdminUpdate', {
+    'lastName': fields.String(description='Фамилия пользователя'),
+    'firstName': fields.String(description='Имя пользователя'),
+    'username': fields.String(description='Логин пользователя'),
+    'password': fields.String(description='Новый пароль'),
+    'roles': fields.List(fields.String, description='Роли: admin, manager, doctor'),
+})
 
-        if User.query.filter_by(username=data['username']).first():
-            api.abort(400, "Пользователь уже существует")
+import_error_model = api.model('AccountImportError', {
+    'line': fields.Integer(description='Номер строки во входных данных'),
+    'username': fields.String(description='Логин из строки'),
+    'error': fields.String(description='Причина отказа'),
+})
 
-        new_user = User(
-            lastName=data['lastName'],
-            firstName=data['firstName'],
-            username=data['username']
-        )
-        new_user.set_password(data['password'])
+import_report_model = api.model('AccountImportReport', {
+    'created': fields.Integer(description='Создано учётных записей'),
+    'errors': fields.List(fields.Nested(import_error_model)),
+})
 
-        try:
-            db.session.add(new_user)
-            db.session.commit()
-        except Exception as e:
-            api.abort(500, f"Ошибка базы данных: {str(e)}")
+doctor_model = api.model('Doctor', {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор доктора'),
+    'fullName': fields.String(description='ФИО доктора'),
+    'specialization': fields.String(description='Специализация'),
+})
 
-        return {"message": "Пользователь успешно создан"}, 201
+doctor_page_model = api.model('DoctorPage', {
+    'doctors': fields.List(fields.Nested(doctor_model)),
+    'next': fields.String(description='Курсор следующей страницы или null'),
+})
 
+doctor_detail_model = api.model('DoctorDetail', {
+    'doctor': fields.Nested(api.inherit('DoctorWithPhone', doctor_model, {
+        'phone': fields.String(description='Телефон'),
+    })),
+})
 
-@api.route('/api/Authentication/SignIn')
-class Login(Resource):
-    @api.doc('login_user')
-    def post(self):
-        """Авторизация пользователя"""
-        data = request.get_json()
-        if not data or not all(key in data for key in ['username', 'password']):
-            api.abort(400, "Отсутствуют обязательные данные")
+room_model = api.model('Room', {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор кабинета'),
+    'number': fields.String(description='Номер кабинета'),
+    'type': fields.String(description='Тип кабинета'),
+})
+
+hospital_model = api.model('Hospital', {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор больницы'),
+    'name': fields.String(description='Название больницы'),
+    'rooms': fields.List(fields.Nested(room_model), description='Только с expand=rooms'),
+    'timetableCount': fields.Integer(description='Только с expand=timetableCount'),
+})
 
-        user = User.query.filter_by(username=data['username']).first()
-        if not user or not user.check_password(data['password']):
-            api.abort(401, "Неверный логин или пароль")
+hospital_page_model = api.model('HospitalPage', {
+    'hospitals': fields.List(fields.Nested(hospital_model)),
+    'next': fields.String(description='Курсор следующей страницы или null'),
+})
 
-        access_token = create_access_token(identity=user.username)
-        return {"access_token": access_token}, 200
+hospital_detail_model = api.model('HospitalDetail', {
+    'hospital': fields.Nested(api.model('HospitalSummary', {
+        'id': fields.Integer(description='Уникальный идентификатор больницы'),
+        'name': fields.String(description='Название больницы'),
+    })),
+})
 
-history_model = api.model('History', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор записи'),
-    'date': fields.DateTime(required=True, description='Дата истории'),
+hospital_rooms_model = api.model('HospitalRooms', {
+    'rooms': fields.List(fields.Nested(room_model)),
+})
+
+hospital_input_model = api.model('HospitalInput', {
+    'name': fields.String(required=True, description='Название больницы'),
+    'address': fields.String(required=True, description='Адрес'),
+    'contactPhone': fields.String(required=True, description='Контактный телефон'),
+    'rooms': fields.List(fields.String, required=True, description='Номера кабинетов'),
+})
+
+hospital_created_model = api.inherit('HospitalCreated', message_model, {
+    'id': fields.Integer(description='ID созданной больницы'),
+})
+
+timetable_input_model = api.model('TimetableInput', {
     'hospitalId': fields.Integer(required=True, description='ID больницы'),
     'doctorId': fields.Integer(required=True, description='ID доктора'),
+    'from': fields.DateTime(required=True, description='Начало приёма (ISO8601, кратно 30 минутам)'),
+    'to': fields.DateTime(required=True, description='Конец приёма (ISO8601, не позже чем через 12 часов)'),
     'room': fields.String(required=True, description='Кабинет'),
-    'data': fields.String(required=True, description='Данные истории'),
 })
 
+timetable_model = api.inherit('Timetable', timetable_input_model, {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор записи расписания'),
+})
 
-@api.route('/api/History/Account/<int:id>')
-class AccountHistory(Resource):
-    @api.marshal_list_with(history_model)
-    @jwt_required()
-    def get(self, id):
-        """Получение истории по ID пациента"""
-        current_user = get_jwt_identity()
-        if 'doctor' not in current_user['roles'] and current_user['id'] != id:
-            api.abort(403, "Доступ запрещен: только врачи или владелец учетной записи могут получить историю")
+timetable_day_entry_model = api.inherit('TimetableDayEntry', timetable_model, {
+    'slots': fields.Integer(description='Слотов по 30 минут'),
+    'booked': fields.Integer(description='Занято слотов'),
+    'free': fields.Integer(description='Свободно слотов'),
+})
 
-        history_records = History.query.filter_by(pacient_id=id).all()
-        return history_records, 200
+timetable_day_model = api.model('TimetableDay', {
+    'date': fields.Date(description='День'),
+    'entries': fields.List(fields.Nested(timetable_day_entry_model)),
+})
 
-hospital_model = api.model('Hospital', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор больницы'),
-    'name': fields.String(required=True, description='Название больницы'),
+batch_item_errors_model = api.model('BatchItemErrors', {
+    'index': fields.Integer(description='Номер элемента во входном массиве'),
+    'errors': fields.List(fields.String),
 })
 
-room_model = api.model('Room', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор комнаты'),
-    'number': fields.String(required=True, description='Номер комнаты'),
-    'type': fields.String(description='Тип комнаты'),
+batch_created_model = api.inherit('BatchCreated', message_model, {
+    'count': fields.Integer(description='Создано записей расписания'),
+})
+
+weekly_slot_model = api.model('WeeklySlot', {
+    'day': fields.Integer(required=True, description='День недели по ISO, 1 — понедельник'),
+    'from': fields.String(required=True, description='Начало, HH:MM'),
+    'to': fields.String(required=True, description='Конец, HH:MM'),
+})
+
+template_model = api.model('TimetableTemplate', {
+    'hospitalId': fields.Integer(required=True, description='ID больницы'),
+    'doctorId': fields.Integer(required=True, description='ID доктора'),
+    'room': fields.String(required=True, description='Кабинет'),
+    'weekly': fields.List(fields.Nested(weekly_slot_model), required=True),
+})
+
+generate_input_model = api.model('TimetableGenerate', {
+    'from': fields.Date(required=True, description='Первый день (YYYY-MM-DD)'),
+    'to': fields.Date(required=True, description='Последний день, не больше года от from'),
+    'templates': fields.List(fields.Nested(template_model), required=True),
+    'dryRun': fields.Boolean(description='Только посчитать записи и конфликты'),
+})
+
+job_model = api.model('Job', {
+    'id': fields.String(description='ID фоновой задачи'),
+    'kind': fields.String(description='Вид задачи'),
+    'status': fields.String(description='pending, running, done или failed'),
+    'total': fields.Integer(description='Всего строк'),
+    'processed': fields.Integer(description='Обработано строк'),
+    'error': fields.String(description='Ошибка, если задача упала'),
+    'createdAt': fields.DateTime(description='Создана'),
+    'finishedAt': fields.DateTime(description='Завершена'),
+})
+
+day_view_metrics_model = api.model('DayViewMetrics', {
+    'hits': fields.Integer,
+    'misses': fields.Integer,
+    'hitRate': fields.Float,
+    'views': fields.Integer,
+    'ttlSeconds': fields.Float,
+    'maxViewAgeSeconds': fields.Float,
+    'avgServedAgeSeconds': fields.Float,
+    'maxServedAgeSeconds': fields.Float,
+})
+
+free_slot_model = api.model('FreeSlot', {
+    'timetableId': fields.Integer(description='ID записи расписания'),
+    'hospitalId': fields.Integer(description='ID больницы'),
+    'doctorId': fields.Integer(description='ID доктора'),
+    'room': fields.String(description='Кабинет'),
+    'time': fields.DateTime(description='Начало слота'),
+})
+
+appointment_input_model = api.model('AppointmentInput', {
+    'time': fields.DateTime(required=True, description='Начало слота (ISO8601)'),
 })
 
+appointment_created_model = api.inherit('AppointmentCreated', message_model, {
+    'appointment_id': fields.Integer(description='ID записи на приём'),
+})
+
+history_input_model = api.model('HistoryInput', {
+    'date': fields.DateTime(required=True, description='Дата (ISO8601)'),
+    'pacientId': fields.Integer(required=True, description='ID пациента'),
+    'hospitalId': fields.Integer(required=True, description='ID больницы'),
+    'doctorId': fields.Integer(required=True, description='ID доктора'),
+    'room': fields.String(required=True, description='Кабинет'),
+    'data': fields.String(required=True, description='Текст записи'),
+})
+
+history_model = api.inherit('History', history_input_model, {
+    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор записи'),
+})
+
+history_search_result_model = api.inherit('HistorySearchResult', history_model, {
+    'snippet': fields.String(description='Фрагмент текста с совпадением'),
+    'rank': fields.Float(description='Релевантность'),
+})
+
+history_batch_item_model = api.inherit('HistoryBatchItem', history_input_model, {
+    'externalId': fields.String(description='Ключ записи в источнике: повторная загрузка не создаёт дубликат'),
+})
+
+history_ingest_result_model = api.model('HistoryIngestResult', {
+    'index': fields.Integer(description='Номер записи во входных данных'),
+    'status': fields.String(description='created, duplicate или error'),
+    'id': fields.Integer(description='ID записи истории'),
+    'key': fields.String(description='Ключ идемпотентности'),
+    'error': fields.String(description='Причина отказа'),
+})
+
+history_ingest_report_model = api.model('HistoryIngestReport', {
+    'created': fields.Integer,
+    'duplicates': fields.Integer,
+    'errors': fields.Integer,
+    'results': fields.List(fields.Nested(history_ingest_result_model)),
+})
+
+history_created_model = api.inherit('HistoryCreated', message_model, {
+    'history_id': fields.Integer(description='ID записи истории'),
+})
+
+
+@api.route('/api/Authentication/SignUp')
+class SignUp(Resource):
+    @api.doc(security=[])
+    @api.expect(sign_up_model)
+    @api.response(201, 'Пользователь создан', message_model)
+    @api.response(400, 'Нет данных или логин занят', error_model)
+    def post(self):
+        """Регистрация нового пользователя"""
+
+
+@api.route('/api/Authentication/SignIn')
+class SignIn(Resource):
+    @api.doc(security=[])
+    @api.expect(sign_in_model)
+    @api.response(200, 'Токены выданы', tokens_model)
+    @api.response(401, 'Неверный логин или пароль', error_model)
+    def post(self):
+        """Авторизация пользователя"""
+
+
+@api.route('/api/Authentication/SignOut')
+class SignOut(Resource):
+    @api.response(200, 'Токен отозван', message_model)
+    def put(self):
+        """Выход: отзыв текущего токена доступа"""
+
+
+@api.route('/api/Authentication/Validate')
+class Validate(Resource):
+    @api.response(200, 'Токен действителен')
+    def get(self):
+        """Проверка токена доступа и его содержимого"""
+
+
+@api.route('/api/Authentication/Refresh')
+class Refresh(Resource):
+    @api.doc(description='Передаётся токен обновления, а не токен доступа.')
+    @api.response(200, 'Новая пара токенов', tokens_model)
+    def post(self):
+        """Обновление пары токенов"""
+
+
+@api.route('/api/Authentication/FeedToken')
+class FeedToken(Resource):
+    @api.response(201, 'Токен ленты выдан', feed_token_model)
+    def post(self):
+        """Токен для URL подписки на .ics-ленту"""
+
+    @api.expect(feed_token_model)
+    @api.response(200, 'Токен ленты отозван', message_model)
+    @api.response(400, 'Не токен ленты текущего пользователя', error_model)
+    def delete(self):
+        """Отзыв токена ленты"""
+
+
+@api.route('/api/Accounts/Me')
+class AccountMe(Resource):
+    @api.response(200, 'Текущий пользователь', account_model)
+    def get(self):
+        """Данные текущего пользователя"""
+
+
+@api.route('/api/Accounts/Update')
+class AccountUpdate(Resource):
+    @api.expect(account_update_model)
+    @api.response(200, 'Учётная запись обновлена', message_model)
+    def put(self):
+        """Изменение своей учётной записи"""
+
+
+@api.route('/api/Accounts')
+class AccountList(Resource):
+    @api.doc(params=PAGE_PARAMS)
+    @api.response(200, 'Страница учётных записей; курсор следующей — в заголовке X-Next-Cursor',
+                  [account_list_item_model])
+    @api.response(403, 'Только администраторы', error_model)
+    def get(self):
+        """Список учётных записей"""
+
+    @api.expect(account_create_model)
+    @api.response(201, 'Учётная запись создана', message_model)
+    @api.response(403, 'Только администраторы', error_model)
+    def post(self):
+        """Создание учётной записи администратором"""
+
+
+@api.route('/api/Accounts/Import')
+class AccountImport(Resource):
+    @api.doc(description='Тело — NDJSON или CSV (Content-Type: text/csv) с полями lastName, firstName, '
+                         'username, password, roles.', params={'batchSize': 'Строк в одной транзакции'})
+    @api.response(200, 'Отчёт об импорте', import_report_model)
+    @api.response(403, 'Только администраторы', error_model)
+    def post(self):
+        """Массовый импорт учётных записей"""
+
+
+@api.route('/api/Accounts/<int:id>')
+class Account(Resource):
+    @api.expect(account_admin_update_model)
+    @api.response(200, 'Учётная запись обновлена', message_model)
+    @api.response(404, 'Пользователь не найден', error_model)
+    def put(self, id):
+        """Изменение учётной записи администратором"""
+
+    @api.response(200, 'Учётная запись удалена', message_model)
+    @api.response(404, 'Пользователь не найден', error_model)
+    def delete(self, id):
+        """Мягкое удаление учётной записи"""
+
+
+@api.route('/api/Doctors')
+class DoctorList(Resource):
+    @api.doc(params=dict(PAGE_PARAMS, nameFilter='Поиск по ФИО и специализации, не короче 3 символов'))
+    @api.response(200, 'Страница докторов', doctor_page_model)
+    @api.response(400, 'nameFilter короче 3 символов или неверный курсор', error_model)
+    def get(self):
+        """Список докторов"""
+
+
+@api.route('/api/Doctors/<int:id>')
+class DoctorDetail(Resource):
+    @api.response(200, 'Доктор (с ETag и Last-Modified)', doctor_detail_model)
+    @api.response(404, 'Доктор не найден', error_model)
+    def get(self, id):
+        """Доктор по ID"""
+
+
 @api.route('/api/Hospitals')
 class HospitalList(Resource):
-    @api.marshal_list_with(hospital_model)
-    @jwt_required()
+    @api.doc(params=dict(PAGE_PARAMS, expand='rooms, timetableCount — через запятую'))
+    @api.response(200, 'Страница больниц (с ETag)', hospital_page_model)
     def get(self):
-        """Получение списка больниц"""
-        from_param = request.args.get('from', default=0, type=int)
-        count_param = request.args.get('count', default=10, type=int)
-        hospitals = Hospital.query.offset(from_param).limit(count_param).all()
-        return hospitals, 200
+        """Список больниц"""
 
-@api.route('/api/Hospitals')
-class CreateHospital(Resource):
-    @api.expect(hospital_model)
-    @jwt_required()
+    @api.expect(hospital_input_model)
+    @api.response(201, 'Больница создана', hospital_created_model)
+    @api.response(403, 'Только администраторы', error_model)
     def post(self):
         """Создание новой больницы"""
-        current_user = get_jwt_identity()
 
-        if not current_user.is_admin:
-            api.abort(403, "Доступ запрещен: только администраторы")
 
-        data = request.get_json()
+@api.route('/api/Hospitals/<int:id>')
+class HospitalDetail(Resource):
+    @api.response(200, 'Больница (с ETag и Last-Modified)', hospital_detail_model)
+    @api.response(404, 'Больница не найдена', error_model)
+    def get(self, id):
+        """Больница по ID"""
 
-        if not data or not all(key in data for key in ['name', 'address', 'contactPhone', 'rooms']):
-            api.abort(400, "Отсутствуют обязательные данные")
+    @api.expect(hospital_input_model)
+    @api.response(200, 'Больница обновлена', message_model)
+    @api.response(404, 'Больница не найдена', error_model)
+    def put(self, id):
+        """Изменение больницы и её кабинетов"""
 
-        new_hospital = Hospital(
-            name=data['name'],
-            address=data['address'],
-            contactPhone=data['contactPhone']
-        )
+    @api.response(200, 'Больница удалена', message_model)
+    @api.response(404, 'Больница не найдена', error_model)
+    def delete(self, id):
+        """Мягкое удаление больницы"""
 
-        try:
-            db.session.add(new_hospital)
-            db.session.commit()
-        except Exception as e:
-            api.abort(500, f"Ошибка базы данных: {str(e)}")
 
-        return {"message": "Больница успешно создана", "id": new_hospital.id}, 201
+@api.route('/api/Hospitals/<int:id>/Rooms')
+class HospitalRooms(Resource):
+    @api.response(200, 'Кабинеты больницы', hospital_rooms_model)
+    @api.response(404, 'Больница не найдена', error_model)
+    def get(self, id):
+        """Кабинеты больницы"""
 
-timetable_model = api.model('Timetable', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор расписания'),
-    'hospital_id': fields.Integer(required=True, description='ID больницы'),
-    'doctor_id': fields.Integer(required=True, description='ID доктора'),
-    'from_time': fields.DateTime(required=True, description='Начало работы'),
-    'to_time': fields.DateTime(required=True, description='Конец работы'),
-    'room': fields.String(required=True, description='Комната'),
-})
-
-appointment_model = api.model('Appointment', {
-    'id': fields.Integer(readOnly=True, description='Уникальный идентификатор записи'),
-    'timetable_id': fields.Integer(required=True, description='ID расписания'),
-    'user_id': fields.Integer(required=True, description='ID пользователя'),
-    'time': fields.DateTime(required=True, description='Время записи'),
-})
 
 @api.route('/api/Timetable')
-class CreateTimetable(Resource):
-    @api.expect(timetable_model)
-    @jwt_required()
+class TimetableCreate(Resource):
+    @api.expect(timetable_input_model)
+    @api.response(201, 'Запись расписания создана', message_model)
+    @api.response(409, 'Доктор или кабинет уже заняты в это время', error_model)
     def post(self):
         """Создание новой записи в расписании"""
-        current_user = get_jwt_identity()
 
-        if not current_user.is_admin and not current_user.is_manager:
-            api.abort(403, "Доступ запрещен: только администраторы и менеджеры")
 
-        data = request.get_json()
+@api.route('/api/Timetable/Batch')
+class TimetableBatch(Resource):
+    @api.expect([timetable_input_model])
+    @api.response(201, 'Записи созданы', batch_created_model)
+    @api.response(400, 'Ошибки по элементам (items)', error_model)
+    @api.response(409, 'Конфликты по элементам (items)', error_model)
+    def post(self):
+        """Создание нескольких записей расписания одной транзакцией"""
+
+
+@api.route('/api/Timetable/Generate')
+class TimetableGenerate(Resource):
+    @api.expect(generate_input_model)
+    @api.doc(params={'dryRun': 'true — только посчитать записи и конфликты'})
+    @api.response(201, 'Записи созданы', batch_created_model)
+    @api.response(409, 'Конфликты сгенерированных записей (items)', error_model)
+    def post(self):
+        """Генерация расписания по недельным шаблонам"""
+
 
-        if not data or not all(key in data for key in ['hospital_id', 'doctor_id', 'from_time', 'to_time', 'room']):
-            api.abort(400, "Отсутствуют обязательные данные")
+@api.route('/api/Timetable/<int:id>')
+class Timetable(Resource):
+    @api.expect(timetable_input_model)
+    @api.response(200, 'Запись расписания обновлена', message_model)
+    @api.response(400, 'На запись уже есть талоны', error_model)
+    @api.response(409, 'Доктор или кабинет уже заняты в это время', error_model)
+    def put(self, id):
+        """Изменение записи расписания"""
 
-        new_entry = TimeTables(
-            hospital_id=data['hospital_id'],
-            doctor_id=data['doctor_id'],
-            from_time=datetime.fromisoformat(data['from_time']),
-            to_time=datetime.fromisoformat(data['to_time']),
-            room=data['room']
-        )
+    @api.response(204, 'Запись расписания удалена')
+    def delete(self, id):
+        """Удаление записи расписания"""
 
-        try:
-            db.session.add(new_entry)
-            db.session.commit()
-        except Exception as e:
-            api.abort(500, f"Ошибка базы данных: {str(e)}")
 
-        return {"message": "Запись в расписании создана успешно"}, 201
+@api.route('/api/Timetable/Doctor/<int:doctor_id>')
+class DoctorTimetable(Resource):
+    @api.doc(params=RANGE_PARAMS)
+    @api.response(200, 'Записи расписания в окне, потоком (с ETag)', [timetable_model])
+    def get(self, doctor_id):
+        """Расписание доктора"""
+
+    @api.response(202, 'Удаление запущено фоновой задачей (Location)', job_model)
+    @api.response(204, 'Расписание доктора удалено')
+    def delete(self, doctor_id):
+        """Удаление всего расписания доктора"""
+
 
 @api.route('/api/Timetable/Hospital/<int:hospital_id>')
-class GetHospitalTimetable(Resource):
-    @api.marshal_list_with(timetable_model)
-    @jwt_required()
+class HospitalTimetable(Resource):
+    @api.doc(params=RANGE_PARAMS)
+    @api.response(200, 'Записи расписания в окне, потоком (с ETag)', [timetable_model])
     def get(self, hospital_id):
-        """Получение расписания для конкретной больницы"""
-        timetable_entries = TimeTables.query.filter_by(hospital_id=hospital_id).all()
-        return timetable_entries, 200
+        """Расписание больницы"""
+
+    @api.response(202, 'Удаление запущено фоновой задачей (Location)', job_model)
+    @api.response(204, 'Расписание больницы удалено')
+    def delete(self, hospital_id):
+        """Удаление всего расписания больницы"""
+
+
+@api.route('/api/Timetable/Hospital/<int:hospital_id>/Room/<string:room>')
+class RoomTimetable(Resource):
+    @api.doc(params=RANGE_PARAMS)
+    @api.response(200, 'Записи расписания в окне, потоком (с ETag)', [timetable_model])
+    @api.response(403, 'Только администраторы, менеджеры и доктора', error_model)
+    def get(self, hospital_id, room):
+        """Расписание кабинета"""
+
+
+@api.route('/api/Timetable/Doctor/<int:doctor_id>.ics')
+class DoctorFeed(Resource):
+    @api.doc(params=FEED_PARAMS, produces=['text/calendar'])
+    @api.response(200, 'Лента iCalendar; токен следующей синхронизации — в заголовке X-Sync-Token')
+    @api.response(403, 'Только администраторы, менеджеры и доктора', error_model)
+    @api.response(410, 'Токен синхронизации устарел', error_model)
+    def get(self, doctor_id):
+        """Календарь доктора (.ics)"""
+
+
+@api.route('/api/Timetable/Hospital/<int:hospital_id>/Room/<string:room>.ics')
+class RoomFeed(Resource):
+    @api.doc(params=FEED_PARAMS, produces=['text/calendar'])
+    @api.response(200, 'Лента iCalendar; токен следующей синхронизации — в заголовке X-Sync-Token')
+    @api.response(403, 'Только администраторы, менеджеры и доктора', error_model)
+    @api.response(410, 'Токен синхронизации устарел', error_model)
+    def get(self, hospital_id, room):
+        """Календарь кабинета (.ics)"""
+
+
+@api.route('/api/Timetable/Hospital/<int:hospital_id>/Day/<string:day>')
+class HospitalDay(Resource):
+    @api.response(200, 'Расписание больницы на день со свободными слотами', timetable_day_model)
+    def get(self, hospital_id, day):
+        """Расписание больницы на день (YYYY-MM-DD)"""
+
+
+@api.route('/api/Timetable/Doctor/<int:doctor_id>/Day/<string:day>')
+class DoctorDay(Resource):
+    @api.response(200, 'Расписание доктора на день со свободными слотами', timetable_day_model)
+    def get(self, doctor_id, day):
+        """Расписание доктора на день (YYYY-MM-DD)"""
+
+
+@api.route('/api/Timetable/Metrics/DayViews')
+class DayViewMetrics(Resource):
+    @api.response(200, 'Метрики кэша дневных представлений', day_view_metrics_model)
+    @api.response(403, 'Только администраторы', error_model)
+    def get(self):
+        """Метрики кэша дневных представлений"""
+
+
+@api.route('/api/Timetable/Jobs/<string:job_id>')
+class TimetableJob(Resource):
+    @api.response(200, 'Состояние фоновой задачи', job_model)
+    @api.response(404, 'Задача не найдена', error_model)
+    def get(self, job_id):
+        """Состояние фоновой задачи удаления расписания"""
+
+
+@api.route('/api/Timetable/<int:id>/Appointments')
+class TimetableAppointments(Resource):
+    @api.response(200, 'Свободные слоты (ISO8601)', fields.List(fields.DateTime))
+    @api.response(404, 'Запись расписания не найдена', error_model)
+    def get(self, id):
+        """Свободные слоты записи расписания"""
+
+    @api.expect(appointment_input_model)
+    @api.response(201, 'Запись на приём создана', appointment_created_model)
+    @api.response(409, 'Слот уже занят', error_model)
+    def post(self, id):
+        """Запись на приём"""
+
+
+@api.route('/api/Timetable/Appointments')
+class AppointmentsBatch(Resource):
+    @api.doc(params={'ids': 'ID записей расписания через запятую'})
+    @api.response(200, 'Свободные слоты по ID записи расписания', fields.Raw)
+    def get(self):
+        """Свободные слоты нескольких записей расписания"""
+
 
+@api.route('/api/Timetable/Search')
+class SlotSearch(Resource):
+    @api.doc(params={
+        'from': 'Начало окна (ISO8601)', 'to': 'Конец окна (ISO8601)', 'limit': 'Сколько слотов, 1-100',
+        'specialization': 'Специализация доктора (точное совпадение без учёта регистра)',
+        'hospitalId': 'ID больницы'
+    })
+    @api.response(200, 'Ближайшие свободные слоты', [free_slot_model])
+    def get(self):
+        """Поиск ближайших свободных слотов"""
+
+
+@api.route('/api/Appointment/<int:id>')
+class Appointment(Resource):
+    @api.response(204, 'Запись на приём отменена')
+    @api.response(403, 'Можно отменить только свою запись', error_model)
+    def delete(self, id):
+        """Отмена записи на приём"""
+
+
+@api.route('/api/History/Account/<int:id>')
+class AccountHistory(Resource):
+    @api.doc(params=dict(PAGE_PARAMS, includeData='true — вместе с текстом записей', **HISTORY_FILTER_PARAMS))
+    @api.response(200, 'История пациента, новые первыми; курсор — в заголовке X-Next-Cursor', [history_model])
+    @api.response(403, 'Только доктора или владелец учётной записи', error_model)
+    def get(self, id):
+        """Получение истории по ID пациента"""
+
+
+@api.route('/api/History/Search')
+class HistorySearch(Resource):
+    @api.doc(params=dict(PAGE_PARAMS, q='Поисковый запрос', pacientId='ID пациента', **HISTORY_FILTER_PARAMS))
+    @api.response(200, 'Найденные записи по релевантности', [history_search_result_model])
+    def get(self):
+        """Полнотекстовый поиск по истории"""
+
+
+@api.route('/api/History/Export')
+class HistoryExport(Resource):
+    @api.doc(params=dict(
+        HISTORY_FILTER_PARAMS, format='ndjson или csv', pacientId='ID пациента',
+        afterId='Продолжить выгрузку после записи с этим ID'
+    ), produces=['application/x-ndjson', 'text/csv'])
+    @api.response(200, 'Выгрузка потоком; с Accept-Encoding: gzip — сжатая')
+    def get(self):
+        """Выгрузка истории"""
+
+
+@api.route('/api/History/<int:id>')
+class HistoryRecord(Resource):
+    @api.response(200, 'Запись истории', history_model)
+    @api.response(404, 'Запись не найдена', error_model)
+    def get(self, id):
+        """Запись истории по ID"""
+
+    @api.expect(history_input_model)
+    @api.response(200, 'Запись обновлена', message_model)
+    @api.response(403, 'Только администраторы, менеджеры и доктора', error_model)
+    def put(self, id):
+        """Изменение записи истории"""
+
+
+@api.route('/api/History')
+class HistoryCreate(Resource):
+    @api.expect(history_input_model)
+    @api.response(201, 'Запись создана', history_created_model)
+    @api.response(403, 'Только администраторы, менеджеры и доктора', error_model)
+    def post(self):
+        """Создание записи истории"""
+
+
+@api.route('/api/History/Batch')
+class HistoryBatch(Resource):
+    @api.doc(description='Тело — JSON-массив или NDJSON (Content-Type: application/x-ndjson).',
+             params={'batchSize': 'Записей в одной транзакции'})
+    @api.expect([history_batch_item_model])
+    @api.response(200, 'Отчёт о загрузке', history_ingest_report_model)
+    def post(self):
+        """Пакетная загрузка истории"""
 
-init_app(app)
-with app.app_context():
-    db.create_all()
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+def create_docs_app():
+    # Отдельное приложение только для страниц документации; основное
+    # приложение передаёт ему запросы к /docs, /swagger.json и /swaggerui.
+    app = Flask(__name__)
+    api.init_app(app)
+    return app
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Дешёвый хеш: тестам не нужна стоимость scrypt.
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+
+@pytest.fixture(scope='session')
+def app():
+    # Одно приложение на временной SQLite на весь прогон: кэши расписаний,
+    # справочник больниц и отзывы токенов — синглтоны модулей.
+    from app import create_app
+    from db import db
+    from models import User
+
+    database = os.path.join(tempfile.mkdtemp(), 'test.db')
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret-key-of-at-least-32-bytes',
+        'JWT_SECRET_KEY': 'test-secret-key-of-at-least-32-bytes',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database,
+        'JWT_REVOCATION_PRUNE_SECONDS': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        admin = User(lastName='Admin', firstName='Admin', username='admin')
+        admin.set_password('admin')
+        admin.set_roles(['admin', 'manager'])
+        db.session.add(admin)
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    response = client.post('/api/Authentication/SignIn', json={'username': 'admin', 'password': 'admin'})
+    return {'Authorization': 'Bearer ' + response.json['access_token']}
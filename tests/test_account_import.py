@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+
+def ndjson(*rows):
+    return '\n'.join(json.dumps(row) for row in rows)
+
+
+def account(username, **fields):
+    return dict({'lastName': 'Import', 'firstName': 'Import', 'username': username, 'password': 'secret'}, **fields)
+
+
+@pytest.mark.parametrize('batch_size', [-1, 0])
+def test_batch_size_is_clamped(client, auth, batch_size):
+    response = client.post(
+        f'/api/Accounts/Import?batchSize={batch_size}', headers=auth, content_type='application/x-ndjson',
+        data=ndjson(account(f'clamped{batch_size}a'), account(f'clamped{batch_size}b'))
+    )
+
+    assert response.status_code == 200
+    assert response.json == {'created': 2, 'errors': []}
+
+
+@pytest.mark.parametrize('row, error', [
+    (account(['listname']), '{username} must be a string'),
+    (account('intpassword', password=5), '{password} must be a string'),
+    (account('dictname', firstName={'a': 1}), '{firstName} must be a string'),
+    (account('introles', roles=5), '{roles} must be a string or a list of strings'),
+    (account('mixedroles', roles=['admin', 1]), '{roles} must be a string or a list of strings'),
+])
+def test_invalid_rows_are_reported_and_the_import_continues(client, auth, row, error):
+    username = f"valid-after-{row['username']}"
+    response = client.post(
+        '/api/Accounts/Import', headers=auth, content_type='application/x-ndjson',
+        data=ndjson(row, account(username, roles=['doctor']))
+    )
+
+    assert response.status_code == 200
+    assert response.json['created'] == 1
+    assert response.json['errors'] == [{'line': 1, 'username': row['username'], 'error': error}]
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.mark.parametrize('roles', [[{'a': 1}], [['admin']], 'admin', 5])
+def test_update_rejects_roles_that_are_not_a_list_of_strings(client, auth, roles):
+    response = client.put('/api/Accounts/1', headers=auth, json={'roles': roles})
+
+    assert response.status_code == 400
+    assert response.json['error'] == '{roles} must be a list of strings'
+
+
+def test_update_accepts_a_list_of_role_names(client, auth):
+    response = client.put('/api/Accounts/1', headers=auth, json={'roles': ['admin', 'manager']})
+
+    assert response.status_code == 200
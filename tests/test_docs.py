@@ -0,0 +1,14 @@
+import re
+
+
+def test_swagger_documents_every_api_route(app, client):
+    paths = client.get('/swagger.json').json['paths']
+    documented = {(path, method.upper()) for path, item in paths.items() for method in item if method != 'parameters'}
+
+    served = set()
+    for rule in app.url_map.iter_rules():
+        if rule.rule.startswith('/api/'):
+            path = re.sub(r'<(?:\w+:)?(\w+)>', r'{\1}', rule.rule)
+            served.update((path, method) for method in rule.methods - {'HEAD', 'OPTIONS'})
+
+    assert documented == served
@@ -0,0 +1,33 @@
+import pytest
+
+from db import db
+from models import Doctor
+
+
+@pytest.fixture(scope='module')
+def doctors(app):
+    with app.app_context():
+        db.session.add_all([Doctor('Search Ivanov', 'Cardiologist'), Doctor('Search 100% Petrov', 'Surgeon')])
+        db.session.commit()
+
+
+@pytest.mark.parametrize('name_filter', ['a', 'ab'])
+def test_short_name_filter_is_rejected(client, auth, name_filter):
+    response = client.get(f'/api/Doctors?nameFilter={name_filter}', headers=auth)
+
+    assert response.status_code == 400
+
+
+def test_like_wildcards_match_literally(client, auth, doctors):
+    response = client.get('/api/Doctors?nameFilter=%25%25%25', headers=auth)
+    assert response.status_code == 200
+    assert response.json['doctors'] == []
+
+    response = client.get('/api/Doctors?nameFilter=100%25', headers=auth)
+    assert [doctor['fullName'] for doctor in response.json['doctors']] == ['Search 100% Petrov']
+
+
+def test_escape_like():
+    from doctor_search import escape_like
+
+    assert escape_like('100%_a\\b') == '100\\%\\_a\\\\b'
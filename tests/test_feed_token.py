@@ -0,0 +1,9 @@
+def test_revoking_a_feed_token_twice_is_idempotent(client, auth):
+    feed_token = client.post('/api/Authentication/FeedToken', headers=auth).json['feed_token']
+
+    for _ in range(2):
+        response = client.delete('/api/Authentication/FeedToken', headers=auth, json={'feed_token': feed_token})
+        assert response.status_code == 200
+
+    response = client.get(f'/api/Timetable/Doctor/1.ics?jwt={feed_token}')
+    assert response.status_code == 401
@@ -0,0 +1,20 @@
+from db import db
+from hospital_directory import DIRECTORY, bump_version
+from models import DirectoryVersion
+
+
+def current_version():
+    return db.session.query(DirectoryVersion.version).filter_by(name=DIRECTORY).scalar() or 0
+
+
+def test_bump_version_upserts_the_row(app):
+    with app.app_context():
+        before = current_version()
+
+        bump_version()
+        db.session.commit()
+        bump_version()
+        db.session.commit()
+
+        assert current_version() == before + 2
+        assert DirectoryVersion.query.filter_by(name=DIRECTORY).count() == 1
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from db import db
+from hospital_directory import bump_version, directory
+from models import Doctor, Hospital, Room, TimeTables
+from pagination import encode_cursor
+
+HOSPITALS = 25
+
+
+@pytest.fixture(scope='module')
+def hospitals(app):
+    with app.app_context():
+        db.session.execute(Hospital.__table__.insert(), [
+            {'name': f'Expand {i}', 'address': '-', 'contactPhone': '-', 'rooms_description': '-', 'is_deleted': False}
+            for i in range(HOSPITALS)
+        ])
+        hospital_ids = [hospital_id for (hospital_id,) in db.session.query(Hospital.id).filter(Hospital.name.like('Expand %'))]
+        db.session.execute(Room.__table__.insert(), [
+            {'number': str(number), 'type': 'General', 'hospitalId': hospital_id}
+            for hospital_id in hospital_ids for number in range(3)
+        ])
+        doctor = Doctor('Expand Doctor')
+        db.session.add(doctor)
+        db.session.flush()
+        start = datetime(2032, 1, 1, 8, 0)
+        db.session.execute(TimeTables.__table__.insert(), [
+            {'hospitalId': hospital_id, 'doctorId': doctor.id, 'room': '0',
+             'from_time': start + timedelta(days=day), 'to_time': start + timedelta(days=day, hours=1)}
+            for hospital_id in hospital_ids for day in range(2)
+        ])
+        # Вставка в обход API: версию справочника поднимаем сами, иначе
+        # снимок, построенный предыдущими тестами, не увидит новых больниц.
+        bump_version()
+        db.session.commit()
+        directory.invalidate()
+        return hospital_ids
+
+
+def count_queries(app, request):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, len(statements)
+
+
+def test_expanded_page_uses_constant_number_of_queries(app, client, auth, hospitals):
+    # Прогрев: снимок справочника и синхронизация токенов не должны попасть в подсчёт.
+    client.get('/api/Hospitals?expand=rooms,timetableCount', headers=auth)
+
+    counts = {}
+    for size in (1, 5, HOSPITALS):
+        response, counts[size] = count_queries(
+            app, lambda: client.get(f'/api/Hospitals?expand=rooms,timetableCount&count={size}', headers=auth)
+        )
+        assert response.status_code == 200
+        assert len(response.json['hospitals']) == size
+
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_expanded_page_embeds_rooms_and_timetable_counts(client, auth, hospitals):
+    # Страница начинается сразу перед засеянными больницами: больницы других тестов на неё не влияют.
+    after = encode_cursor([min(hospitals) - 1])
+    response = client.get(f'/api/Hospitals?expand=rooms,timetableCount&after={after}&count={HOSPITALS}', headers=auth)
+
+    by_id = {hospital['id']: hospital for hospital in response.json['hospitals']}
+    assert sorted(by_id) == sorted(hospitals)
+    for hospital_id in hospitals:
+        assert [room['number'] for room in by_id[hospital_id]['rooms']] == ['0', '1', '2']
+        assert by_id[hospital_id]['timetableCount'] == 2
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import jobs
+from db import db
+from models import BackgroundJob, TimeTables
+
+
+def create_job(app, job_id):
+    with app.app_context():
+        db.session.add(BackgroundJob(job_id, 'timetable_delete_doctor', 1, datetime.utcnow()))
+        db.session.commit()
+
+
+def job_status(app, job_id):
+    with app.app_context():
+        return db.session.get(BackgroundJob, job_id).status
+
+
+def test_failed_delete_marks_the_job_failed_and_invalidates(app, monkeypatch):
+    create_job(app, 'failing-delete')
+    finished = []
+
+    def fail(condition, on_progress=None):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(jobs, 'delete_timetables_in_chunks', fail)
+    jobs._run_timetable_delete(app, 'failing-delete', TimeTables.doctorId == -1, on_finish=lambda: finished.append(True))
+
+    assert job_status(app, 'failing-delete') == 'failed'
+    assert finished == [True]
+
+
+def test_finished_delete_invalidates(app):
+    create_job(app, 'finished-delete')
+    finished = []
+
+    jobs._run_timetable_delete(app, 'finished-delete', TimeTables.doctorId == -1, on_finish=lambda: finished.append(True))
+
+    assert job_status(app, 'finished-delete') == 'done'
+    assert finished == [True]
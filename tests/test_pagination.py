@@ -0,0 +1,26 @@
+def test_count_is_clamped(client, auth):
+    for count in (-5, 0):
+        response = client.get(f'/api/Accounts?count={count}', headers=auth)
+        assert response.status_code == 200
+        assert len(response.json) == 1
+
+
+def test_count_is_capped(client, auth):
+    from pagination import MAX_PAGE
+
+    body = '\n'.join(
+        f'{{"lastName": "P", "firstName": "P", "username": "page{i}", "password": "p"}}' for i in range(MAX_PAGE + 5)
+    )
+    client.post('/api/Accounts/Import', headers=auth, content_type='application/x-ndjson', data=body)
+
+    response = client.get('/api/Accounts?count=100000', headers=auth)
+
+    assert response.status_code == 200
+    assert len(response.json) == MAX_PAGE
+    assert response.headers['X-Next-Cursor']
+
+
+def test_negative_from_is_rejected(client, auth):
+    response = client.get('/api/Accounts?from=-1', headers=auth)
+
+    assert response.status_code == 400
@@ -0,0 +1,20 @@
+import passwords
+
+
+def test_sign_in_is_503_when_no_hash_slot_frees_up(client, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_WAIT_SECONDS', 0)
+    monkeypatch.setattr(passwords, '_slots', passwords.threading.BoundedSemaphore(1))
+    passwords._slots.acquire()
+
+    response = client.post('/api/Authentication/SignIn', json={'username': 'admin', 'password': 'admin'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_hash_slot_is_released_after_sign_in(client):
+    response = client.post('/api/Authentication/SignIn', json={'username': 'admin', 'password': 'admin'})
+
+    assert response.status_code == 200
+    assert passwords._slots.acquire(blocking=False)
+    passwords._slots.release()
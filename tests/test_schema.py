@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import inspect
+
+# Схема, которую создавала исходная версия приложения.
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER NOT NULL, "lastName" VARCHAR(100) NOT NULL, "firstName" VARCHAR(100) NOT NULL,
+    username VARCHAR(100) NOT NULL, password VARCHAR(200) NOT NULL, is_admin BOOLEAN, is_manager BOOLEAN,
+    PRIMARY KEY (id), UNIQUE (username)
+);
+CREATE TABLE token_black_list (
+    id INTEGER NOT NULL, jti VARCHAR(36) NOT NULL, revoked BOOLEAN NOT NULL, PRIMARY KEY (id), UNIQUE (jti)
+);
+CREATE TABLE doctors (
+    id INTEGER NOT NULL, "fullName" VARCHAR(200) NOT NULL, specialization VARCHAR(100), phone VARCHAR(15),
+    PRIMARY KEY (id)
+);
+CREATE TABLE hospitals (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, address VARCHAR(100) NOT NULL,
+    "contactPhone" VARCHAR(15) NOT NULL, rooms_description VARCHAR(100) NOT NULL, is_deleted BOOLEAN,
+    PRIMARY KEY (id)
+);
+CREATE TABLE timetables (
+    id INTEGER NOT NULL, "hospitalId" INTEGER NOT NULL, "doctorId" INTEGER NOT NULL,
+    from_time DATETIME NOT NULL, to_time DATETIME NOT NULL, room VARCHAR(100) NOT NULL, PRIMARY KEY (id),
+    FOREIGN KEY("hospitalId") REFERENCES hospitals (id), FOREIGN KEY("doctorId") REFERENCES doctors (id)
+);
+CREATE TABLE appointments (
+    id INTEGER NOT NULL, timetable_id INTEGER NOT NULL, user_id INTEGER NOT NULL, time DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(timetable_id) REFERENCES timetables (id), FOREIGN KEY(user_id) REFERENCES users (id)
+);
+INSERT INTO users VALUES (1, 'Old', 'User', 'old', 'x', 1, 0);
+INSERT INTO doctors VALUES (1, 'Doctor', NULL, NULL);
+INSERT INTO hospitals VALUES (1, 'Hospital', 'addr', '123', 'rooms', 0);
+INSERT INTO timetables VALUES (1, 1, 1, '2030-01-01 09:00:00.000000', '2030-01-01 10:00:00.000000', '101');
+INSERT INTO appointments VALUES (1, 1, 1, '2030-01-01 09:00:00.000000');
+'''
+
+
+def test_init_db_upgrades_a_baseline_database(app):
+    from app import create_app, init_db_command
+    from db import db
+    from models import User
+
+    database = os.path.join(tempfile.mkdtemp(), 'baseline.db')
+    with sqlite3.connect(database) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+
+    legacy = create_app(dict(app.config, SQLALCHEMY_DATABASE_URI='sqlite:///' + database))
+    runner = legacy.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(init_db_command)
+        assert result.exit_code == 0, result.output
+
+    with legacy.app_context():
+        inspector = inspect(db.engine)
+        user_columns = {column['name'] for column in inspector.get_columns('users')}
+        assert {'is_doctor', 'is_active', 'roles_version'} <= user_columns
+        for table in ('doctors', 'hospitals', 'rooms', 'timetables'):
+            assert 'updated_at' in {column['name'] for column in inspector.get_columns(table)}
+
+        foreign_key = next(key for key in inspector.get_foreign_keys('appointments') if key['referred_table'] == 'timetables')
+        assert foreign_key['options'].get('ondelete') == 'CASCADE'
+        assert 'uq_appointments_timetable_time' in {item['name'] for item in inspector.get_unique_constraints('appointments')}
+        assert 'ix_timetables_hospital_room_from' in {index['name'] for index in inspector.get_indexes('timetables')}
+
+        user = db.session.get(User, 1)
+        assert (user.roles, user.is_active, user.roles_version) == (['user', 'admin'], True, 0)
+        assert db.session.execute(db.text('SELECT count(*) FROM appointments WHERE created_at IS NOT NULL')).scalar() == 1
@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from db import db
+from models import Doctor, Hospital, TimeTables
+
+WINDOW = '?from=2031-03-01T00:00:00Z&to=2031-03-08T00:00:00Z'
+DAY = '?from=2031-03-02T00:00:00Z&to=2031-03-03T00:00:00Z'
+
+
+@pytest.fixture(scope='module')
+def schedule(app):
+    with app.app_context():
+        hospital = Hospital('Range', 'addr', '123', 'rooms')
+        doctor = Doctor('Range Doctor', 'Therapist')
+        db.session.add_all([hospital, doctor])
+        db.session.flush()
+        start = datetime(2031, 3, 1, 9, 0)
+        db.session.add_all([
+            TimeTables(hospital.id, doctor.id, start + timedelta(days=day), start + timedelta(days=day, hours=1), '101')
+            for day in range(5)
+        ])
+        db.session.commit()
+        return hospital.id, doctor.id
+
+
+@pytest.fixture
+def hospital_id(schedule):
+    return schedule[0]
+
+
+def test_range_is_streamed_as_json_array(client, auth, hospital_id):
+    response = client.get(f'/api/Timetable/Hospital/{hospital_id}{WINDOW}', headers=auth)
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    entries = json.loads(response.get_data(as_text=True))
+    assert [entry['from'] for entry in entries] == [f'2031-03-0{day}T09:00:00Z' for day in range(1, 6)]
+
+
+def test_range_is_streamed_as_ndjson(client, auth, hospital_id):
+    response = client.get(f'/api/Timetable/Hospital/{hospital_id}{WINDOW}&format=ndjson', headers=auth)
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[0])['hospitalId'] == hospital_id
+
+
+def test_etag_returns_304_until_the_range_changes(client, auth, schedule):
+    hospital_id, doctor_id = schedule
+    url = f'/api/Timetable/Hospital/{hospital_id}{WINDOW}'
+    etag = client.get(url, headers=auth).headers['ETag']
+
+    response = client.get(url, headers=dict(auth, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    created = client.post('/api/Timetable', headers=auth, json={
+        'hospitalId': hospital_id, 'doctorId': doctor_id, 'room': '102',
+        'from': '2031-03-07T09:00:00Z', 'to': '2031-03-07T10:00:00Z'
+    })
+    assert created.status_code == 201
+
+    response = client.get(url, headers=dict(auth, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(json.loads(response.get_data(as_text=True))) == 6
+
+
+def test_day_view_is_rebuilt_after_a_write_from_another_worker(app, client, auth, hospital_id):
+    url = f'/api/Timetable/Hospital/{hospital_id}{DAY}'
+    first = client.get(url, headers=auth)
+    assert [entry['room'] for entry in first.json] == ['101']
+
+    # Изменение мимо обработчиков этого процесса: кэш дневных представлений о нём не знает.
+    with app.app_context():
+        timetable = TimeTables.query.filter_by(hospitalId=hospital_id, from_time=datetime(2031, 3, 2, 9, 0)).one()
+        timetable.room = '201'
+        db.session.commit()
+
+    second = client.get(url, headers=dict(auth, **{'If-None-Match': first.headers['ETag']}))
+    assert second.status_code == 200
+    assert [entry['room'] for entry in second.json] == ['201']
+    assert client.get(url, headers=dict(auth, **{'If-None-Match': second.headers['ETag']})).status_code == 304
+
+
+@pytest.mark.parametrize('index_name, criteria', [
+    ('ix_timetables_hospital_from', lambda: [TimeTables.hospitalId == 1]),
+    ('ix_timetables_doctor_from', lambda: [TimeTables.doctorId == 1]),
+    ('ix_timetables_hospital_room_from', lambda: [TimeTables.hospitalId == 1, TimeTables.room == '101']),
+])
+def test_range_queries_use_composite_indexes(app, index_name, criteria):
+    with app.app_context():
+        query = TimeTables.query.filter(
+            *criteria(), TimeTables.from_time >= datetime(2031, 1, 1), TimeTables.to_time <= datetime(2031, 12, 31)
+        ).order_by(TimeTables.from_time, TimeTables.id)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(str(row) for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+
+    assert index_name in plan
@@ -0,0 +1,99 @@
+import pytest
+
+from db import db
+from models import Doctor, Hospital
+
+
+@pytest.fixture(scope='module')
+def refs(app):
+    with app.app_context():
+        hospital = Hospital('References', 'addr', '123', 'rooms')
+        doctor = Doctor('References Doctor', 'Therapist')
+        db.session.add_all([hospital, doctor])
+        db.session.commit()
+        return hospital.id, doctor.id
+
+
+def entry(hospital_id, doctor_id, day=1, room='301'):
+    return {
+        'hospitalId': hospital_id, 'doctorId': doctor_id, 'room': room,
+        'from': f'2032-04-{day:02d}T09:00:00Z', 'to': f'2032-04-{day:02d}T10:00:00Z'
+    }
+
+
+def test_create_with_unknown_doctor_is_404(client, auth, refs):
+    hospital_id, _ = refs
+
+    response = client.post('/api/Timetable', headers=auth, json=entry(hospital_id, 9999))
+
+    assert response.status_code == 404
+    assert response.json['error'] == 'Doctor not found'
+
+
+def test_update_with_unknown_doctor_is_404(client, auth, refs):
+    hospital_id, doctor_id = refs
+    assert client.post('/api/Timetable', headers=auth, json=entry(hospital_id, doctor_id, day=2)).status_code == 201
+    timetable_id = client.get(
+        f'/api/Timetable/Doctor/{doctor_id}?from=2032-04-02T00:00:00Z&to=2032-04-03T00:00:00Z', headers=auth
+    ).json[0]['id']
+
+    response = client.put(f'/api/Timetable/{timetable_id}', headers=auth, json=entry(hospital_id, 555, day=2))
+
+    assert response.status_code == 404
+    assert response.json['error'] == 'Doctor not found'
+
+
+def test_overlap_is_still_409(client, auth, refs):
+    hospital_id, doctor_id = refs
+    assert client.post('/api/Timetable', headers=auth, json=entry(hospital_id, doctor_id, day=3)).status_code == 201
+
+    response = client.post('/api/Timetable', headers=auth, json=entry(hospital_id, doctor_id, day=3, room='302'))
+
+    assert response.status_code == 409
+
+
+def test_batch_reports_unknown_references_per_item(client, auth, refs):
+    hospital_id, doctor_id = refs
+
+    response = client.post('/api/Timetable/Batch', headers=auth, json=[
+        entry(hospital_id, doctor_id, day=4), entry(hospital_id, 555, day=5), entry(777, doctor_id, day=6)
+    ])
+
+    assert response.status_code == 400
+    assert response.json['items'] == [
+        {'index': 1, 'errors': ['Doctor not found']},
+        {'index': 2, 'errors': ['Hospital not found']}
+    ]
+
+
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_generate_reports_unknown_hospital(client, auth, refs, dry_run):
+    _, doctor_id = refs
+
+    response = client.post('/api/Timetable/Generate', headers=auth, json={
+        'from': '2032-05-03', 'to': '2032-05-09', 'dryRun': dry_run,
+        'templates': [{'hospitalId': 777, 'doctorId': doctor_id, 'room': '301',
+                       'weekly': [{'day': 1, 'from': '09:00', 'to': '10:00'}]}]
+    })
+
+    assert response.status_code == 400
+    assert response.json['items'] == [{'index': 0, 'errors': ['Hospital not found']}]
+
+
+@pytest.mark.parametrize('weekly', [5, 'monday', [5], None])
+def test_generate_rejects_malformed_weekly(client, auth, refs, weekly):
+    hospital_id, doctor_id = refs
+
+    response = client.post('/api/Timetable/Generate', headers=auth, json={
+        'from': '2032-05-03', 'to': '2032-05-09',
+        'templates': [{'hospitalId': hospital_id, 'doctorId': doctor_id, 'room': '301', 'weekly': weekly}]
+    })
+
+    assert response.status_code == 400
+    assert response.json['items'] == [{'index': 0, 'errors': ['Invalid template: {weekly} must be a list of slots']}]
+
+
+def test_generate_rejects_a_list_body(client, auth):
+    response = client.post('/api/Timetable/Generate', headers=auth, json=[{'from': '2032-05-03'}])
+
+    assert response.status_code == 400
@@ -1,184 +1,339 @@
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
-from models import TimeTables, Appointment
-from db import db, init_app
-from dotenv import load_dotenv
-import os
-from datetime import datetime, timedelta
-from sqlalchemy import or_
-
-load_dotenv()
-
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
-jwt = JWTManager(app)
-
-init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/api/Timetable', methods=['POST'])
+from flask import Blueprint, request, jsonify
+import click
+from flask_jwt_extended import jwt_required
+from models import TimeTables, Appointment, BackgroundJob, CalendarTombstone
+from db import db
+import day_views
+from streaming import stream_json, wants_ndjson, STREAM_BATCH_SIZE
+from calendar_feed import Feed, FEED_MAX_AGE, SyncTokenExpired, parse_since, record_tombstone, prune_tombstones
+from pagination import InvalidCursor
+from conditional import collection_state, make_etag, not_modified, add_validators
+from booking import book_slot, BookingError
+from jobs import INLINE_DELETE_LIMIT, count_timetables, delete_timetables, start_timetable_delete, job_to_dict
+from schedule import (parse_time, parse_timetable_entry, parse_template, expand_templates, find_conflicts,
+                      find_missing_references, is_overlap_conflict, insert_entries)
+from availability import free_slots, free_slots_for_ids, earliest_free_slots
+from identity import current_identity, accepts_feed_token
+from datetime import date, datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+bp = Blueprint('timetables', __name__, cli_group=None)
+
+@bp.route('/api/Timetable', methods=['POST'])
 @jwt_required()
 def create_timetable_entry():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
-    if not current_user.is_admin or not current_user.is_manager:
+    if not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
-    data = request.get_json()
-
-    if not data or not all(key in data for key in ['hospitalId', 'doctorId', 'from', 'to', 'room']):
-        return jsonify({'error': 'Missing data'}), 400
-
-    try:
-        from_time = datetime.fromisoformat(data['from'].replace('Z', '+00:00'))
-        to_time = datetime.fromisoformat(data['to'].replace('Z', '+00:00'))
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
+    entry, error = parse_timetable_entry(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
 
-    if to_time <= from_time:
-        return jsonify({'error': '{to} must be greater than {from}'}), 400
+    missing = find_missing_references([entry])
+    if missing:
+        return jsonify({'error': missing[0][0]}), 404
 
-    if (to_time - from_time).total_seconds() > 12 * 3600:
-        return jsonify({'error': 'The time difference cannot exceed 12 hours'}), 400
-
-    if from_time.minute % 30 != 0 or to_time.minute % 30 != 0:
-        return jsonify({'error': '{from} and {to} must be multiples of 30 minutes'}), 400
+    conflicts = find_conflicts([entry])
+    if conflicts:
+        return jsonify({'error': conflicts[0][0]}), 409
 
     new_entry = TimeTables(
-        hospital_id=data['hospitalId'],
-        doctor_id=data['doctorId'],
-        from_time=from_time,
-        to_time=to_time,
-        room=data['room']
+        hospital_id=entry['hospitalId'],
+        doctor_id=entry['doctorId'],
+        from_time=entry['from_time'],
+        to_time=entry['to_time'],
+        room=entry['room']
     )
 
     try:
         db.session.add(new_entry)
         db.session.commit()
+        day_views.cache.timetable_saved(new_entry)
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_overlap_conflict(e):
+            return jsonify({'error': 'Doctor or room is already scheduled at this time'}), 409
+        return jsonify({'error': 'Hospital or doctor not found'}), 404
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Timetable entry created successfully'}), 201
 
-@app.route('/api/Timetable<int:id>', methods=['PUT'])
+@bp.route('/api/Timetable/Batch', methods=['POST'])
 @jwt_required()
-def update_timetable_entry(id):
-    current_user = get_jwt_identity()
+def create_timetable_entries_batch():
+    current_user = current_identity()
+
+    if not current_user.is_admin and not current_user.is_manager:
+        return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
+
+    data = request.get_json()
+
+    if not isinstance(data, list) or not data:
+        return jsonify({'error': 'Expected a non-empty list of timetable entries'}), 400
+
+    entries = []
+    errors = []
+    for index, item in enumerate(data):
+        entry, error = parse_timetable_entry(item)
+        if error:
+            errors.append({'index': index, 'errors': [error]})
+        entries.append(entry)
+
+    if errors:
+        return jsonify({'error': 'Timetable entries are invalid', 'items': errors}), 400
+
+    missing = find_missing_references(entries)
+    if missing:
+        return jsonify({
+            'error': 'Timetable entries reference unknown hospitals or doctors',
+            'items': [{'index': index, 'errors': messages} for index, messages in sorted(missing.items())]
+        }), 400
+
+    conflicts = find_conflicts(entries)
+    if conflicts:
+        return jsonify({
+            'error': 'Timetable entries conflict',
+            'items': [{'index': index, 'errors': messages} for index, messages in sorted(conflicts.items())]
+        }), 409
 
-    if not current_user.is_admin or not current_user.is_manager:
+    try:
+        insert_entries(entries)
+        db.session.commit()
+        day_views.cache.entries_inserted(entries)
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_overlap_conflict(e):
+            return jsonify({'error': 'Doctor or room is already scheduled at this time'}), 409
+        return jsonify({'error': 'Hospital or doctor not found'}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
+
+    return jsonify({'message': 'Timetable entries created successfully', 'count': len(entries)}), 201
+
+@bp.route('/api/Timetable/Generate', methods=['POST'])
+@jwt_required()
+def generate_timetable_from_templates():
+    current_user = current_identity()
+
+    if not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
     data = request.get_json()
 
-    if not data or not all(key in data for key in ['hospitalId', 'doctorId', 'from', 'to', 'room']):
+    if not isinstance(data, dict) or not all(key in data for key in ['from', 'to', 'templates']) or not isinstance(data['templates'], list):
         return jsonify({'error': 'Missing data'}), 400
 
     try:
-        from_time = datetime.fromisoformat(data['from'].replace('Z', '+00:00'))
-        to_time = datetime.fromisoformat(data['to'].replace('Z', '+00:00'))
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
+        from_date = date.fromisoformat(data['from'])
+        to_date = date.fromisoformat(data['to'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD.'}), 400
+
+    if to_date < from_date or (to_date - from_date).days > 366:
+        return jsonify({'error': '{to} must not be before {from} and the range cannot exceed a year'}), 400
+
+    templates = []
+    errors = []
+    for index, item in enumerate(data['templates']):
+        template, error = parse_template(item)
+        if error:
+            errors.append({'index': index, 'errors': [error]})
+        templates.append(template)
+
+    if errors:
+        return jsonify({'error': 'Templates are invalid', 'items': errors}), 400
+
+    missing = find_missing_references(templates)
+    if missing:
+        return jsonify({
+            'error': 'Templates reference unknown hospitals or doctors',
+            'items': [{'index': index, 'errors': messages} for index, messages in sorted(missing.items())]
+        }), 400
+
+    entries = expand_templates(templates, from_date, to_date)
+    conflicts = find_conflicts(entries)
+    conflict_items = [{
+        'hospitalId': entries[index]['hospitalId'],
+        'doctorId': entries[index]['doctorId'],
+        'room': entries[index]['room'],
+        'from': entries[index]['from_time'].isoformat() + 'Z',
+        'to': entries[index]['to_time'].isoformat() + 'Z',
+        'errors': messages
+    } for index, messages in sorted(conflicts.items())]
+
+    if data.get('dryRun') or request.args.get('dryRun') == 'true':
+        return jsonify({'count': len(entries), 'conflicts': conflict_items}), 200
+
+    if conflicts:
+        return jsonify({'error': 'Generated timetable entries conflict', 'items': conflict_items}), 409
+
+    try:
+        insert_entries(entries)
+        db.session.commit()
+        day_views.cache.entries_inserted(entries)
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_overlap_conflict(e):
+            return jsonify({'error': 'Doctor or room is already scheduled at this time'}), 409
+        return jsonify({'error': 'Hospital or doctor not found'}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
-    if to_time <= from_time:
-        return jsonify({'error': '{to} must be greater than {from}'}), 400
+    return jsonify({'message': 'Timetable entries generated successfully', 'count': len(entries)}), 201
 
-    if (to_time - from_time).total_seconds() > 12 * 3600:  # 12 часов в секундах
-        return jsonify({'error': 'The time difference cannot exceed 12 hours'}), 400
+@bp.route('/api/Timetable/<int:id>', methods=['PUT'])
+@jwt_required()
+def update_timetable_entry(id):
+    current_user = current_identity()
 
-    if from_time.minute % 30 != 0 or to_time.minute % 30 != 0:
-        return jsonify({'error': '{from} and {to} must be multiples of 30 minutes'}), 400
+    if not current_user.is_admin and not current_user.is_manager:
+        return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
-    timetable_entry = TimeTables.query.get(id)
+    entry, error = parse_timetable_entry(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Блокировка строки не даёт параллельному бронированию проскочить между проверкой и изменением.
+    timetable_entry = TimeTables.query.filter_by(id=id).with_for_update().first()
     if not timetable_entry:
         return jsonify({'error': 'Timetable entry not found'}), 404
 
-    conflicting_entries = TimeTables.query.filter(
-        TimeTables.doctorId == timetable_entry.doctorId,
-        TimeTables.hospitalId == timetable_entry.hospitalId,
-        or_(
-            (TimeTables.from_time < to_time) & (TimeTables.to_time > from_time)
-        )
-    ).all()
-
-    if conflicting_entries:
+    if db.session.query(Appointment.query.filter_by(timetable_id=id).exists()).scalar():
         return jsonify({'error': 'Cannot update: There are existing appointments during this time.'}), 400
 
-    timetable_entry.hospitalId = data['hospitalId']
-    timetable_entry.doctorId = data['doctorId']
-    timetable_entry.from_time = from_time
-    timetable_entry.to_time = to_time
-    timetable_entry.room = data['room']
+    missing = find_missing_references([entry])
+    if missing:
+        return jsonify({'error': missing[0][0]}), 404
+
+    conflicts = find_conflicts([entry], exclude_ids=[id])
+    if conflicts:
+        return jsonify({'error': conflicts[0][0]}), 409
+
+    if (timetable_entry.hospitalId, timetable_entry.doctorId, timetable_entry.room) != (entry['hospitalId'], entry['doctorId'], entry['room']):
+        # Из ленты прежнего врача или кабинета событие должно исчезнуть.
+        record_tombstone(timetable_entry)
+
+    timetable_entry.hospitalId = entry['hospitalId']
+    timetable_entry.doctorId = entry['doctorId']
+    timetable_entry.from_time = entry['from_time']
+    timetable_entry.to_time = entry['to_time']
+    timetable_entry.room = entry['room']
 
     try:
         db.session.commit()
+        day_views.cache.timetable_saved(timetable_entry)
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_overlap_conflict(e):
+            return jsonify({'error': 'Doctor or room is already scheduled at this time'}), 409
+        return jsonify({'error': 'Hospital or doctor not found'}), 404
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Timetable entry updated successfully'}), 200
 
 
-@app.route('/api/Timetable/<int:id>', methods=['DELETE'])
+@bp.route('/api/Timetable/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_timetable_entry(id):
-    current_user = get_jwt_identity()
-    if not current_user.is_admin or not current_user.is_manager:
+    current_user = current_identity()
+    if not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
     timetable_entry = TimeTables.query.get(id)
     if not timetable_entry:
         return jsonify({'error': 'Timetable entry not found'}), 404
 
+    record_tombstone(timetable_entry)
     db.session.delete(timetable_entry)
     db.session.commit()
+    day_views.cache.timetable_deleted(id)
 
     return jsonify({'message': 'Timetable entry deleted successfully'}), 204
 
 
-@app.route('/api/Timetable/Doctor/<int:doctor_id>', methods=['DELETE'])
+@bp.route('/api/Timetable/Doctor/<int:doctor_id>', methods=['DELETE'])
 @jwt_required()
 def delete_timetable_for_doctor(doctor_id):
-    current_user = get_jwt_identity()
-    if not current_user.is_admin or not current_user.is_manager:
+    current_user = current_identity()
+    if not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
-    deleted_entries = TimeTables.query.filter_by(doctorId=doctor_id).all()
-    if not deleted_entries:
+    condition = TimeTables.doctorId == doctor_id
+    total = count_timetables(condition)
+    if not total:
         return jsonify({'error': 'No timetable entries found for this doctor'}), 404
 
-    for entry in deleted_entries:
-        db.session.delete(entry)
+    if total > INLINE_DELETE_LIMIT:
+        job = start_timetable_delete(
+            'timetable_delete_doctor', condition, total,
+            on_finish=lambda: day_views.cache.owner_cleared('doctor', doctor_id)
+        )
+        day_views.cache.owner_cleared('doctor', doctor_id)
+        return jsonify(job_to_dict(job)), 202, {'Location': f'/api/Timetable/Jobs/{job.id}'}
 
-    db.session.commit()
+    try:
+        delete_timetables(condition)
+        day_views.cache.owner_cleared('doctor', doctor_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Timetable entries for doctor deleted successfully'}), 204
 
-@app.route('/api/Timetable/Hospital/<int:hospital_id>', methods=['DELETE'])
+@bp.route('/api/Timetable/Hospital/<int:hospital_id>', methods=['DELETE'])
 @jwt_required()
 def delete_timetable_for_hospital(hospital_id):
-    current_user = get_jwt_identity()
-    if not current_user.is_admin or not current_user.is_manager:
+    current_user = current_identity()
+    if not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
 
-    deleted_entries = TimeTables.query.filter_by(hospitalId=hospital_id).all()
-    if not deleted_entries:
+    condition = TimeTables.hospitalId == hospital_id
+    total = count_timetables(condition)
+    if not total:
         return jsonify({'error': 'No timetable entries found for this hospital'}), 404
 
-    for entry in deleted_entries:
-        db.session.delete(entry)
+    if total > INLINE_DELETE_LIMIT:
+        job = start_timetable_delete(
+            'timetable_delete_hospital', condition, total,
+            on_finish=lambda: day_views.cache.owner_cleared('hospital', hospital_id)
+        )
+        day_views.cache.owner_cleared('hospital', hospital_id)
+        return jsonify(job_to_dict(job)), 202, {'Location': f'/api/Timetable/Jobs/{job.id}'}
 
-    db.session.commit()
+    try:
+        delete_timetables(condition)
+        day_views.cache.owner_cleared('hospital', hospital_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Timetable entries for hospital deleted successfully'}), 204
 
-@app.route('/api/Timetable/Hospital/<int:hospital_id>', methods=['GET'])
+@bp.route('/api/Timetable/Jobs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_timetable_job(job_id):
+    current_user = current_identity()
+    if not current_user.is_admin and not current_user.is_manager:
+        return jsonify({'error': 'Access forbidden: Admins and Managers only'}), 403
+
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job_to_dict(job)), 200
+
+@bp.route('/api/Timetable/Hospital/<int:hospital_id>', methods=['GET'])
 @jwt_required()
 def get_hospital_timetable(hospital_id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     from_time = request.args.get('from')
     to_time = request.args.get('to')
@@ -187,23 +342,81 @@ def get_hospital_timetable(hospital_id):
         return jsonify({'error': 'Missing from or to parameters'}), 400
 
     try:
-        from_time = datetime.fromisoformat(from_time.replace('Z', '+00:00'))
-        to_time = datetime.fromisoformat(to_time.replace('Z', '+00:00'))
+        from_time = parse_time(from_time)
+        to_time = parse_time(to_time)
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
-    timetable_entries = TimeTables.query.filter(
+    criteria = (
         TimeTables.hospitalId == hospital_id,
         TimeTables.from_time >= from_time,
         TimeTables.to_time <= to_time
-    ).all()
+    )
+    count, last_modified = collection_state(TimeTables, *criteria)
+    etag = make_etag(count, last_modified, wants_ndjson())
+    response = not_modified(etag)
+    if response:
+        return response
+
+    # Окно в пределах одних суток (типичный опрос «на сегодня») отдаётся из кэша дневных представлений.
+    # Представление, отстающее от базы (изменения других воркеров), перестраивается:
+    # иначе новый ETag ушёл бы со старым телом.
+    if from_time.date() == (to_time - timedelta(microseconds=1)).date() and not wants_ndjson():
+        entries = hospital_day_window(hospital_id, from_time, to_time)
+        if day_views.entries_state(entries) != (count, last_modified):
+            day_views.cache.invalidate('hospital', hospital_id, from_time.date())
+            entries = hospital_day_window(hospital_id, from_time, to_time)
+        return add_validators(jsonify([day_views.entry_to_dict(entry) for entry in entries]), etag, last_modified), 200
+
+    timetable_entries = TimeTables.query.filter(*criteria).order_by(
+        TimeTables.from_time, TimeTables.id
+    ).yield_per(STREAM_BATCH_SIZE)
+
+    return add_validators(stream_json(timetable_entries, TimeTables.to_dict), etag, last_modified)
+
+def hospital_day_window(hospital_id, from_time, to_time):
+    return [
+        entry for entry in day_views.cache.get('hospital', hospital_id, from_time.date())
+        if entry['from_time'] >= from_time and entry['to_time'] <= to_time
+    ]
+
+@bp.route('/api/Timetable/Hospital/<int:hospital_id>/Day/<string:day>', methods=['GET'])
+@jwt_required()
+def get_hospital_day(hospital_id, day):
+    try:
+        day = date.fromisoformat(day)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD.'}), 400
+
+    entries = day_views.cache.get('hospital', hospital_id, day)
+
+    return jsonify({'date': day.isoformat(), 'entries': [day_views.serialize_entry(entry) for entry in entries]}), 200
+
+@bp.route('/api/Timetable/Doctor/<int:doctor_id>/Day/<string:day>', methods=['GET'])
+@jwt_required()
+def get_doctor_day(doctor_id, day):
+    try:
+        day = date.fromisoformat(day)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD.'}), 400
+
+    entries = day_views.cache.get('doctor', doctor_id, day)
 
-    return jsonify([entry.to_dict() for entry in timetable_entries]), 200
+    return jsonify({'date': day.isoformat(), 'entries': [day_views.serialize_entry(entry) for entry in entries]}), 200
 
-@app.route('/api/Timetable/Doctor/<int:doctor_id>', methods=['GET'])
+@bp.route('/api/Timetable/Metrics/DayViews', methods=['GET'])
+@jwt_required()
+def get_day_view_metrics():
+    current_user = current_identity()
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    return jsonify(day_views.cache.metrics()), 200
+
+@bp.route('/api/Timetable/Doctor/<int:doctor_id>', methods=['GET'])
 @jwt_required()
 def get_doctor_timetable(doctor_id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     from_time = request.args.get('from')
     to_time = request.args.get('to')
@@ -212,25 +425,82 @@ def get_doctor_timetable(doctor_id):
         return jsonify({'error': 'Missing from or to parameters'}), 400
 
     try:
-        from_time = datetime.fromisoformat(from_time.replace('Z', '+00:00'))
-        to_time = datetime.fromisoformat(to_time.replace('Z', '+00:00'))
+        from_time = parse_time(from_time)
+        to_time = parse_time(to_time)
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
-    timetable_entries = TimeTables.query.filter(
+    criteria = (
         TimeTables.doctorId == doctor_id,
         TimeTables.from_time >= from_time,
         TimeTables.to_time <= to_time
-    ).all()
+    )
+    count, last_modified = collection_state(TimeTables, *criteria)
+    etag = make_etag(count, last_modified, wants_ndjson())
+    response = not_modified(etag)
+    if response:
+        return response
+
+    timetable_entries = TimeTables.query.filter(*criteria).order_by(
+        TimeTables.from_time, TimeTables.id
+    ).yield_per(STREAM_BATCH_SIZE)
 
-    return jsonify([entry.to_dict() for entry in timetable_entries]), 200
+    return add_validators(stream_json(timetable_entries, TimeTables.to_dict), etag, last_modified)
 
-@app.route('/api/Timetable/Hospital/<int:hospital_id>/Room/<string:room>', methods=['GET'])
+def feed_response(name, owner_criteria, tombstone_criteria):
+    try:
+        since = parse_since(request.args.get('syncToken'), request.args.get('since'))
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid sync token'}), 400
+    except SyncTokenExpired:
+        return jsonify({'error': 'Sync token expired, fetch the full feed'}), 410
+
+    feed = Feed(name, owner_criteria, tombstone_criteria, since)
+    state, last_modified = feed.state()
+    etag = make_etag(state)
+    response = not_modified(etag) or add_validators(feed.response(), etag, last_modified)
+    # Календарные клиенты опрашивают ленту часто — короткий max-age вместо no-cache.
+    response.headers['Cache-Control'] = f'private, max-age={FEED_MAX_AGE}'
+    return response
+
+@bp.route('/api/Timetable/Doctor/<int:doctor_id>.ics', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+@accepts_feed_token
+def get_doctor_feed(doctor_id):
+    current_user = current_identity()
+
+    # Лента показывает занятые слоты: врачи не связаны с учётными записями,
+    # поэтому доступ — только у персонала.
+    if not current_user.is_admin and not current_user.is_manager and not current_user.is_doctor:
+        return jsonify({'error': 'Access forbidden: Admins, Managers, and Doctors only'}), 403
+
+    return feed_response(
+        f'Расписание врача {doctor_id}',
+        [TimeTables.doctorId == doctor_id],
+        [CalendarTombstone.doctorId == doctor_id]
+    )
+
+@bp.route('/api/Timetable/Hospital/<int:hospital_id>/Room/<string:room>.ics', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+@accepts_feed_token
+def get_hospital_room_feed(hospital_id, room):
+    current_user = current_identity()
+
+    if not current_user.is_admin and not current_user.is_manager and not current_user.is_doctor:
+        return jsonify({'error': 'Access forbidden: Admins, Managers, and Doctors only'}), 403
+
+    return feed_response(
+        f'Больница {hospital_id}, кабинет {room}',
+        [TimeTables.hospitalId == hospital_id, TimeTables.room == room],
+        [CalendarTombstone.hospitalId == hospital_id, CalendarTombstone.room == room]
+    )
+
+@bp.route('/api/Timetable/Hospital/<int:hospital_id>/Room/<string:room>', methods=['GET'])
 @jwt_required()
 def get_hospital_room_timetable(hospital_id, room):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
-    if not current_user.is_admin or not current_user.is_manager:
+    if not current_user.is_admin and not current_user.is_manager and not current_user.is_doctor:
         return jsonify({'error': 'Access forbidden: Admins, Managers, and Doctors only'}), 403
 
     from_time = request.args.get('from')
@@ -240,96 +510,144 @@ def get_hospital_room_timetable(hospital_id, room):
         return jsonify({'error': 'Missing from or to parameters'}), 400
 
     try:
-        from_time = datetime.fromisoformat(from_time.replace('Z', '+00:00'))
-        to_time = datetime.fromisoformat(to_time.replace('Z', '+00:00'))
+        from_time = parse_time(from_time)
+        to_time = parse_time(to_time)
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
-    timetable_entries = TimeTables.query.filter(
+    criteria = (
         TimeTables.hospitalId == hospital_id,
         TimeTables.room == room,
         TimeTables.from_time >= from_time,
         TimeTables.to_time <= to_time
-    ).all()
+    )
+    count, last_modified = collection_state(TimeTables, *criteria)
+    etag = make_etag(count, last_modified, wants_ndjson())
+    response = not_modified(etag)
+    if response:
+        return response
 
-    return jsonify([entry.to_dict() for entry in timetable_entries]), 200
+    timetable_entries = TimeTables.query.filter(*criteria).order_by(
+        TimeTables.from_time, TimeTables.id
+    ).yield_per(STREAM_BATCH_SIZE)
 
-@app.route('/api/Timetable/<int:id>/Appointments', methods=['GET'])
+    return add_validators(stream_json(timetable_entries, TimeTables.to_dict), etag, last_modified)
+
+@bp.route('/api/Timetable/<int:id>/Appointments', methods=['GET'])
 @jwt_required()
 def get_free_appointments(id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
 
     timetable_entry = TimeTables.query.get(id)
     if not timetable_entry:
         return jsonify({'error': 'Timetable entry not found'}), 404
 
-    available_times = []
-    current_time = timetable_entry.from_time
+    available_times = free_slots([timetable_entry])[timetable_entry.id]
+
+    return jsonify([time.isoformat() + 'Z' for time in available_times]), 200
+
+@bp.route('/api/Timetable/Appointments', methods=['GET'])
+@jwt_required()
+def get_free_appointments_batch():
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+
+    if not ids:
+        return jsonify({'error': 'Missing ids parameter'}), 400
 
-    while current_time < timetable_entry.to_time:
-        available_times.append(current_time.isoformat() + 'Z')
-        current_time += timedelta(minutes=30)
+    available = free_slots_for_ids(ids)
 
-    return jsonify(available_times), 200
+    return jsonify({
+        str(timetable_id): [time.isoformat() + 'Z' for time in times]
+        for timetable_id, times in available.items()
+    }), 200
 
-@app.route('/api/Timetable/<int:id>/Appointments', methods=['POST'])
+@bp.route('/api/Timetable/Search', methods=['GET'])
 @jwt_required()
-def book_appointment(id):
-    current_user = get_jwt_identity()
-    user_id = current_user['id']
+def search_free_appointments():
+    from_time = request.args.get('from')
+    to_time = request.args.get('to')
 
-    data = request.get_json()
-    if not data or 'time' not in data:
-        return jsonify({'error': 'Missing time parameter'}), 400
+    if not from_time or not to_time:
+        return jsonify({'error': 'Missing from or to parameters'}), 400
 
     try:
-        appointment_time = datetime.fromisoformat(data['time'].replace('Z', '+00:00'))
+        from_time = parse_time(from_time)
+        to_time = parse_time(to_time)
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
 
-    timetable_entry = TimeTables.query.get(id)
-    if not timetable_entry:
-        return jsonify({'error': 'Timetable entry not found'}), 404
-
-    existing_appointment = Appointment.query.filter_by(timetable_id=id, time=appointment_time).first()
-    if existing_appointment:
-        return jsonify({'error': 'This appointment time is already booked'}), 409
+    limit = max(1, min(request.args.get('limit', default=10, type=int), 100))
 
-    new_appointment = Appointment(
-        timetable_id=id,
-        user_id=user_id,
-        time=appointment_time
+    slots = earliest_free_slots(
+        from_time,
+        to_time,
+        limit=limit,
+        specialization=request.args.get('specialization'),
+        hospital_id=request.args.get('hospitalId', type=int)
     )
 
+    return jsonify([{
+        'timetableId': timetable.id,
+        'hospitalId': timetable.hospitalId,
+        'doctorId': timetable.doctorId,
+        'room': timetable.room,
+        'time': time.isoformat() + 'Z'
+    } for time, timetable in slots]), 200
+
+@bp.route('/api/Timetable/<int:id>/Appointments', methods=['POST'])
+@jwt_required()
+def book_appointment(id):
+    current_user = current_identity()
+    user_id = current_user.id
+
+    data = request.get_json()
+    if not data or 'time' not in data:
+        return jsonify({'error': 'Missing time parameter'}), 400
+
     try:
-        db.session.add(new_appointment)
-        db.session.commit()
+        appointment_time = parse_time(data['time'])
+    except (AttributeError, ValueError):
+        return jsonify({'error': 'Invalid date format. Use ISO8601 format.'}), 400
+
+    try:
+        new_appointment = book_slot(id, user_id, appointment_time)
+        day_views.cache.appointment_changed(id, 1)
+    except BookingError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Appointment booked successfully', 'appointment_id': new_appointment.id}), 201
 
-@app.route('/api/Appointment/<int:id>', methods=['DELETE'])
+@bp.route('/api/Appointment/<int:id>', methods=['DELETE'])
 @jwt_required()
 def cancel_appointment(id):
-    current_user = get_jwt_identity()
-    user_id = current_user['id']
+    current_user = current_identity()
+    user_id = current_user.id
 
     appointment = Appointment.query.get(id)
     if not appointment:
         return jsonify({'error': 'Appointment not found'}), 404
 
-    if appointment.user_id != user_id and not current_user.is_admin or not current_user.is_manager:
+    if appointment.user_id != user_id and not current_user.is_admin and not current_user.is_manager:
         return jsonify({'error': 'Access forbidden: You can only cancel your own appointments'}), 403
 
     try:
         db.session.delete(appointment)
+        # Отмена меняет описание события в .ics-ленте.
+        TimeTables.query.filter_by(id=appointment.timetable_id).update({'updated_at': datetime.utcnow()})
         db.session.commit()
+        day_views.cache.appointment_changed(appointment.timetable_id, -1)
     except Exception as e:
         return jsonify({'error': 'Database error', 'details': str(e)}), 500
 
     return jsonify({'message': 'Appointment canceled successfully'}), 204
 
 
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+@bp.cli.command('prune-calendar-tombstones')
+def prune_calendar_tombstones_command():
+    click.echo(f'Deleted {prune_tombstones()} calendar tombstones')